@@ -0,0 +1,363 @@
+import asyncio
+import json
+import math
+import os
+import re
+import tarfile
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from . import models
+from .database import SessionLocal
+from .uploads import MAGIC_HEAD_SIZE, detect_type
+
+try:
+    import magic
+except ImportError:
+    magic = None
+
+ANALYSIS_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+READ_SIZE = 1024 * 1024
+MAX_ENTROPY_BLOCKS = 1024
+MIN_ENTROPY_BLOCK = 4096
+ENTROPY_SAMPLE_SIZE = 64 * 1024
+MIN_STRING_LENGTH = 6
+MAX_STRINGS = 2000
+MAX_FLAGS = 200
+MAX_ARCHIVE_MEMBERS = 5000
+MAX_TRACKED_JOBS = 1000
+
+PRINTABLE = frozenset(range(0x20, 0x7f)) | {0x09}
+STRING_PATTERN = re.compile(rb"[\x20-\x7e\t]{%d,}" % MIN_STRING_LENGTH)
+FLAG_PATTERN = re.compile(rb"[A-Za-z0-9_\-]{2,20}\{[\x21-\x7a\x7c\x7e]{3,120}\}")
+
+
+# --- Étapes d'analyse : exécutées dans le pool de processus -----------------
+
+def _read_chunks(path: str, overlap: int = 0):
+    """Lit un fichier par morceaux en conservant `overlap` octets du précédent."""
+    with open(path, "rb") as f:
+        tail = b""
+        offset = 0
+        while True:
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                break
+            yield offset - len(tail), tail + chunk, len(tail)
+            offset += len(chunk)
+            tail = chunk[-overlap:] if overlap else b""
+
+
+def analyze_magic(path: str) -> dict:
+    with open(path, "rb") as f:
+        head = f.read(MAGIC_HEAD_SIZE)
+    result = {"mime": detect_type(head)}
+    if magic is not None:
+        try:
+            result["description"] = magic.from_file(path)
+        except Exception:
+            pass
+    return result
+
+
+def _entropy(counts: Dict[int, int], total: int) -> float:
+    if not total:
+        return 0.0
+    return -sum(c / total * math.log2(c / total) for c in counts.values() if c)
+
+
+def _byte_counts(data: bytes) -> Dict[int, int]:
+    return {value: data.count(value) for value in set(data)}
+
+
+def analyze_entropy(path: str) -> dict:
+    """Entropie de Shannon par bloc, calculée sur un échantillon du début de chaque bloc.
+
+    Le nombre de blocs est borné par MAX_ENTROPY_BLOCKS et chaque échantillon
+    par ENTROPY_SAMPLE_SIZE : le coût ne dépend pas de la taille du fichier.
+    """
+    size = os.path.getsize(path)
+    block_size = max(MIN_ENTROPY_BLOCK, math.ceil(size / MAX_ENTROPY_BLOCKS))
+    totals: Dict[int, int] = {}
+    sampled = 0
+    blocks = []
+    with open(path, "rb") as f:
+        for start in range(0, size, block_size):
+            f.seek(start)
+            sample = f.read(min(block_size, ENTROPY_SAMPLE_SIZE))
+            counts = _byte_counts(sample)
+            for value, count in counts.items():
+                totals[value] = totals.get(value, 0) + count
+            sampled += len(sample)
+            blocks.append(round(_entropy(counts, len(sample)), 4))
+    return {
+        "block_size": block_size,
+        "global": round(_entropy(totals, sampled), 4),
+        "blocks": blocks,
+    }
+
+
+def _trailing_printable(data: bytes) -> int:
+    """Longueur de la suite de caractères imprimables en fin de `data`."""
+    i = len(data)
+    while i > 0 and data[i - 1] in PRINTABLE:
+        i -= 1
+    return len(data) - i
+
+
+def analyze_strings(path: str) -> dict:
+    strings = []
+    total = 0
+    offset = 0
+    carry = b""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(READ_SIZE)
+            data = carry + chunk
+            end = len(data)
+            if chunk:
+                # Une chaîne en fin de morceau peut se poursuivre dans le suivant
+                run = _trailing_printable(data)
+                if run < READ_SIZE:
+                    end -= run
+            for match in STRING_PATTERN.finditer(data, 0, end):
+                total += 1
+                if len(strings) < MAX_STRINGS:
+                    strings.append({"offset": offset + match.start(), "value": match.group().decode("ascii")})
+            offset += end
+            carry = data[end:]
+            if not chunk:
+                break
+    return {"count": total, "truncated": total > len(strings), "strings": strings}
+
+
+def analyze_flags(path: str) -> dict:
+    hits = []
+    seen = set()
+    for base, data, _ in _read_chunks(path, 256):
+        for match in FLAG_PATTERN.finditer(data):
+            offset = base + match.start()
+            if offset in seen:
+                continue
+            seen.add(offset)
+            hits.append({"offset": offset, "value": match.group().decode("ascii", "replace")})
+            if len(hits) >= MAX_FLAGS:
+                return {"hits": hits, "truncated": True}
+    return {"hits": hits, "truncated": False}
+
+
+def analyze_archive(path: str) -> Optional[dict]:
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            infos = zf.infolist()
+            members = [
+                {"name": i.filename, "size": i.file_size, "compressed_size": i.compress_size}
+                for i in infos[:MAX_ARCHIVE_MEMBERS]
+            ]
+        return {"format": "zip", "count": len(infos), "members": members}
+    try:
+        is_tar = tarfile.is_tarfile(path)
+    except Exception:
+        is_tar = False
+    if is_tar:
+        members = []
+        count = 0
+        with tarfile.open(path, "r:*") as tf:
+            for info in tf:
+                count += 1
+                if len(members) < MAX_ARCHIVE_MEMBERS:
+                    members.append({"name": info.name, "size": info.size, "type": info.type.decode()})
+        return {"format": "tar", "count": count, "members": members}
+    return None
+
+
+STAGES = {
+    "magic": analyze_magic,
+    "entropy": analyze_entropy,
+    "strings": analyze_strings,
+    "flags": analyze_flags,
+    "archive": analyze_archive,
+}
+
+
+# --- File d'attente des analyses --------------------------------------------
+
+class AnalysisJob:
+    def __init__(self, sha256: str, path: str, file_ids: List[int]):
+        self.id = uuid.uuid4().hex
+        self.sha256 = sha256
+        self.path = path
+        self.file_ids = file_ids
+        self.status = "queued"
+        self.stages = {name: "pending" for name in STAGES}
+        self.results: dict = {}
+        self.errors: Dict[str, str] = {}
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+
+    def snapshot(self) -> dict:
+        return {
+            "status": self.status,
+            "job_id": self.id,
+            "sha256": self.sha256,
+            "stages": dict(self.stages),
+            "errors": dict(self.errors),
+            **self.results,
+        }
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "sha256": self.sha256,
+            "file_ids": list(self.file_ids),
+            "status": self.status,
+            "stages": dict(self.stages),
+            "errors": dict(self.errors),
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class AnalysisQueue:
+    """Exécute les analyses de fichiers en arrière-plan sur un pool de processus.
+
+    Pendant l'analyse, l'avancement (et les résultats partiels) est lu sur le
+    job en mémoire ; les résultats ne sont écrits dans `files.analysis_results`
+    qu'une fois, à la fin, puis mis en cache sur le blob : un contenu identique
+    n'est analysé qu'une fois. Une seule écriture par analyse évite d'invalider
+    le cache des listes et d'inonder le flux /events à chaque étape.
+    """
+
+    def __init__(self, workers: int = ANALYSIS_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._jobs: "OrderedDict[str, AnalysisJob]" = OrderedDict()
+        self._running: Dict[str, AnalysisJob] = {}  # sha256 -> job en cours
+        self._tasks = set()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def get(self, job_id: str) -> Optional[AnalysisJob]:
+        return self._jobs.get(job_id)
+
+    def running(self, sha256: str) -> Optional[AnalysisJob]:
+        """Analyse en cours pour ce contenu, s'il y en a une."""
+        return self._running.get(sha256)
+
+    def _track(self, job: AnalysisJob):
+        self._jobs[job.id] = job
+        while len(self._jobs) > MAX_TRACKED_JOBS:
+            self._jobs.popitem(last=False)
+
+    async def enqueue(self, file_id: int, sha256: str, path: str, force: bool = False) -> AnalysisJob:
+        """Planifie l'analyse d'un fichier ; doit être appelé depuis la boucle d'événements."""
+        running = self._running.get(sha256)
+        if running is not None:
+            if file_id not in running.file_ids:
+                running.file_ids.append(file_id)
+            return running
+
+        job = AnalysisJob(sha256, path, [file_id])
+        self._track(job)
+        if not force:
+            cached = await asyncio.to_thread(self._cached_results, sha256)
+            if cached is not None:
+                job.status = "done"
+                job.stages = {name: "cached" for name in STAGES}
+                job.finished_at = datetime.utcnow()
+                await asyncio.to_thread(self._write_files, [file_id], {**cached, "job_id": job.id})
+                return job
+
+        self._running[sha256] = job
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: AnalysisJob):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._semaphore:
+                job.status = "running"
+                futures = {
+                    loop.run_in_executor(self.executor, func, job.path): name
+                    for name, func in STAGES.items()
+                }
+                for name in futures.values():
+                    job.stages[name] = "running"
+                pending = set(futures)
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for future in done:
+                        name = futures[future]
+                        try:
+                            job.results[name] = future.result()
+                            job.stages[name] = "done"
+                        except Exception as e:
+                            job.stages[name] = "failed"
+                            job.errors[name] = str(e)
+                job.status = "failed" if len(job.errors) == len(STAGES) else "done"
+        except Exception as e:
+            job.status = "failed"
+            job.errors["job"] = str(e)
+        finally:
+            job.finished_at = datetime.utcnow()
+            self._running.pop(job.sha256, None)
+            snapshot = job.snapshot()
+            await asyncio.to_thread(self._write_files, job.file_ids, snapshot)
+            if job.status == "done":
+                await asyncio.to_thread(self._cache_results, job.sha256, snapshot)
+
+    # Accès base de données, exécutés dans un thread
+
+    def _cached_results(self, sha256: str) -> Optional[dict]:
+        db = SessionLocal()
+        try:
+            blob = db.query(models.Blob).filter(models.Blob.sha256 == sha256).first()
+            if blob is None or not blob.analysis_results:
+                return None
+            return json.loads(blob.analysis_results)
+        finally:
+            db.close()
+
+    def _cache_results(self, sha256: str, results: dict):
+        db = SessionLocal()
+        try:
+            db.query(models.Blob).filter(models.Blob.sha256 == sha256).update(
+                {models.Blob.analysis_results: json.dumps(results)}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _write_files(self, file_ids: List[int], results: dict):
+        db = SessionLocal()
+        try:
+            # Par l'ORM plutôt qu'en masse : le flux de changements reçoit l'id de chaque fichier
+            data = json.dumps(results)
+            for db_file in db.query(models.File).filter(models.File.id.in_(file_ids)):
+                db_file.analysis_results = data
+            db.commit()
+        finally:
+            db.close()
+
+    def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+analysis_queue = AnalysisQueue()
@@ -0,0 +1,381 @@
+import asyncio
+import base64
+import gzip
+import hashlib
+import io
+import json
+import os
+import queue
+import re
+import shutil
+import tarfile
+import threading
+import time
+import zipfile
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import DateTime, LargeBinary, delete, func, select
+
+from . import models
+from .database import SessionLocal
+from .stats import rebuild
+from .storage import UPLOAD_DIR, blob_store
+from .uploads import CHUNK_SIZE
+
+ARCHIVE_FORMAT = "pwnbox-archive"
+ARCHIVE_VERSION = 1
+# Lignes par membre NDJSON : borne la mémoire utilisée par table
+ROWS_PER_MEMBER = 1000
+# Morceaux en attente entre le thread d'archivage et la réponse HTTP
+QUEUE_SIZE = 8
+GZIP_LEVEL = 6
+
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ArchiveCancelled(Exception):
+    """Le client a interrompu le transfert."""
+
+
+# --- Passerelles entre le thread d'archivage et la boucle d'événements ------
+
+class _QueueWriter(io.RawIOBase):
+    """Fichier en écriture seule qui transmet les octets par morceaux à une file bornée.
+
+    L'écriture bloque quand la file est pleine : l'archive n'avance qu'au
+    rythme où le client la lit.
+    """
+
+    def __init__(self, chunks: "queue.Queue", cancelled: threading.Event):
+        self._chunks = chunks
+        self._cancelled = cancelled
+        self._buffer = bytearray()
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self.position += len(data)
+        if len(self._buffer) >= CHUNK_SIZE:
+            self._send(bytes(self._buffer))
+            self._buffer.clear()
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def _send(self, item):
+        while True:
+            if self._cancelled.is_set():
+                raise ArchiveCancelled()
+            try:
+                self._chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def finish(self, error: Optional[BaseException] = None):
+        if error is None and self._buffer:
+            self._send(bytes(self._buffer))
+            self._buffer.clear()
+        self._send(error)
+
+
+class _QueueReader(io.RawIOBase):
+    """Fichier en lecture seule alimenté depuis la boucle d'événements."""
+
+    def __init__(self, chunks: asyncio.Queue, loop: asyncio.AbstractEventLoop):
+        self._chunks = chunks
+        self._loop = loop
+        self._pending = b""
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending and not self._eof:
+            item = asyncio.run_coroutine_threadsafe(self._chunks.get(), self._loop).result()
+            if item is None:
+                self._eof = True
+            elif isinstance(item, BaseException):
+                raise item
+            else:
+                self._pending = item
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+# --- Export ------------------------------------------------------------------
+
+class _TarSink:
+    def __init__(self, fileobj):
+        self._gzip = gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=GZIP_LEVEL)
+        self._tar = tarfile.open(fileobj=self._gzip, mode="w|", format=tarfile.PAX_FORMAT)
+
+    def add_bytes(self, name: str, data: bytes):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def add_file(self, name: str, path: str):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            info = tarfile.TarInfo(name)
+            info.size = stat.st_size
+            info.mtime = int(stat.st_mtime)
+            self._tar.addfile(info, f)
+
+    def close(self):
+        self._tar.close()
+        self._gzip.close()
+
+
+class _ZipSink:
+    def __init__(self, fileobj):
+        self._zip = zipfile.ZipFile(fileobj, mode="w", compression=zipfile.ZIP_DEFLATED)
+
+    def add_bytes(self, name: str, data: bytes):
+        self._zip.writestr(name, data)
+
+    def add_file(self, name: str, path: str):
+        # Les fichiers de challenges sont souvent déjà compressés : stockés tels quels
+        info = zipfile.ZipInfo.from_file(path, name)
+        info.compress_type = zipfile.ZIP_STORED
+        with open(path, "rb") as src, self._zip.open(info, "w", force_zip64=True) as dest:
+            shutil.copyfileobj(src, dest, CHUNK_SIZE)
+
+    def close(self):
+        self._zip.close()
+
+
+SINKS = {"tar.gz": _TarSink, "zip": _ZipSink}
+
+
+def _json_default(value):
+    # Colonnes binaires (historique des notes) en base64, le reste (dates) en texte
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    return str(value)
+
+
+def _write_archive(sink):
+    db = SessionLocal()
+    try:
+        tables = [table.name for table in models.Base.metadata.sorted_tables]
+        sink.add_bytes("manifest.json", json.dumps({
+            "format": ARCHIVE_FORMAT,
+            "version": ARCHIVE_VERSION,
+            "created_at": datetime.utcnow().isoformat(),
+            "tables": tables,
+        }).encode())
+
+        # Données : un membre NDJSON par lot de lignes
+        for table in models.Base.metadata.sorted_tables:
+            result = db.execute(
+                select(*table.columns).order_by(*table.primary_key.columns)
+                .execution_options(yield_per=ROWS_PER_MEMBER)
+            )
+            for number, rows in enumerate(result.mappings().partitions()):
+                data = "".join(
+                    json.dumps(dict(row), default=_json_default, ensure_ascii=False) + "\n" for row in rows
+                ).encode()
+                sink.add_bytes(f"db/{table.name}/{number:06d}.ndjson", data)
+
+        # Fichiers : chaque contenu du blob store une seule fois, puis l'ancien stockage
+        for (sha256,) in db.execute(select(models.Blob.sha256).order_by(models.Blob.sha256)):
+            path = blob_store.path(sha256)
+            if os.path.exists(path):
+                sink.add_file(f"files/{sha256}", path)
+        for (path,) in db.execute(
+            select(models.File.path).where(models.File.storage == "legacy").order_by(models.File.id)
+        ):
+            full_path = os.path.join(UPLOAD_DIR, path)
+            if os.path.exists(full_path):
+                sink.add_file(f"uploads/{path}", full_path)
+    finally:
+        db.close()
+    sink.close()
+
+
+async def stream_archive(archive_format: str) -> AsyncIterator[bytes]:
+    """Produit l'archive de l'instance par morceaux, sans la stocker.
+
+    L'archive est construite dans un thread dédié et transmise par une file
+    bornée : la mémoire utilisée ne dépend pas de la taille de l'instance.
+    """
+    chunks: "queue.Queue" = queue.Queue(maxsize=QUEUE_SIZE)
+    cancelled = threading.Event()
+    writer = _QueueWriter(chunks, cancelled)
+
+    def run():
+        try:
+            _write_archive(SINKS[archive_format](writer))
+            writer.finish()
+        except ArchiveCancelled:
+            pass
+        except Exception as e:
+            try:
+                writer.finish(e)
+            except ArchiveCancelled:
+                pass
+
+    threading.Thread(target=run, name="archive-export", daemon=True).start()
+    try:
+        while True:
+            item = await asyncio.to_thread(chunks.get)
+            if item is None:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        cancelled.set()
+        # Débloque une lecture encore en attente dans le thread de to_thread
+        try:
+            chunks.put_nowait(None)
+        except queue.Full:
+            pass
+
+
+# --- Import ------------------------------------------------------------------
+
+def _decode_row(table, row: dict) -> dict:
+    for column in table.columns:
+        value = row.get(column.name)
+        if isinstance(value, str) and isinstance(column.type, DateTime):
+            row[column.name] = datetime.fromisoformat(value)
+        elif isinstance(value, str) and isinstance(column.type, LargeBinary):
+            row[column.name] = base64.b64decode(value)
+    return row
+
+
+def _restore_blob(member_file, sha256: str):
+    tmp_path = blob_store.temp_path()
+    hasher = hashlib.sha256()
+    try:
+        with open(tmp_path, "wb") as out:
+            while True:
+                chunk = member_file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                out.write(chunk)
+        if hasher.hexdigest() != sha256:
+            raise HTTPException(status_code=400, detail=f"Contenu corrompu dans l'archive: files/{sha256}")
+        blob_store.place(tmp_path, sha256)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _restore_upload(member_file, relative: str):
+    destination = os.path.normpath(os.path.join(UPLOAD_DIR, relative))
+    if not relative.startswith("challenge_") or os.path.dirname(destination) == UPLOAD_DIR \
+            or os.path.commonpath([UPLOAD_DIR, destination]) != UPLOAD_DIR:
+        raise HTTPException(status_code=400, detail=f"Chemin invalide dans l'archive: uploads/{relative}")
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    with open(destination, "wb") as out:
+        shutil.copyfileobj(member_file, out, CHUNK_SIZE)
+
+
+def restore_archive(fileobj, replace: bool = False) -> dict:
+    """Restaure une archive tar.gz lue en flux (mode `r|gz`).
+
+    Les données sont insérées dans une seule transaction, validée à la fin
+    de l'archive ; sans `replace`, l'instance doit être vide.
+    """
+    tables = {table.name: table for table in models.Base.metadata.sorted_tables}
+    counts = {name: 0 for name in tables}
+    restored_files = 0
+    db = SessionLocal()
+    try:
+        if replace:
+            for table in reversed(models.Base.metadata.sorted_tables):
+                db.execute(delete(table))
+        else:
+            for table in tables.values():
+                if db.scalar(select(func.count()).select_from(table)):
+                    raise HTTPException(
+                        status_code=409,
+                        detail="L'instance contient déjà des données (utiliser replace=true pour les remplacer)"
+                    )
+
+        seen_manifest = False
+        try:
+            archive = tarfile.open(fileobj=fileobj, mode="r|gz")
+        except tarfile.TarError:
+            raise HTTPException(status_code=400, detail="Archive tar.gz invalide")
+        with archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                name = member.name
+                member_file = archive.extractfile(member)
+                if name == "manifest.json":
+                    manifest = json.load(member_file)
+                    if manifest.get("format") != ARCHIVE_FORMAT or manifest.get("version") != ARCHIVE_VERSION:
+                        raise HTTPException(status_code=400, detail="Format d'archive non reconnu")
+                    seen_manifest = True
+                elif not seen_manifest:
+                    raise HTTPException(status_code=400, detail="L'archive doit commencer par manifest.json")
+                elif name.startswith("db/"):
+                    table = tables.get(name.split("/")[1])
+                    if table is None:
+                        continue
+                    rows = [_decode_row(table, json.loads(line)) for line in member_file if line.strip()]
+                    if rows:
+                        db.execute(table.insert(), rows)
+                        counts[table.name] += len(rows)
+                elif name.startswith("files/"):
+                    sha256 = name[len("files/"):]
+                    if not SHA256_PATTERN.match(sha256):
+                        raise HTTPException(status_code=400, detail=f"Nom de fichier invalide dans l'archive: {name}")
+                    _restore_blob(member_file, sha256)
+                    restored_files += 1
+                elif name.startswith("uploads/"):
+                    _restore_upload(member_file, name[len("uploads/"):])
+                    restored_files += 1
+        if not seen_manifest:
+            raise HTTPException(status_code=400, detail="Archive vide ou sans manifest.json")
+        # Les archives antérieures aux statistiques n'ont pas de compteurs
+        rebuild(db)
+        db.commit()
+    except (tarfile.TarError, EOFError, OSError, ValueError) as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Archive invalide: {e}")
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return {"rows": counts, "files": restored_files}
+
+
+async def restore_from_stream(chunks: AsyncIterator[bytes], replace: bool = False) -> dict:
+    """Restaure une archive reçue par morceaux, sans la stocker entièrement."""
+    loop = asyncio.get_running_loop()
+    pending: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    reader = io.BufferedReader(_QueueReader(pending, loop), CHUNK_SIZE)
+
+    async def feed():
+        try:
+            async for chunk in chunks:
+                if chunk:
+                    await pending.put(chunk)
+            await pending.put(None)
+        except Exception as e:
+            await pending.put(e)
+
+    feeder = asyncio.create_task(feed())
+    try:
+        return await asyncio.to_thread(restore_archive, reader, replace)
+    finally:
+        feeder.cancel()
@@ -0,0 +1,283 @@
+"""Lecture à la demande du contenu des archives uploadées.
+
+Le listing ne lit que le répertoire central (zip) ou les en-têtes (tar) ; un
+membre est lu en flux depuis l'archive, sans rien extraire sur disque. Les
+archives imbriquées sont désignées par un chemin `externe.zip!/interne.tar!/membre`.
+"""
+import gzip
+import os
+import struct
+import tarfile
+import threading
+import zipfile
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from typing import IO, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+SEPARATOR = "!/"
+MAX_NESTING_DEPTH = 3
+MAX_INDEXED_MEMBERS = 100000
+MAX_CACHED_INDEXES = 128
+CHUNK_SIZE = 64 * 1024
+ARCHIVE_SUFFIXES = (".zip", ".jar", ".apk", ".tar", ".tgz", ".tar.gz", ".tbz2", ".tar.bz2",
+                    ".txz", ".tar.xz", ".gz")
+# Signatures reconnues mais non lisibles sans dépendance externe
+UNSUPPORTED_SIGNATURES = {b"7z\xbc\xaf\x27\x1c": "7z", b"Rar!\x1a\x07": "rar"}
+
+
+def split_path(path: str) -> List[str]:
+    """Découpe un chemin `a.zip!/b.tar!/c` ; vérifie la profondeur d'imbrication."""
+    parts = [part.strip("/") for part in (path or "").split(SEPARATOR)]
+    if any(not part for part in parts):
+        raise HTTPException(status_code=400, detail="Chemin de membre invalide")
+    if len(parts) - 1 > MAX_NESTING_DEPTH:
+        raise HTTPException(status_code=400, detail=f"Imbrication limitée à {MAX_NESTING_DEPTH} niveaux")
+    return parts
+
+
+def _is_archive_name(name: str) -> bool:
+    return name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _timestamp(value) -> Optional[datetime]:
+    try:
+        return datetime(*value) if isinstance(value, tuple) else datetime.utcfromtimestamp(value)
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+def _member(name: str, size: Optional[int], compressed_size: Optional[int], is_dir: bool, modified) -> dict:
+    return {
+        "name": name,
+        "size": size,
+        "compressed_size": compressed_size,
+        "is_dir": is_dir,
+        "is_archive": not is_dir and _is_archive_name(name),
+        "modified": _timestamp(modified) if modified is not None else None,
+    }
+
+
+class ZipArchive:
+    format = "zip"
+
+    def __init__(self, fileobj: IO[bytes], name: str):
+        self.zf = zipfile.ZipFile(fileobj)
+
+    def members(self) -> Iterator[dict]:
+        for info in self.zf.infolist():
+            yield _member(info.filename.rstrip("/"), info.file_size, info.compress_size,
+                          info.is_dir(), info.date_time)
+
+    def open(self, name: str) -> IO[bytes]:
+        try:
+            info = self.zf.getinfo(name)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Membre {name} non trouvé dans l'archive")
+        if info.is_dir():
+            raise HTTPException(status_code=400, detail=f"{name} est un dossier")
+        if info.flag_bits & 0x1:
+            raise HTTPException(status_code=400, detail=f"Le membre {name} est chiffré")
+        try:
+            return self.zf.open(info)
+        except NotImplementedError as e:
+            raise HTTPException(status_code=415, detail=f"Compression non prise en charge: {e}")
+
+    def close(self):
+        self.zf.close()
+
+
+class TarArchive:
+    format = "tar"
+
+    def __init__(self, fileobj: IO[bytes], name: str):
+        self.tf = tarfile.open(fileobj=fileobj, mode="r:*")
+
+    def members(self) -> Iterator[dict]:
+        # Itérer plutôt que getmembers() : les en-têtes sont lus au fur et à mesure
+        for info in self.tf:
+            yield _member(info.name.rstrip("/"), info.size if info.isfile() else None,
+                          None, info.isdir(), info.mtime)
+
+    def open(self, name: str) -> IO[bytes]:
+        try:
+            info = self.tf.getmember(name)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Membre {name} non trouvé dans l'archive")
+        fileobj = self.tf.extractfile(info) if info.isfile() else None
+        if fileobj is None:
+            raise HTTPException(status_code=400, detail=f"{name} n'est pas un fichier")
+        return fileobj
+
+    def close(self):
+        self.tf.close()
+
+
+class GzipArchive:
+    """Fichier .gz simple : un seul membre, le contenu décompressé."""
+    format = "gzip"
+
+    def __init__(self, fileobj: IO[bytes], name: str):
+        self.fileobj = fileobj
+        self.name = self._original_name(fileobj) or self._strip_suffix(os.path.basename(name))
+
+    @staticmethod
+    def _strip_suffix(name: str) -> str:
+        return name[:-3] if name.lower().endswith(".gz") else name + ".out"
+
+    @staticmethod
+    def _original_name(fileobj: IO[bytes]) -> Optional[str]:
+        # En-tête gzip (RFC 1952) : champ FNAME optionnel après les 10 premiers octets
+        fileobj.seek(0)
+        header = fileobj.read(10)
+        flags = header[3]
+        if flags & 0x04:  # FEXTRA
+            length, = struct.unpack("<H", fileobj.read(2))
+            fileobj.read(length)
+        if not flags & 0x08:  # FNAME
+            return None
+        raw = bytearray()
+        while len(raw) < 1024:
+            byte = fileobj.read(1)
+            if not byte or byte == b"\0":
+                break
+            raw += byte
+        return os.path.basename(raw.decode("latin-1")) or None
+
+    def members(self) -> Iterator[dict]:
+        # ISIZE, dans les 4 derniers octets, donne la taille décompressée (modulo 2^32)
+        compressed_size = self.fileobj.seek(0, os.SEEK_END)
+        self.fileobj.seek(-4, os.SEEK_END)
+        size, = struct.unpack("<I", self.fileobj.read(4))
+        yield _member(self.name, size, compressed_size, False, None)
+
+    def open(self, name: str) -> IO[bytes]:
+        if name != self.name:
+            raise HTTPException(status_code=404, detail=f"Membre {name} non trouvé dans l'archive")
+        self.fileobj.seek(0)
+        return gzip.GzipFile(fileobj=self.fileobj, mode="rb")
+
+    def close(self):
+        pass
+
+
+def open_archive(fileobj: IO[bytes], name: str):
+    """Ouvre une archive d'après son contenu (et non son extension)."""
+    fileobj.seek(0)
+    head = fileobj.read(8)
+    fileobj.seek(0)
+    if zipfile.is_zipfile(fileobj):
+        return ZipArchive(fileobj, name)
+    fileobj.seek(0)
+    try:
+        return TarArchive(fileobj, name)
+    except tarfile.TarError:
+        pass
+    if head.startswith(b"\x1f\x8b"):
+        return GzipArchive(fileobj, name)
+    for signature, archive_format in UNSUPPORTED_SIGNATURES.items():
+        if head.startswith(signature):
+            raise HTTPException(status_code=415, detail=f"Format {archive_format} non pris en charge")
+    raise HTTPException(status_code=415, detail=f"{name} n'est pas une archive lisible")
+
+
+@contextmanager
+def open_nested(path: str, name: str, parts: List[str]):
+    """Ouvre le fichier désigné par `parts` dans l'archive `path`, de proche en proche.
+
+    Chaque niveau est lu en flux depuis le précédent ; rien n'est écrit sur disque.
+    Retourne un objet fichier et son nom.
+    """
+    with ExitStack() as stack:
+        fileobj = stack.enter_context(open(path, "rb"))
+        for part in parts:
+            archive = open_archive(fileobj, name)
+            stack.callback(archive.close)
+            fileobj = stack.enter_context(archive.open(part))
+            name = part
+        yield fileobj, name
+
+
+class IndexCache:
+    """Index des membres par (contenu, chemin de l'archive imbriquée), en LRU."""
+
+    def __init__(self, max_entries: int = MAX_CACHED_INDEXES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[dict]:
+        with self._lock:
+            index = self._entries.get(key)
+            if index is not None:
+                self._entries.move_to_end(key)
+            return index
+
+    def put(self, key: Tuple[str, str], index: dict):
+        with self._lock:
+            self._entries[key] = index
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+index_cache = IndexCache()
+
+
+def get_index(path: str, name: str, content_key: str, archive_path: str = "") -> dict:
+    """Retourne l'index (format, membres) d'une archive, éventuellement imbriquée.
+
+    Exécuté dans un thread : l'ouverture d'une archive imbriquée compressée
+    peut demander de décompresser l'archive qui la contient.
+    """
+    parts = split_path(archive_path) if archive_path else []
+    key = (content_key, SEPARATOR.join(parts))
+    index = index_cache.get(key)
+    if index is not None:
+        return index
+
+    try:
+        with open_nested(path, name, parts) as (fileobj, inner_name):
+            archive = open_archive(fileobj, inner_name)
+            try:
+                members = {}
+                truncated = False
+                for member in archive.members():
+                    if len(members) >= MAX_INDEXED_MEMBERS:
+                        truncated = True
+                        break
+                    members[member["name"]] = member
+            finally:
+                archive.close()
+    except HTTPException:
+        raise
+    except (zipfile.BadZipFile, tarfile.TarError, OSError, EOFError, struct.error) as e:
+        raise HTTPException(status_code=422, detail=f"Archive illisible: {e}")
+
+    index = {"format": archive.format, "members": members, "truncated": truncated}
+    index_cache.put(key, index)
+    return index
+
+
+def find_member(path: str, name: str, content_key: str, member_path: str) -> Tuple[str, dict]:
+    """Vérifie qu'un membre existe (via l'index) ; retourne le format de l'archive et le membre."""
+    parts = split_path(member_path)
+    index = get_index(path, name, content_key, SEPARATOR.join(parts[:-1]))
+    member = index["members"].get(parts[-1])
+    if member is None:
+        raise HTTPException(status_code=404, detail=f"Membre {parts[-1]} non trouvé dans l'archive")
+    if member["is_dir"]:
+        raise HTTPException(status_code=400, detail=f"{parts[-1]} est un dossier")
+    return index["format"], member
+
+
+def iter_member(path: str, name: str, member_path: str) -> Iterator[bytes]:
+    """Contenu d'un membre, par morceaux (générateur synchrone, lu dans un thread)."""
+    with open_nested(path, name, split_path(member_path)) as (fileobj, _):
+        while True:
+            chunk = fileobj.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from typing import List, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+
+# Les fichiers orphelins plus récents que ce délai peuvent appartenir à un
+# upload dont la transaction n'est pas encore validée
+ORPHAN_GRACE_SECONDS = 3600
+
+
+class BlobStore:
+    """Stockage adressé par contenu des fichiers de challenges.
+
+    Chaque contenu est stocké une seule fois sous `ab/cd/<sha256>` et la
+    table `blobs` compte le nombre de références. Les blobs qui ne sont plus
+    référencés sont supprimés par `gc`.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.tmp_dir = os.path.join(root, ".tmp")
+        # Protège la vérification « le fichier existe-t-il ? » contre le GC
+        self._lock = threading.Lock()
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def temp_path(self) -> str:
+        """Chemin temporaire pour écrire un upload avant de connaître son hash."""
+        return os.path.join(self.tmp_dir, uuid.uuid4().hex)
+
+    def _touch(self, path: str):
+        # Un blob réutilisé redevient « récent » et échappe au GC en cours
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    async def get(self, db: AsyncSession, sha256: str):
+        return await db.get(models.Blob, sha256)
+
+    def place(self, tmp_path: str, sha256: str):
+        """Déplace un fichier temporaire à l'emplacement de son contenu, sans toucher aux références."""
+        destination = self.path(sha256)
+        with self._lock:
+            if os.path.exists(destination):
+                os.remove(tmp_path)
+                self._touch(destination)
+            else:
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                os.replace(tmp_path, destination)
+
+    async def store(self, db: AsyncSession, tmp_path: str, sha256: str, size: int, detected_type: str = None):
+        """Place un fichier temporaire dans le store et ajoute une référence.
+
+        Si le contenu est déjà connu, le fichier temporaire est simplement
+        supprimé. La référence n'est effective qu'au commit de `db`.
+        """
+        await asyncio.to_thread(self.place, tmp_path, sha256)
+        await db.execute(
+            insert(models.Blob)
+            .values(sha256=sha256, size=size, detected_type=detected_type, refcount=1)
+            .on_conflict_do_update(
+                index_elements=[models.Blob.sha256],
+                set_={"refcount": models.Blob.refcount + 1}
+            )
+        )
+
+    async def incref(self, db: AsyncSession, sha256: str) -> bool:
+        """Ajoute une référence à un blob existant. Retourne False s'il est inconnu."""
+        result = await db.execute(
+            update(models.Blob).where(models.Blob.sha256 == sha256)
+            .values(refcount=models.Blob.refcount + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            with self._lock:
+                self._touch(self.path(sha256))
+        return result.rowcount > 0
+
+    async def decref(self, db: AsyncSession, sha256: str, count: int = 1):
+        """Retire des références ; le fichier n'est supprimé que par `gc`."""
+        await db.execute(
+            update(models.Blob).where(models.Blob.sha256 == sha256)
+            .values(refcount=models.Blob.refcount - count)
+            .execution_options(synchronize_session=False)
+        )
+
+    def _orphans(self, known: set, cutoff: float) -> List[str]:
+        """Fichiers du store absents de la table `blobs` et plus anciens que `cutoff`."""
+        orphans = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self.root:
+                dirnames[:] = [d for d in dirnames if d != ".tmp"]
+            for name in filenames:
+                if name in known:
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    if os.stat(path).st_mtime <= cutoff:
+                        orphans.append(path)
+                except FileNotFoundError:
+                    continue
+        return orphans
+
+    def _remove_orphans(self, paths: List[str], cutoff: float) -> Tuple[int, int]:
+        removed = 0
+        freed = 0
+        for path in paths:
+            with self._lock:
+                # Un upload a pu réutiliser le fichier entre-temps (il est alors « touché »)
+                try:
+                    stat = os.stat(path)
+                    if stat.st_mtime > cutoff:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+            removed += 1
+            freed += stat.st_size
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+        return removed, freed
+
+    async def gc(self, db: AsyncSession) -> dict:
+        """Supprime les blobs sans référence et les fichiers orphelins sur le disque.
+
+        Le parcours du disque et les suppressions s'exécutent dans un thread.
+        """
+        await db.execute(
+            delete(models.Blob).where(models.Blob.refcount <= 0)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+        known = set((await db.scalars(select(models.Blob.sha256))).all())
+        cutoff = time.time() - ORPHAN_GRACE_SECONDS
+        orphans = await asyncio.to_thread(self._orphans, known, cutoff)
+        if orphans:
+            # Un upload a pu recréer la référence pendant le parcours
+            names = [os.path.basename(path) for path in orphans]
+            referenced = set()
+            for start in range(0, len(names), 500):
+                referenced.update((await db.scalars(
+                    select(models.Blob.sha256).where(models.Blob.sha256.in_(names[start:start + 500]))
+                )).all())
+            orphans = [path for path in orphans if os.path.basename(path) not in referenced]
+        removed, freed = await asyncio.to_thread(self._remove_orphans, orphans, cutoff)
+        return {"removed": removed, "freed_bytes": freed}
@@ -0,0 +1,119 @@
+import os
+import sys
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Ligne modifiée : (table, id, opération) ; id None pour une écriture en masse
+RowChange = Tuple[str, Optional[int], str]
+
+# Fonctions appelées après chaque commit avec l'ensemble des tables modifiées
+_listeners: List[Callable[[Set[str]], None]] = []
+# Fonctions appelées après chaque commit avec les lignes modifiées
+_row_listeners: List[Callable[[List[RowChange]], None]] = []
+# Version de chaque table, incrémentée à chaque commit qui la modifie
+_versions: Dict[str, int] = {}
+_versions_lock = threading.Lock()
+
+
+def worker_count(argv: List[str] = sys.argv) -> int:
+    """Nombre de processus qui servent l'application (`--workers` / `-w`, sinon WEB_CONCURRENCY)."""
+    count = os.getenv("WEB_CONCURRENCY", "1")
+    for index, arg in enumerate(argv):
+        if arg in ("--workers", "-w") and index + 1 < len(argv):
+            count = argv[index + 1]
+        elif arg.startswith("--workers="):
+            count = arg.split("=", 1)[1]
+    try:
+        return int(count)
+    except ValueError:
+        return 1
+
+
+# Les versions ne voient que les commits du processus courant : avec plusieurs
+# workers, les caches qui en dépendent resteraient périmés et sont désactivés
+SINGLE_PROCESS = worker_count() <= 1
+
+
+def on_tables_committed(listener: Callable[[Set[str]], None]):
+    """Enregistre une fonction appelée après un commit qui a modifié des tables."""
+    _listeners.append(listener)
+    return listener
+
+
+def on_rows_committed(listener: Callable[[List[RowChange]], None]):
+    """Enregistre une fonction appelée après un commit avec les lignes modifiées."""
+    _row_listeners.append(listener)
+    return listener
+
+
+def table_versions(*tables: str) -> Tuple[int, ...]:
+    """Versions courantes des tables : changent dès qu'un commit les modifie."""
+    with _versions_lock:
+        return tuple(_versions.get(table, 0) for table in tables)
+
+
+def mark_changed(session: Session, *tables: str, op: str = "update"):
+    """Signale des tables modifiées par du SQL brut, invisible pour l'ORM."""
+    session.info.setdefault("changed_tables", set()).update(tables)
+    rows = session.info.setdefault("changed_rows", {})
+    for table in tables:
+        rows[(table, None)] = op
+
+
+def _record_row(session: Session, table: str, row_id, op: str):
+    rows = session.info.setdefault("changed_rows", {})
+    previous = rows.get((table, row_id))
+    if previous == "insert" and op == "delete":
+        del rows[(table, row_id)]  # Créée puis supprimée dans la même transaction
+    elif previous != "insert":
+        rows[(table, row_id)] = op
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed(session, flush_context):
+    changed = session.info.setdefault("changed_tables", set())
+    for objects, op in ((session.new, "insert"), (session.dirty, "update"), (session.deleted, "delete")):
+        for obj in list(objects):
+            table = getattr(obj, "__tablename__", None)
+            if not table:
+                continue
+            if op == "update" and not session.is_modified(obj, include_collections=False):
+                continue
+            changed.add(table)
+            _record_row(session, table, getattr(obj, "id", None), op)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk(orm_execute_state):
+    # Insertions, mises à jour et suppressions en masse (query.update/delete, insert())
+    for op in ("insert", "update", "delete"):
+        if getattr(orm_execute_state, f"is_{op}"):
+            table = getattr(orm_execute_state.statement, "table", None)
+            if table is not None:
+                mark_changed(orm_execute_state.session, table.name, op=op)
+
+
+@event.listens_for(Session, "after_commit")
+def _notify(session):
+    changed = session.info.pop("changed_tables", None)
+    rows = session.info.pop("changed_rows", None)
+    if not changed:
+        return
+    with _versions_lock:
+        for table in changed:
+            _versions[table] = _versions.get(table, 0) + 1
+    for listener in _listeners:
+        listener(changed)
+    if rows:
+        row_changes = [(table, row_id, op) for (table, row_id), op in rows.items()]
+        for row_listener in _row_listeners:
+            row_listener(row_changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop("changed_tables", None)
+    session.info.pop("changed_rows", None)
@@ -0,0 +1,280 @@
+import hashlib
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.types import Text, TypeDecorator
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Réponses plus petites envoyées telles quelles : la compression n'y gagne rien
+MIN_SIZE = int(os.getenv("PWNBOX_COMPRESSION_MIN_SIZE", "1024"))
+# Notes dont le contenu dépasse cette taille stockées compressées (0 : désactivé)
+NOTE_COMPRESSION_MIN_SIZE = int(os.getenv("PWNBOX_NOTE_COMPRESSION_MIN_SIZE", "0"))
+COMPRESSIBLE_TYPES = (b"application/json", b"application/x-ndjson", b"application/javascript",
+                      b"application/xml", b"image/svg+xml", b"text/")
+# Flux qui doivent arriver au client sans tampon
+EXCLUDED_TYPES = (b"text/event-stream",)
+MAX_CACHED_BODIES = 256
+
+
+# --- Compression des réponses HTTP ------------------------------------------
+
+class GzipEncoder:
+    def __init__(self):
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=5)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# Encodages disponibles, par ordre de préférence du serveur
+ENCODERS: Dict[str, type] = {}
+if zstandard is not None:
+    ENCODERS["zstd"] = ZstdEncoder
+if brotli is not None:
+    ENCODERS["br"] = BrotliEncoder
+ENCODERS["gzip"] = GzipEncoder
+
+
+def negotiate(accept_encoding: Optional[bytes], encoders: Dict[str, type] = ENCODERS) -> Optional[str]:
+    """Choisit l'encodage d'après `Accept-Encoding` (valeurs q comprises)."""
+    if not accept_encoding:
+        return None
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.decode("latin-1").split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        accepted[name.strip().lower()] = quality
+    wildcard = accepted.get("*", 0)
+    for name in encoders:
+        if accepted.get(name, wildcard) > 0:
+            return name
+    return None
+
+
+def compress(encoding: str, body: bytes) -> bytes:
+    encoder = ENCODERS[encoding]()
+    return encoder.compress(body) + encoder.finish()
+
+
+class CompressedBodies:
+    """Corps déjà compressés, par (empreinte du corps, encodage) : une liste servie
+    par le cache de réponses n'est compressée qu'une fois par version.
+
+    La clé est le contenu lui-même et non l'ETag : un même ETag peut désigner
+    des corps différents selon l'URL (version de ligne, par exemple)."""
+
+    def __init__(self, max_entries: int = MAX_CACHED_BODIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[bytes, str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[bytes, str]) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key: Tuple[bytes, str], body: bytes):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+compressed_bodies = CompressedBodies()
+
+
+def _is_compressible(status: int, headers: List[Tuple[bytes, bytes]]) -> bool:
+    if status in (204, 206, 304) or status < 200:
+        return False
+    values = {name.lower(): value for name, value in headers}
+    # Déjà encodé, ou téléchargement de fichier (les Range portent sur les octets d'origine)
+    if b"content-encoding" in values or b"accept-ranges" in values:
+        return False
+    content_type = values.get(b"content-type", b"").lower()
+    if content_type.startswith(EXCLUDED_TYPES):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """Middleware ASGI qui compresse les réponses (zstd, brotli ou gzip).
+
+    L'encodage est négocié avec `Accept-Encoding` ; brotli et zstd ne sont
+    proposés que si leurs bibliothèques sont installées. Une réponse en un
+    seul morceau n'est compressée qu'au-delà de MIN_SIZE ; une réponse en
+    flux est compressée morceau par morceau. L'ETag devient faible, le
+    contenu envoyé n'étant plus octet pour octet celui de la ressource.
+    """
+
+    def __init__(self, app, min_size: int = MIN_SIZE, bodies: CompressedBodies = compressed_bodies):
+        self.app = app
+        self.min_size = min_size
+        self.bodies = bodies
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(dict(scope["headers"]).get(b"accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: dict = {}
+        encoder = None
+        passthrough = False
+
+        async def compress_send(message):
+            nonlocal encoder, passthrough
+            if message["type"] == "http.response.start":
+                start.update(message)
+                passthrough = not _is_compressible(message["status"], message.get("headers", []))
+                if passthrough:
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None and not more_body:
+                # Réponse complète en un seul message
+                if len(body) < self.min_size:
+                    await send(start)
+                    await send(message)
+                    return
+                # Seules les réponses versionnées (avec ETag) reviennent à l'identique
+                key = None
+                if self._header(start, b"etag"):
+                    key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+                compressed = self.bodies.get(key) if key else None
+                if compressed is None:
+                    compressed = compress(encoding, body)
+                    if key:
+                        self.bodies.put(key, compressed)
+                await send(self._compressed_start(start, encoding, len(compressed)))
+                await send({"type": "http.response.body", "body": compressed})
+                return
+
+            if encoder is None:
+                encoder = ENCODERS[encoding]()
+                await send(self._compressed_start(start, encoding, None))
+            data = encoder.compress(body)
+            data += encoder.flush() if more_body else encoder.finish()
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, compress_send)
+
+    @staticmethod
+    def _header(start: dict, name: bytes) -> Optional[bytes]:
+        for key, value in start.get("headers", []):
+            if key.lower() == name:
+                return value
+        return None
+
+    @staticmethod
+    def _compressed_start(start: dict, encoding: str, length: Optional[int]) -> dict:
+        headers = []
+        vary = b"accept-encoding"
+        for name, value in start.get("headers", []):
+            lower = name.lower()
+            if lower == b"content-length":
+                continue
+            if lower == b"vary":
+                vary = value + b", accept-encoding"
+                continue
+            if lower == b"etag" and not value.startswith(b"W/"):
+                value = b"W/" + value
+            headers.append((name, value))
+        headers += [(b"content-encoding", encoding.encode()), (b"vary", vary)]
+        if length is not None:
+            headers.append((b"content-length", str(length).encode()))
+        return {**start, "headers": headers}
+
+
+# --- Compression du contenu des notes en base --------------------------------
+
+def inflate(value):
+    """Contenu d'une note tel que stocké -> texte. Aussi enregistrée comme fonction SQL
+    (`inflate`), utilisée par l'index de recherche."""
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode("utf-8")
+    return value
+
+
+class CompressedText(TypeDecorator):
+    """Texte stocké compressé (zlib, en BLOB) au-delà d'une taille donnée.
+
+    Les valeurs plus courtes restent du TEXT : une base peut contenir les deux
+    formes, et désactiver la compression ne demande aucune migration.
+    """
+    impl = Text
+    cache_ok = True
+
+    def __init__(self, min_size: int = NOTE_COMPRESSION_MIN_SIZE, *args, **kwargs):
+        self.min_size = min_size
+        super().__init__(*args, **kwargs)
+
+    def process_bind_param(self, value, dialect):
+        if value is None or not self.min_size or len(value) < self.min_size:
+            return value
+        return zlib.compress(value.encode("utf-8"), 6)
+
+    def process_result_value(self, value, dialect):
+        return inflate(value)
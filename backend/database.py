@@ -1,19 +1,139 @@
-from sqlalchemy import create_engine
+import os
+import uuid
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from .compression import inflate
+
+# URL de la base, configurable pour la production et les tests. Les bases en
+# mémoire ("sqlite:///:memory:" ou "sqlite:///file:pwnbox?mode=memory&cache=shared&uri=true",
+# toujours partagées entre connexions) sont destinées aux tests : SQLite y
+# verrouille par table, sans attendre busy_timeout.
+SQLALCHEMY_DATABASE_URL = os.getenv("PWNBOX_DATABASE_URL", "sqlite:///./pwnbox.db")
+
+# Réglages du pool de connexions
+POOL_SIZE = int(os.getenv("PWNBOX_DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("PWNBOX_DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = int(os.getenv("PWNBOX_DB_POOL_TIMEOUT", "30"))
+
+# Pragmas SQLite appliqués à chaque nouvelle connexion
+BUSY_TIMEOUT_MS = int(os.getenv("PWNBOX_SQLITE_BUSY_TIMEOUT", "5000"))
+MMAP_SIZE = int(os.getenv("PWNBOX_SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+CACHE_SIZE_KB = int(os.getenv("PWNBOX_SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+
+
+def is_memory_database(url) -> bool:
+    """Vrai pour une base SQLite en mémoire, privée ou partagée (cache=shared)."""
+    url = make_url(url)
+    database = url.database or ""
+    return database in ("", ":memory:") or url.query.get("mode") == "memory"
+
+
+def shared_memory_url(url):
+    """Remplace une base privée `:memory:` par une base en mémoire partagée.
+
+    Le moteur synchrone (démarrage, threads) et le moteur asynchrone (routes)
+    doivent voir la même base ; une base `:memory:` est propre à une connexion.
+    """
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite" or (url.database or "") not in ("", ":memory:"):
+        return url
+    return url.set(
+        database=f"file:pwnbox-{uuid.uuid4().hex}",
+        query={"mode": "memory", "cache": "shared", "uri": "true"}
+    )
+
+
+def async_url(url):
+    """URL équivalente pour le pilote asynchrone (aiosqlite pour SQLite)."""
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    return url
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./pwnbox.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+def engine_options(url, asynchronous: bool = False) -> dict:
+    """Options de `create_engine` adaptées au type de base."""
+    url = make_url(url)
+    pool = {"pool_size": POOL_SIZE, "max_overflow": MAX_OVERFLOW, "pool_timeout": POOL_TIMEOUT}
+    if url.get_backend_name() != "sqlite":
+        return pool
+    # Fichier ou base en mémoire partagée (cache=shared) : pool dimensionné,
+    # les connexions ouvertes gardent la base partagée en vie
+    return {
+        "connect_args": {"check_same_thread": False, "timeout": BUSY_TIMEOUT_MS / 1000},
+        "poolclass": AsyncAdaptedQueuePool if asynchronous else QueuePool,
+        **pool,
+    }
+
+
+def configure_sqlite(engine, memory: bool = False):
+    """Applique les pragmas de performance à chaque connexion SQLite.
+
+    WAL permet aux lectures de se poursuivre pendant une écriture ;
+    `synchronous=NORMAL` reste sûr en WAL et évite un fsync par commit ;
+    `busy_timeout` fait attendre un écrivain au lieu d'échouer avec
+    "database is locked".
+    """
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            if not memory:
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA synchronous=NORMAL")
+                cursor.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+            cursor.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            cursor.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+        finally:
+            cursor.close()
+        # Décompression des notes, utilisée par l'index de recherche
+        dbapi_connection.create_function("inflate", 1, inflate, deterministic=True)
+
+
+DATABASE_URL = shared_memory_url(SQLALCHEMY_DATABASE_URL)
+MEMORY_DATABASE = is_memory_database(DATABASE_URL)
+
+# Moteur synchrone : migrations au démarrage et threads d'arrière-plan
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+# Moteur asynchrone : utilisé par les routes, ne bloque pas la boucle d'événements
+async_engine = create_async_engine(async_url(DATABASE_URL), **engine_options(DATABASE_URL, asynchronous=True))
+if engine.dialect.name == "sqlite":
+    configure_sqlite(engine, memory=MEMORY_DATABASE)
+    configure_sqlite(async_engine.sync_engine, memory=MEMORY_DATABASE)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Les objets restent utilisables après le commit : pas de rechargement implicite
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
-def get_db():
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+async def serialize(db: AsyncSession, schema, obj):
+    """Valide des objets ORM avec un schéma Pydantic dans le contexte de la session.
+
+    La validation s'exécute via `run_sync` : les relations paresseuses
+    (enfants des notes, sous-dossiers) peuvent y être chargées sans bloquer
+    la boucle d'événements.
+    """
+    def validate(_):
+        if isinstance(obj, list):
+            return [schema.model_validate(item) for item in obj]
+        return schema.model_validate(obj)
+    return await db.run_sync(validate)
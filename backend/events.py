@@ -0,0 +1,129 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+
+from .changes import RowChange, on_rows_committed
+
+# Tables publiées sur le flux de changements
+PUBLISHED_TABLES = ("tools", "challenges", "files", "notes", "folders")
+# Événements conservés pour les clients qui reprennent après une déconnexion
+EVENT_BUFFER_SIZE = int(os.getenv("PWNBOX_EVENT_BUFFER_SIZE", "10000"))
+KEEPALIVE_INTERVAL = 15
+
+
+class EventBus:
+    """Diffuse les changements validés en base aux clients connectés.
+
+    Chaque événement reçoit une version croissante. Les derniers événements
+    sont conservés en mémoire : un client qui revient avec la dernière version
+    reçue obtient ce qu'il a manqué, ou un `reset` (recharger les listes) si
+    elle est sortie du tampon. Les versions partent de l'heure de démarrage
+    (en microsecondes) : après un redémarrage, une ancienne version est
+    toujours plus petite que le début du tampon et conduit à un `reset`.
+
+    Les commits peuvent avoir lieu dans des threads : la publication est
+    protégée par un verrou et réveille la boucle d'événements à distance.
+    """
+
+    def __init__(self, size: int = EVENT_BUFFER_SIZE):
+        self._events: "deque[dict]" = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._version = time.time_ns() // 1000
+        self._first_version = self._version + 1  # Plus ancienne version encore disponible
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._changed: Optional[asyncio.Event] = None
+        self.closed = False
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def publish(self, changes: Iterable[RowChange]):
+        with self._lock:
+            published = False
+            for table, row_id, op in changes:
+                if table not in PUBLISHED_TABLES:
+                    continue
+                self._version += 1
+                if len(self._events) == self._events.maxlen:
+                    self._first_version = self._events[0]["version"] + 1
+                self._events.append({"version": self._version, "table": table, "id": row_id, "op": op})
+                published = True
+        if published:
+            self._wake()
+
+    def since(self, version: int) -> Tuple[bool, List[dict]]:
+        """Événements postérieurs à `version` ; faux si certains ont été perdus."""
+        with self._lock:
+            if version + 1 < self._first_version or version > self._version:
+                return False, []
+            # Les versions sont contiguës : position directe dans le tampon
+            start = version + 1 - (self._version - len(self._events) + 1)
+            return True, list(self._events)[max(start, 0):]
+
+    def _wake(self):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._set_changed()
+        else:
+            loop.call_soon_threadsafe(self._set_changed)
+
+    def _set_changed(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        if changed is not None:
+            changed.set()
+
+    def waiter(self) -> asyncio.Event:
+        """Événement levé à la prochaine publication ; à prendre avant de lire le tampon."""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        return self._changed
+
+    def close(self):
+        """Termine les flux en cours (arrêt du serveur)."""
+        self.closed = True
+        self._wake()
+
+
+event_bus = EventBus()
+on_rows_committed(event_bus.publish)
+
+
+def _format(name: str, data: dict, event_id: Optional[int] = None) -> bytes:
+    lines = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{lines}event: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+async def stream_events(version: Optional[int], tables: Optional[set], bus: EventBus = event_bus) -> AsyncIterator[bytes]:
+    """Flux SSE des changements, à partir de `version` (exclue) ou de maintenant."""
+    if version is None:
+        version = bus.version
+    yield _format("ready", {"version": bus.version})
+    while not bus.closed:
+        waiter = bus.waiter()
+        complete, events = bus.since(version)
+        if not complete:
+            # Trop ancien (ou serveur redémarré) : le client doit tout recharger
+            version = bus.version
+            yield _format("reset", {"version": version}, version)
+            continue
+        for event in events:
+            version = event["version"]
+            if tables is None or event["table"] in tables:
+                yield _format("change", event, version)
+        try:
+            await asyncio.wait_for(waiter.wait(), KEEPALIVE_INTERVAL)
+        except asyncio.TimeoutError:
+            yield b": keepalive\n\n"
@@ -0,0 +1,44 @@
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+LOG_LEVEL = os.getenv("PWNBOX_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging(level: str = LOG_LEVEL):
+    """Configure les logs de l'application (`backend.*`).
+
+    Les requêtes ne font que déposer les enregistrements dans une file ;
+    l'écriture sur la sortie d'erreur se fait dans le thread du
+    QueueListener. Sous le niveau configuré (PWNBOX_LOG_LEVEL), un appel
+    de log s'arrête au test de niveau : les messages utilisent le
+    formatage paresseux `%` et ne sont jamais construits.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+
+    logger = logging.getLogger("backend")
+    logger.setLevel(getattr(logging, level, logging.INFO))
+    logger.addHandler(QueueHandler(log_queue))
+    logger.propagate = False
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Vide la file et arrête le thread d'écriture des logs."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
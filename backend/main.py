@@ -1,18 +1,55 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from typing import List
 from pydantic import BaseModel
 import uvicorn
 from . import models
-from .database import engine
-from .routes import tools, challenges, notes, folders
+from .database import engine, async_engine
+from .migrations import upgrade, migrate_resource_files, migrate_challenge_stats
+from .search import setup_search
+from .routes import tools, challenges, notes, folders, analysis, search, bulk, archive, stats, runs, events
+from .analysis import analysis_queue
+from .runner import tool_runner
+from .events import event_bus
+from .logging_config import setup_logging, stop_logging
+from .metrics import MetricsMiddleware, registry, CONTENT_TYPE
+from .response_cache import ResponseCacheMiddleware
+from .compression import CompressionMiddleware
+from .responses import CompactJSONResponse
+from contextlib import asynccontextmanager
+import logging
+
+setup_logging()
+logger = logging.getLogger(__name__)
 
 # Créer les tables dans la base de données si elles n'existent pas déjà
-print("Vérification de la structure de la base de données...")
-models.Base.metadata.create_all(bind=engine)
-print("Base de données initialisée avec succès!")
+logger.info("Vérification de la structure de la base de données...")
+upgrade(engine, models.Base.metadata)
+migrate_resource_files(engine)
+migrate_challenge_stats(engine)
+setup_search(engine)
+logger.info("Base de données initialisée avec succès!")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Arrêter les pools d'analyse des fichiers et d'exécution des outils
+    analysis_queue.shutdown()
+    tool_runner.shutdown()
+    # Terminer les flux de changements ouverts
+    event_bus.close()
+    await async_engine.dispose()
+    stop_logging()
+
+# JSON compact par défaut ; les routes avec un modèle de réponse sont sérialisées par Pydantic
+app = FastAPI(title="PwnBox - CTF Training Platform", lifespan=lifespan, default_response_class=CompactJSONResponse)
 
-app = FastAPI(title="PwnBox - CTF Training Platform")
+# Cache des listes GET, placé sous CORS pour que les en-têtes d'origine restent corrects
+app.add_middleware(ResponseCacheMiddleware)
+
+# Compression négociée, au-dessus du cache : un corps en cache n'est compressé qu'une fois
+app.add_middleware(CompressionMiddleware)
 
 # Configuration CORS
 app.add_middleware(
@@ -21,13 +58,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Permet toutes les méthodes
     allow_headers=["*"],  # Permet tous les headers
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "ETag"],  # En-têtes de pagination et de cache
 )
 
+# Mesures par route, exposées sur /metrics
+app.add_middleware(MetricsMiddleware)
+
 # Inclure les routes
 app.include_router(tools.router)
 app.include_router(challenges.router)
 app.include_router(notes.router)
 app.include_router(folders.router)
+app.include_router(analysis.router)
+app.include_router(search.router)
+app.include_router(bulk.router)
+app.include_router(archive.router)
+app.include_router(stats.router)
+app.include_router(runs.router)
+app.include_router(events.router)
 
 @app.get("/")
 async def root():
@@ -37,9 +85,17 @@ async def root():
         "endpoints": {
             "tools": "/tools",
             "challenges": "/challenges",
-            "notes": "/notes"
+            "notes": "/notes",
+            "search": "/search",
+            "stats": "/stats",
+            "runs": "/runs",
+            "events": "/events"
         }
     }
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
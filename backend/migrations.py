@@ -0,0 +1,115 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import func, inspect, select, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateColumn, MetaData
+
+logger = logging.getLogger(__name__)
+
+
+def add_missing_columns(engine: Engine, metadata: MetaData):
+    """Ajoute aux tables existantes les colonnes déclarées dans les modèles.
+
+    `create_all` ne crée que les tables absentes : les bases créées avec une
+    version précédente doivent recevoir les nouvelles colonnes à la main.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                logger.info("Migration: ajout de la colonne %s.%s", table.name, column.name)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+
+
+def create_missing_indexes(engine: Engine, metadata: MetaData):
+    """Crée les index déclarés dans les modèles qui n'existent pas encore."""
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+def migrate_resource_files(engine: Engine):
+    """Déplace les entrées `resources['files']` des challenges vers la table files.
+
+    Migration unique : une fois traité, un challenge n'a plus de clé `files`
+    dans ses ressources et n'est plus sélectionné.
+    """
+    from . import models
+    from .storage import blob_relpath
+
+    with Session(engine) as db:
+        challenges = db.query(models.Challenge).filter(
+            text("json_type(challenges.resources, '$.files') IS NOT NULL")
+        ).all()
+        for challenge in challenges:
+            resources = dict(challenge.resources)
+            seen = set()
+            for entry in resources.pop('files') or []:
+                filename = entry.get('filename')
+                if not filename or filename in seen:
+                    continue
+                seen.add(filename)
+                try:
+                    created_at = datetime.strptime(entry.get('uploaded_at', ''), "%Y%m%d_%H%M%S")
+                except ValueError:
+                    created_at = challenge.created_at
+                if entry.get('storage') == 'blob':
+                    storage, sha256, path = 'blob', entry['sha256'], blob_relpath(entry['sha256'])
+                else:
+                    storage, sha256, path = 'legacy', None, f"challenge_{challenge.id}/{filename}"
+                db.add(models.File(
+                    challenge_id=challenge.id,
+                    filename=filename,
+                    name=entry.get('original_name') or filename,
+                    path=path,
+                    storage=storage,
+                    file_type=entry.get('detected_type'),
+                    size=entry.get('size'),
+                    sha256=sha256,
+                    created_at=created_at
+                ))
+            challenge.resources = resources
+        if challenges:
+            logger.info("Migration: %d challenge(s) déplacé(s) vers la table files", len(challenges))
+        db.commit()
+
+
+def migrate_challenge_stats(engine: Engine):
+    """Initialise les compteurs de statistiques d'une base existante.
+
+    Les challenges déjà résolus reçoivent leur date de dernière modification
+    comme date de résolution, faute de mieux.
+    """
+    from . import models
+    from .stats import rebuild
+
+    with Session(engine) as db:
+        db.execute(
+            update(models.Challenge)
+            .where(models.Challenge.solved.is_(True), models.Challenge.solved_at.is_(None))
+            .values(solved_at=models.Challenge.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+        has_stats = db.scalar(select(func.count()).select_from(models.ChallengeStat))
+        has_challenges = db.scalar(select(func.count()).select_from(models.Challenge))
+        if has_challenges and not has_stats:
+            logger.info("Migration: calcul des statistiques des challenges")
+            rebuild(db)
+        db.commit()
+
+
+def upgrade(engine: Engine, metadata: MetaData):
+    """Met à niveau le schéma d'une base existante."""
+    metadata.create_all(bind=engine)
+    add_missing_columns(engine, metadata)
+    create_missing_indexes(engine, metadata)
@@ -1,12 +1,18 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Boolean, Table, JSON
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Boolean, Table, JSON, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
+from .compression import CompressedText
 
 Base = declarative_base()
 
 class Tool(Base):
     __tablename__ = "tools"
+    __table_args__ = (
+        # Pagination par curseur sur (created_at, id), avec ou sans filtre de catégorie
+        Index("ix_tools_created_id", "created_at", "id"),
+        Index("ix_tools_category_created_id", "category", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False)
@@ -18,6 +24,12 @@ class Tool(Base):
 
 class Challenge(Base):
     __tablename__ = "challenges"
+    __table_args__ = (
+        Index("ix_challenges_created_id", "created_at", "id"),
+        Index("ix_challenges_category_created_id", "category", "created_at", "id"),
+        Index("ix_challenges_difficulty_created_id", "difficulty", "created_at", "id"),
+        Index("ix_challenges_solved_created_id", "solved", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
@@ -26,22 +38,54 @@ class Challenge(Base):
     difficulty = Column(String(20))
     solved = Column(Boolean, default=False)
     correct_flag = Column(String(200))  # Flag correct pour la validation
-    resources = Column(JSON, default=lambda: {"files": [], "links": [], "commands": []})  # Valeur par défaut
+    resources = Column(JSON, default=lambda: {"links": [], "commands": []})  # Les fichiers sont dans la table files
+    solved_at = Column(DateTime, index=True)  # Date de résolution, pour l'historique de progression
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Verrouillage optimiste (PATCH)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __mapper_args__ = {"version_id_col": version}
+
+class ChallengeStat(Base):
+    __tablename__ = "challenge_stats"
+    
+    # Compteurs par catégorie et difficulté, tenus à jour à chaque écriture (voir stats.py)
+    category = Column(String(50), primary_key=True)
+    difficulty = Column(String(20), primary_key=True)  # "" quand la difficulté n'est pas renseignée
+    total = Column(Integer, nullable=False, default=0)
+    solved = Column(Integer, nullable=False, default=0)
+
+class Blob(Base):
+    __tablename__ = "blobs"
+    
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    detected_type = Column(String(100))
+    refcount = Column(Integer, nullable=False, default=0)  # Nombre de fichiers qui pointent vers ce contenu
+    analysis_results = Column(Text)  # Cache des analyses, partagé par les fichiers de même contenu
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 class File(Base):
     __tablename__ = "files"
+    __table_args__ = (
+        Index("ix_files_challenge_filename", "challenge_id", "filename", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     challenge_id = Column(Integer, ForeignKey("challenges.id"))
-    name = Column(String(200), nullable=False)
-    path = Column(String(500), nullable=False)
+    filename = Column(String(300))  # Nom unique du fichier dans le challenge
+    name = Column(String(200), nullable=False)  # Nom d'origine du fichier uploadé
+    path = Column(String(500), nullable=False)  # Relatif au dossier uploads
+    storage = Column(String(20), default="blob")  # blob ou legacy (dossier challenge_{id})
     file_type = Column(String(50))
+    content_type = Column(String(100))  # Type MIME servi au téléchargement
+    size = Column(Integer)
+    sha256 = Column(String(64), ForeignKey("blobs.sha256"), index=True)  # Contenu dans le blob store
     analysis_results = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     challenge = relationship("Challenge", back_populates="files")
+    blob = relationship("Blob")
 
 class Folder(Base):
     __tablename__ = "folders"
@@ -61,16 +105,36 @@ class Note(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
-    content = Column(Text, nullable=False)
+    content = Column(CompressedText, nullable=False)  # Compressé au-delà de PWNBOX_NOTE_COMPRESSION_MIN_SIZE
     tags = Column(JSON, default=lambda: [])
     is_favorite = Column(Boolean, default=False)
     folder_id = Column(Integer, ForeignKey("folders.id"), nullable=True)
     parent_id = Column(Integer, ForeignKey("notes.id"), nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Verrouillage optimiste (PATCH)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __mapper_args__ = {"version_id_col": version}
+    
     # Relations
     folder = relationship("Folder", back_populates="notes")
     parent = relationship("Note", remote_side=[id], backref="children")
 
-Challenge.files = relationship("File", back_populates="challenge") 
\ No newline at end of file
+class NoteRevision(Base):
+    __tablename__ = "note_revisions"
+    __table_args__ = (
+        Index("ix_note_revisions_note_version", "note_id", "version", unique=True),
+    )
+    
+    # Historique des notes : instantanés et deltas compressés (voir revisions.py)
+    id = Column(Integer, primary_key=True, index=True)
+    note_id = Column(Integer, ForeignKey("notes.id"), nullable=False)
+    version = Column(Integer, nullable=False)  # Version de la note après l'écriture
+    chain = Column(Integer, nullable=False, default=0)  # 0 : instantané, n : n-ième delta depuis l'instantané
+    title = Column(String(200), nullable=False)
+    data = Column(LargeBinary, nullable=False)  # Contenu ou delta, JSON compressé (zlib)
+    size = Column(Integer, nullable=False)  # Longueur du contenu reconstruit
+    digest = Column(String(16), nullable=False)  # Empreinte du contenu, pour détecter une chaîne rompue
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+Challenge.files = relationship("File", back_populates="challenge", order_by="File.id") 
\ No newline at end of file
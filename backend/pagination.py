@@ -0,0 +1,94 @@
+import base64
+import json
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .changes import SINGLE_PROCESS, on_tables_committed
+
+
+def encode_cursor(created_at: datetime, id_: int) -> str:
+    raw = json.dumps([created_at.isoformat(), id_]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, id_ = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(id_)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+
+
+class CountCache:
+    """Cache des totaux par table et par filtres, vidé quand la table est modifiée.
+
+    Inactif avec plusieurs workers : l'invalidation ne voit que les commits du processus.
+    """
+
+    def __init__(self, enabled: bool = SINGLE_PROCESS):
+        self.enabled = enabled
+        self._counts: Dict[Tuple[str, tuple], int] = {}
+        self._lock = threading.Lock()
+        on_tables_committed(self.invalidate)
+
+    async def get(self, db: AsyncSession, model, filters: list, key: tuple) -> int:
+        if not self.enabled:
+            return await db.scalar(select(func.count(model.id)).where(*filters))
+        cache_key = (model.__tablename__, key)
+        with self._lock:
+            if cache_key in self._counts:
+                return self._counts[cache_key]
+        count = await db.scalar(select(func.count(model.id)).where(*filters))
+        with self._lock:
+            self._counts[cache_key] = count
+        return count
+
+    def invalidate(self, tables):
+        with self._lock:
+            for cache_key in [k for k in self._counts if k[0] in tables]:
+                del self._counts[cache_key]
+
+
+count_cache = CountCache()
+
+
+async def keyset_page(
+    db: AsyncSession,
+    model,
+    filters: list,
+    response: Response,
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    with_total: bool = False,
+    count_key: tuple = (),
+    options: tuple = (),
+):
+    """Retourne une page triée par (created_at, id) et renseigne les en-têtes de pagination.
+
+    `X-Next-Cursor` contient le curseur opaque de la page suivante et
+    `X-Total-Count` le total (mis en cache) si `with_total` est demandé.
+    `skip` reste accepté pour la pagination par offset historique ;
+    `options` s'applique à la requête (chargement des relations).
+    """
+    query = select(model).where(*filters).options(*options)
+    if cursor:
+        created_at, id_ = decode_cursor(cursor)
+        query = query.where(tuple_(model.created_at, model.id) > tuple_(created_at, id_))
+    query = query.order_by(model.created_at, model.id)
+    if skip and not cursor:
+        query = query.offset(skip)
+    rows = (await db.scalars(query.limit(limit + 1))).all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].created_at, rows[-1].id)
+    if with_total:
+        response.headers["X-Total-Count"] = str(await count_cache.get(db, model, filters, count_key))
+    return rows
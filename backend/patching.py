@@ -0,0 +1,167 @@
+"""Mises à jour partielles : JSON Patch (RFC 6902) et versions.
+
+Les lignes modifiables par PATCH portent une colonne `version` (version_id_col
+de SQLAlchemy) : chaque UPDATE vérifie la version lue et l'incrémente. Un
+client passe la version qu'il a modifiée dans `If-Match` (ou le champ
+`version`) ; si la ligne a changé entre-temps, il reçoit un 409 au lieu
+d'écraser la modification d'un autre. L'ETag renvoyé nomme la ressource
+(`"note-3-v2"`) : deux lignes à la même version n'ont pas le même. Les messages d'erreur de version sont
+fournis par chaque routeur, dans sa langue.
+"""
+import copy
+import re
+from typing import Any, List, Optional
+
+from fastapi import HTTPException
+
+OPERATIONS = ("add", "remove", "replace", "move", "copy", "test")
+INVALID_IF_MATCH = "If-Match invalide : version attendue"
+VERSION_TAG = re.compile(r"^(?P<resource>[a-z]+-\d+)-v(?P<version>\d+)$")
+
+
+def version_etag(resource: str, version: int) -> str:
+    """ETag d'une ligne versionnée, propre à la ressource : `"note-3-v2"`."""
+    return f'"{resource}-v{version}"'
+
+
+def parse_if_match(if_match: Optional[str], invalid: str = INVALID_IF_MATCH,
+                   resource: Optional[str] = None) -> Optional[int]:
+    """Version attendue d'après `If-Match` : `"note-3-v2"` (ETag renvoyé), `"2"`,
+    `W/"2"` ou `2`. Un ETag d'une autre ressource que `resource` est refusé (400)."""
+    if not if_match or if_match.strip() == "*":
+        return None
+    value = if_match.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    value = value.strip('"')
+    tagged = VERSION_TAG.match(value)
+    if tagged:
+        if resource is not None and tagged.group("resource") != resource:
+            raise HTTPException(status_code=400, detail=invalid)
+        return int(tagged.group("version"))
+    try:
+        return int(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=invalid)
+
+
+def check_version(current: int, if_match: Optional[str], version: Optional[int], detail: str,
+                  invalid: str = INVALID_IF_MATCH, resource: Optional[str] = None):
+    """Refuse la mise à jour (409) si la version attendue n'est plus la version courante.
+
+    `detail` est le message du 409, formaté avec `expected` et `current` ;
+    `invalid` celui du 400 pour un `If-Match` illisible ; `resource` (par
+    exemple "note-3") est le préfixe attendu dans l'ETag.
+    """
+    expected = parse_if_match(if_match, invalid, resource)
+    if expected is None:
+        expected = version
+    if expected is not None and expected != current:
+        raise HTTPException(status_code=409, detail=detail.format(expected=expected, current=current))
+
+
+def conflict(detail: str) -> HTTPException:
+    """Mise à jour concurrente détectée au moment de l'écriture (StaleDataError)."""
+    return HTTPException(status_code=409, detail=detail)
+
+
+# --- JSON Patch --------------------------------------------------------------
+
+def _tokens(pointer: str) -> List[str]:
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise HTTPException(status_code=400, detail=f"Chemin JSON Pointer invalide : {pointer}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def _index(container: list, token: str, allow_end: bool) -> int:
+    if allow_end and token == "-":
+        return len(container)
+    if not token.isdigit() or (token != "0" and token.startswith("0")):
+        raise HTTPException(status_code=400, detail=f"Index de liste invalide : {token}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise HTTPException(status_code=409, detail=f"Index hors de la liste : {token}")
+    return index
+
+
+def _parent(document: Any, pointer: str):
+    tokens = _tokens(pointer)
+    if not tokens:
+        raise HTTPException(status_code=400, detail="Opération impossible sur la racine du document")
+    target = document
+    for token in tokens[:-1]:
+        if isinstance(target, dict) and token in target:
+            target = target[token]
+        elif isinstance(target, list):
+            target = target[_index(target, token, allow_end=False)]
+        else:
+            raise HTTPException(status_code=409, detail=f"Chemin introuvable : {pointer}")
+    return target, tokens[-1]
+
+
+def _get(document: Any, pointer: str) -> Any:
+    if pointer == "":
+        return document
+    parent, token = _parent(document, pointer)
+    if isinstance(parent, dict):
+        if token not in parent:
+            raise HTTPException(status_code=409, detail=f"Chemin introuvable : {pointer}")
+        return parent[token]
+    if isinstance(parent, list):
+        return parent[_index(parent, token, allow_end=False)]
+    raise HTTPException(status_code=409, detail=f"Chemin introuvable : {pointer}")
+
+
+def _add(document: Any, pointer: str, value: Any):
+    parent, token = _parent(document, pointer)
+    if isinstance(parent, dict):
+        parent[token] = value
+    elif isinstance(parent, list):
+        parent.insert(_index(parent, token, allow_end=True), value)
+    else:
+        raise HTTPException(status_code=409, detail=f"Chemin introuvable : {pointer}")
+
+
+def _remove(document: Any, pointer: str) -> Any:
+    value = _get(document, pointer)
+    parent, token = _parent(document, pointer)
+    if isinstance(parent, dict):
+        del parent[token]
+    else:
+        del parent[_index(parent, token, allow_end=False)]
+    return value
+
+
+def apply_json_patch(document: Any, operations: List[Any]) -> Any:
+    """Applique une liste d'opérations JSON Patch ; le document d'origine n'est pas modifié.
+
+    Tout ou rien : une opération en échec (dont `test`) annule l'ensemble.
+    """
+    document = copy.deepcopy(document)
+    for operation in operations:
+        op, path = operation.op, operation.path
+        if op not in OPERATIONS:
+            raise HTTPException(status_code=400, detail=f"Opération JSON Patch inconnue : {op}")
+        if op in ("add", "replace", "test") and "value" not in operation.model_fields_set:
+            raise HTTPException(status_code=400, detail=f"L'opération {op} demande une valeur")
+        if op in ("move", "copy") and operation.from_ is None:
+            raise HTTPException(status_code=400, detail=f"L'opération {op} demande `from`")
+
+        if op == "add":
+            _add(document, path, copy.deepcopy(operation.value))
+        elif op == "remove":
+            _remove(document, path)
+        elif op == "replace":
+            _remove(document, path)
+            _add(document, path, copy.deepcopy(operation.value))
+        elif op == "move":
+            if path.startswith(operation.from_ + "/"):
+                raise HTTPException(status_code=400, detail="Impossible de déplacer une valeur dans elle-même")
+            _add(document, path, _remove(document, operation.from_))
+        elif op == "copy":
+            _add(document, path, copy.deepcopy(_get(document, operation.from_)))
+        elif _get(document, path) != operation.value:
+            raise HTTPException(status_code=409, detail=f"Test JSON Patch en échec sur {path}")
+    return document
@@ -0,0 +1,97 @@
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from pydantic import ConfigDict, TypeAdapter, create_model
+from pydantic_core import to_json
+from sqlalchemy.orm import load_only
+
+# En-têtes de pagination posés par keyset_page, à recopier sur la réponse projetée
+FORWARDED_HEADERS = ("x-next-cursor", "x-total-count")
+
+
+class Projection:
+    """Champs demandés pour une liste, via `fields=` ou `view=summary`."""
+
+    def __init__(self, fields: List[str], schema: type):
+        self.fields = fields
+        self.schema = schema
+
+    def columns(self, model, *required: str):
+        """Option `load_only` : seules les colonnes utiles sont lues en base.
+
+        `required` ajoute des colonnes nécessaires à la requête elle-même
+        (curseur, rattachement des enfants) sans les exposer.
+        """
+        table_columns = model.__table__.columns
+        names = [name for name in dict.fromkeys(("id",) + required + tuple(self.fields))
+                 if name in table_columns]
+        return load_only(*(getattr(model, name) for name in names))
+
+
+@lru_cache(maxsize=128)
+def projection_schema(schema: type, fields: Tuple[str, ...]) -> type:
+    """Schéma Pydantic réduit aux champs demandés (mis en cache par combinaison)."""
+    definitions = {name: (schema.model_fields[name].annotation, schema.model_fields[name])
+                   for name in fields}
+    return create_model(
+        f"{schema.__name__}Fields",
+        __config__=ConfigDict(from_attributes=True),
+        **definitions
+    )
+
+
+@lru_cache(maxsize=128)
+def list_adapter(schema: type) -> TypeAdapter:
+    return TypeAdapter(List[schema])
+
+
+def parse_projection(
+    model,
+    schema: type,
+    summary: type,
+    fields: Optional[str],
+    view: Optional[str],
+    relations: Tuple[str, ...] = (),
+) -> Optional[Projection]:
+    """Interprète `fields` et `view` ; retourne None pour la vue complète.
+
+    `fields` accepte les colonnes exposées par `schema` et les relations
+    listées dans `relations` ; `id` est toujours inclus.
+    """
+    if view not in (None, "full", "summary"):
+        raise HTTPException(status_code=400, detail="Vue invalide (full ou summary)")
+    if fields:
+        available = [name for name in schema.model_fields
+                     if name in model.__table__.columns or name in relations]
+        names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Champ(s) inconnu(s): {', '.join(unknown)} (disponibles: {', '.join(available)})"
+            )
+        if "id" not in names:
+            names.insert(0, "id")
+        return Projection(names, projection_schema(schema, tuple(names)))
+    if view == "summary":
+        return Projection(list(summary.model_fields), summary)
+    return None
+
+
+def projected_response(items, projection: Projection, response: Optional[Response] = None,
+                       validate: bool = True) -> Response:
+    """Sérialise directement en JSON, sans passer par le schéma complet de la route.
+
+    Avec `validate`, les objets ORM sont validés par le schéma réduit ; sinon
+    `items` doit déjà contenir des structures JSON (dict, list, datetime...).
+    """
+    if validate:
+        adapter = list_adapter(projection.schema)
+        content = adapter.dump_json(adapter.validate_python(items, from_attributes=True))
+    else:
+        content = to_json(items)
+    headers: Dict[str, str] = {}
+    if response is not None:
+        headers = {name: value for name, value in response.headers.items() if name in FORWARDED_HEADERS}
+    return Response(content, media_type="application/json", headers=headers)
@@ -0,0 +1,166 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .changes import SINGLE_PROCESS, table_versions
+
+# Listes mises en cache -> tables dont dépend leur contenu
+CACHED_ROUTES: Dict[str, Tuple[str, ...]] = {
+    "/tools/": ("tools",),
+    "/challenges/": ("challenges", "files"),
+    "/notes/": ("notes",),
+    "/folders/": ("folders", "notes"),
+    "/stats/": ("challenge_stats",),
+}
+# Désactivable avec PWNBOX_RESPONSE_CACHE=0 ; toujours désactivé avec plusieurs workers
+ENABLED = SINGLE_PROCESS and os.getenv("PWNBOX_RESPONSE_CACHE", "1") != "0"
+MAX_ENTRIES = 256
+# Les réponses plus grosses sont servies normalement, sans être conservées
+MAX_ENTRY_SIZE = 4 * 1024 * 1024
+
+
+class CachedResponse(NamedTuple):
+    versions: Tuple[int, ...]
+    status: int
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+    etag: bytes
+    route: object
+
+
+class ResponseCache:
+    """Cache LRU de réponses, invalidé par les versions des tables.
+
+    Une entrée est valide tant que les tables dont elle dépend n'ont pas été
+    modifiées par un commit : aucune purge explicite n'est nécessaire.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, versions: Tuple[int, ...]) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.versions != versions:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: tuple, entry: CachedResponse):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
+
+
+def make_etag(body: bytes) -> bytes:
+    digest = hashlib.blake2b(body, digest_size=12).hexdigest()
+    return f'"{digest}"'.encode()
+
+
+def etag_matches(if_none_match: Optional[bytes], etag: bytes) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(b",")]
+    return b"*" in candidates or etag in candidates or b"W/" + etag in candidates
+
+
+class ResponseCacheMiddleware:
+    """Middleware ASGI qui sert les listes GET depuis le cache.
+
+    La clé est le chemin et les paramètres de requête triés. Chaque réponse
+    porte un ETag : un client qui renvoie `If-None-Match` reçoit un 304 tant
+    que la liste n'a pas changé. Le cache est propre au processus et n'est
+    valide qu'avec un seul worker : les autres ne verraient pas ses écritures.
+    """
+
+    def __init__(self, app, routes: Dict[str, Tuple[str, ...]] = CACHED_ROUTES,
+                 cache: ResponseCache = response_cache, enabled: bool = ENABLED):
+        self.app = app
+        self.routes = routes
+        self.cache = cache
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        tables = self.routes.get(scope.get("path")) if scope["type"] == "http" else None
+        if tables is None or not self.enabled or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        query = b"&".join(sorted(scope.get("query_string", b"").split(b"&")))
+        key = (scope["path"], query)
+        request_headers = dict(scope["headers"])
+        if_none_match = request_headers.get(b"if-none-match")
+        # Versions lues avant la requête : un commit concurrent rend l'entrée aussitôt périmée
+        versions = table_versions(*tables)
+
+        # `Cache-Control: no-cache` force une lecture en base (la réponse reste mise en cache)
+        bypass = b"no-cache" in request_headers.get(b"cache-control", b"")
+        entry = None if bypass else self.cache.get(key, versions)
+        if entry is not None:
+            scope["route"] = entry.route
+            await self._send(send, entry, if_none_match, b"HIT")
+            return
+
+        start: dict = {}
+        chunks: List[bytes] = []
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+
+        body = b"".join(chunks)
+        headers = [(name, value) for name, value in start.get("headers", [])
+                   if name.lower() != b"content-length"]
+        entry = CachedResponse(
+            versions=versions,
+            status=start.get("status", 500),
+            headers=headers,
+            body=body,
+            etag=make_etag(body),
+            route=scope.get("route"),
+        )
+        if entry.status == 200 and len(body) <= MAX_ENTRY_SIZE:
+            self.cache.put(key, entry)
+        await self._send(send, entry, if_none_match, b"MISS")
+
+    async def _send(self, send, entry: CachedResponse, if_none_match: Optional[bytes], status: bytes):
+        if entry.status != 200:
+            await send({"type": "http.response.start", "status": entry.status,
+                        "headers": entry.headers + [(b"content-length", str(len(entry.body)).encode())]})
+            await send({"type": "http.response.body", "body": entry.body})
+            return
+
+        headers = entry.headers + [
+            (b"etag", entry.etag),
+            (b"cache-control", b"no-cache"),
+            (b"x-cache", status),
+        ]
+        if etag_matches(if_none_match, entry.etag):
+            headers = [(name, value) for name, value in headers if name.lower() != b"content-type"]
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": headers + [(b"content-length", str(len(entry.body)).encode())]})
+        await send({"type": "http.response.body", "body": entry.body})
@@ -0,0 +1,22 @@
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class CompactJSONResponse(JSONResponse):
+    """Réponse JSON sans espaces, encodée avec orjson lorsqu'il est installé.
+
+    Utilisée par défaut pour les routes sans modèle de réponse ; celles qui en
+    déclarent un sont déjà sérialisées directement en octets par Pydantic.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode("utf-8")
@@ -0,0 +1,213 @@
+"""Historique des notes : instantanés complets périodiques et deltas compressés.
+
+Chaque écriture qui change le titre ou le contenu d'une note ajoute une
+révision, numérotée par la version de la note après l'écriture. Une révision
+est soit un instantané (le contenu complet), soit un delta par rapport à la
+révision précédente ; un instantané est écrit au moins toutes les
+SNAPSHOT_INTERVAL révisions, si bien que reconstruire une version demande au
+plus SNAPSHOT_INTERVAL - 1 deltas. Les deltas travaillent par lignes : une
+sauvegarde automatique qui touche un paragraphe ne stocke que ce paragraphe.
+"""
+import hashlib
+import json
+import os
+import zlib
+from datetime import datetime, timedelta
+from difflib import SequenceMatcher
+from typing import List, Optional, Tuple, Union
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+
+SNAPSHOT_INTERVAL = max(1, int(os.getenv("PWNBOX_NOTE_SNAPSHOT_INTERVAL", "20")))
+# Révisions conservées par note (0 : toutes) et durée de conservation en jours (0 : illimitée)
+MAX_REVISIONS = int(os.getenv("PWNBOX_NOTE_MAX_REVISIONS", "200"))
+RETENTION_DAYS = int(os.getenv("PWNBOX_NOTE_REVISION_DAYS", "0"))
+
+# (version, titre, contenu) d'une note avant modification
+State = Tuple[int, str, str]
+# Delta : [début, fin) = lignes recopiées de l'ancien texte, str = texte inséré
+Delta = List[Union[List[int], str]]
+
+
+def snapshot(note: models.Note) -> State:
+    return note.version, note.title, note.content
+
+
+def digest(content: str) -> str:
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def make_delta(old: str, new: str) -> Delta:
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    # Préfixe et suffixe communs traités sans SequenceMatcher : le cas d'une
+    # modification locale reste linéaire, même sur une longue note
+    prefix = 0
+    limit = min(len(old_lines), len(new_lines))
+    while prefix < limit and old_lines[prefix] == new_lines[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old_lines[-1 - suffix] == new_lines[-1 - suffix]:
+        suffix += 1
+
+    delta: Delta = []
+    if prefix:
+        delta.append([0, prefix])
+    matcher = SequenceMatcher(None, old_lines[prefix:len(old_lines) - suffix],
+                              new_lines[prefix:len(new_lines) - suffix])
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append([prefix + i1, prefix + i2])
+        elif j2 > j1:
+            delta.append("".join(new_lines[prefix + j1:prefix + j2]))
+    if suffix:
+        delta.append([len(old_lines) - suffix, len(old_lines)])
+    return delta
+
+
+def apply_delta(old: str, delta: Delta) -> str:
+    old_lines = old.splitlines(keepends=True)
+    return "".join("".join(old_lines[part[0]:part[1]]) if isinstance(part, list) else part for part in delta)
+
+
+def _pack(value) -> bytes:
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def _unpack(data: bytes):
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+def _snapshot_row(note_id: int, version: int, title: str, content: str, created_at=None) -> models.NoteRevision:
+    return models.NoteRevision(
+        note_id=note_id, version=version, chain=0, title=title, data=_pack(content),
+        size=len(content), digest=digest(content), created_at=created_at or datetime.utcnow()
+    )
+
+
+async def record(db: AsyncSession, note: models.Note, previous: Optional[State] = None):
+    """Ajoute une révision pour l'état courant de `note`, dans la transaction en cours.
+
+    `previous` est l'état lu avant la modification (None à la création). À
+    appeler avant le commit : la version enregistrée est celle que le commit
+    va donner à la note.
+    """
+    if previous is not None and (previous[1], previous[2]) == (note.title, note.content):
+        return
+    version = previous[0] + 1 if previous is not None else note.version or 1
+    last = None
+    if previous is not None:
+        last = await db.scalar(
+            select(models.NoteRevision).where(models.NoteRevision.note_id == note.id)
+            .order_by(models.NoteRevision.version.desc()).limit(1)
+        )
+        if last is None or last.digest != digest(previous[2]):
+            # Note sans historique (antérieure, importée, copiée) ou modifiée hors
+            # de l'API : l'état d'avant devient la base de la chaîne
+            if last is None or last.version < previous[0]:
+                last = _snapshot_row(note.id, previous[0], previous[1], previous[2])
+                db.add(last)
+            else:
+                last = None
+
+    content = note.content
+    if last is None or last.chain + 1 >= SNAPSHOT_INTERVAL:
+        db.add(_snapshot_row(note.id, version, note.title, content))
+    else:
+        delta = make_delta(previous[2], content)
+        data = _pack(delta)
+        if len(data) * 2 > len(_pack(content)):
+            # Réécriture presque complète : un instantané coûte à peine plus cher
+            db.add(_snapshot_row(note.id, version, note.title, content))
+        else:
+            db.add(models.NoteRevision(
+                note_id=note.id, version=version, chain=last.chain + 1, title=note.title, data=data,
+                size=len(content), digest=digest(content), created_at=datetime.utcnow()
+            ))
+
+    if MAX_REVISIONS and version % SNAPSHOT_INTERVAL == 0:
+        # Élagage regroupé : au plus une fois toutes les SNAPSHOT_INTERVAL versions
+        await db.flush()
+        await prune(db, note.id)
+
+
+async def reconstruct(db: AsyncSession, note_id: int, version: int) -> Tuple[models.NoteRevision, str]:
+    """Contenu de la note à la `version` donnée : la dernière révision qui ne la dépasse pas.
+
+    Lit un instantané puis au plus SNAPSHOT_INTERVAL - 1 deltas.
+    """
+    revision = models.NoteRevision
+    base = await db.scalar(
+        select(func.max(revision.version)).where(
+            revision.note_id == note_id, revision.version <= version, revision.chain == 0
+        )
+    )
+    if base is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    rows = (await db.scalars(
+        select(revision).where(
+            revision.note_id == note_id, revision.version >= base, revision.version <= version
+        ).order_by(revision.version)
+    )).all()
+    content = ""
+    for row in rows:
+        value = _unpack(row.data)
+        content = value if row.chain == 0 else apply_delta(content, value)
+    return rows[-1], content
+
+
+async def prune(db: AsyncSession, note_id: int) -> int:
+    """Applique la politique de conservation ; retourne le nombre de révisions supprimées.
+
+    Garde les MAX_REVISIONS plus récentes (et, avec RETENTION_DAYS, celles de
+    moins de RETENTION_DAYS jours ; la dernière est toujours gardée). Si la
+    plus ancienne révision gardée est un delta, elle est réécrite en
+    instantané avant la suppression de celles dont elle dépendait.
+    """
+    revision = models.NoteRevision
+    versions = (await db.scalars(
+        select(revision.version).where(revision.note_id == note_id).order_by(revision.version.desc())
+    )).all()
+    keep = len(versions)
+    if MAX_REVISIONS:
+        keep = min(keep, MAX_REVISIONS)
+    if RETENTION_DAYS and versions:
+        cutoff = datetime.utcnow() - timedelta(days=RETENTION_DAYS)
+        recent = await db.scalar(
+            select(func.count()).where(revision.note_id == note_id, revision.created_at >= cutoff)
+        )
+        keep = min(keep, max(recent, 1))
+    if keep >= len(versions):
+        return 0
+
+    oldest_kept = versions[keep - 1]
+    row, content = await reconstruct(db, note_id, oldest_kept)
+    if row.chain != 0:
+        await db.execute(
+            update(revision).where(revision.id == row.id).values(chain=0, data=_pack(content))
+            .execution_options(synchronize_session=False)
+        )
+    result = await db.execute(
+        delete(revision).where(revision.note_id == note_id, revision.version < oldest_kept)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+async def compact_all(db: AsyncSession) -> dict:
+    """Applique la politique de conservation à toutes les notes qui ont un historique."""
+    note_ids = (await db.scalars(select(models.NoteRevision.note_id).distinct())).all()
+    removed = 0
+    for note_id in note_ids:
+        removed += await prune(db, note_id)
+    return {"notes": len(note_ids), "removed": removed}
+
+
+def delete_for_notes(note_ids) -> object:
+    """Requête de suppression de l'historique de notes (ids ou sous-requête)."""
+    return delete(models.NoteRevision).where(models.NoteRevision.note_id.in_(note_ids)) \
+        .execution_options(synchronize_session=False)
@@ -1,4 +1,11 @@
 from . import tools
 from . import challenges
 from . import notes
-from . import folders 
\ No newline at end of file
+from . import folders 
+from . import analysis
+from . import search
+from . import bulk
+from . import archive
+from . import stats
+from . import runs
+from . import events
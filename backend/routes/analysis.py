@@ -0,0 +1,15 @@
+from fastapi import APIRouter, HTTPException
+from .. import schemas
+from ..analysis import analysis_queue
+
+router = APIRouter(
+    prefix="/analysis",
+    tags=["analysis"]
+)
+
+@router.get("/jobs/{job_id}", response_model=schemas.AnalysisJob)
+def get_analysis_job(job_id: str):
+    job = analysis_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Analyse non trouvée")
+    return job.as_dict()
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+from ..archive import SINKS, restore_from_stream, stream_archive
+
+router = APIRouter(
+    tags=["archive"]
+)
+
+MEDIA_TYPES = {"tar.gz": "application/gzip", "zip": "application/zip"}
+
+@router.get("/export/archive")
+async def export_archive(format: str = "tar.gz"):
+    """Exporte toute l'instance (base et fichiers) dans une archive construite à la volée."""
+    if format not in SINKS:
+        raise HTTPException(status_code=400, detail=f"Format inconnu: {format} ({', '.join(SINKS)})")
+    filename = f"pwnbox-{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{format}"
+    return StreamingResponse(
+        stream_archive(format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/import/archive")
+async def import_archive(request: Request, replace: bool = False):
+    """Restaure une archive tar.gz produite par /export/archive, lue en flux.
+
+    Le format zip n'est pas accepté : son index est à la fin du fichier, il
+    ne peut pas être lu au fil de l'eau.
+    """
+    return await restore_from_stream(request.stream(), replace)
@@ -0,0 +1,176 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Tuple
+import json
+import logging
+from .. import models, schemas
+from ..database import AsyncSessionLocal, get_db
+from ..stats import recompute
+from .challenges import clean_resources
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/bulk",
+    tags=["bulk"]
+)
+
+# Lignes insérées par transaction
+IMPORT_BATCH_SIZE = 1000
+# Lignes lues par aller-retour lors d'un export
+EXPORT_BATCH_SIZE = 1000
+MAX_LINE_SIZE = 1024 * 1024
+MAX_REPORTED_ERRORS = 100
+
+def tool_row(item: schemas.ToolImport, now: datetime) -> dict:
+    row = item.model_dump()
+    row["created_at"] = row["created_at"] or now
+    return row
+
+def challenge_row(item: schemas.ChallengeImport, now: datetime) -> dict:
+    row = item.model_dump()
+    resources = clean_resources(row["resources"])
+    resources.setdefault("links", [])
+    resources.setdefault("commands", [])
+    row["resources"] = resources
+    row["solved"] = bool(row["solved"])
+    row["created_at"] = row["created_at"] or now
+    row["updated_at"] = row["updated_at"] or row["created_at"]
+    row["solved_at"] = (row["solved_at"] or row["updated_at"]) if row["solved"] else None
+    return row
+
+def note_row(item: schemas.NoteImport, now: datetime) -> dict:
+    row = item.model_dump()
+    row["tags"] = row["tags"] or []
+    row["is_favorite"] = bool(row["is_favorite"])
+    row["created_at"] = row["created_at"] or now
+    row["updated_at"] = row["updated_at"] or row["created_at"]
+    return row
+
+# Type exporté/importé -> (modèle, schéma d'import, conversion en ligne de table)
+KINDS: Dict[str, Tuple[type, type, Callable]] = {
+    "tools": (models.Tool, schemas.ToolImport, tool_row),
+    "challenges": (models.Challenge, schemas.ChallengeImport, challenge_row),
+    "notes": (models.Note, schemas.NoteImport, note_row),
+}
+
+def get_kind(kind: str):
+    if kind not in KINDS:
+        raise HTTPException(status_code=404, detail=f"Type inconnu: {kind} ({', '.join(KINDS)})")
+    return KINDS[kind]
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """Découpe un flux d'octets en lignes numérotées à partir de 1."""
+    buffer = b""
+    number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            yield number, line
+        if len(buffer) > MAX_LINE_SIZE:
+            raise HTTPException(status_code=413, detail=f"Ligne {number + 1} trop longue (max {MAX_LINE_SIZE} octets)")
+    if buffer:
+        yield number + 1, buffer
+
+class ImportReport:
+    def __init__(self):
+        self.inserted = 0
+        self.error_count = 0
+        self.errors: List[dict] = []
+
+    def error(self, line: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self) -> dict:
+        return {"inserted": self.inserted, "error_count": self.error_count, "errors": self.errors}
+
+async def insert_batch(db: AsyncSession, model, batch: List[Tuple[int, dict]], report: ImportReport):
+    """Insère un lot en une seule requête (executemany) et un seul commit.
+
+    Si le lot est refusé (identifiant déjà utilisé...), il est rejoué ligne
+    par ligne pour n'écarter que les lignes fautives.
+    """
+    try:
+        await db.execute(insert(model), [row for _, row in batch])
+        await db.commit()
+        report.inserted += len(batch)
+        return
+    except Exception:
+        await db.rollback()
+    for line, row in batch:
+        try:
+            await db.execute(insert(model), [row])
+            await db.commit()
+            report.inserted += 1
+        except Exception as e:
+            await db.rollback()
+            report.error(line, str(getattr(e, "orig", e)))
+
+@router.post("/{kind}/import", response_model=schemas.BulkImportResult)
+async def import_ndjson(kind: str, request: Request, db: AsyncSession = Depends(get_db)):
+    """Importe un flux NDJSON : un objet par ligne, validé par le schéma de création.
+
+    Les lignes invalides sont signalées sans interrompre l'import ; les
+    lignes valides sont insérées par lots de IMPORT_BATCH_SIZE.
+    """
+    model, schema, to_row = get_kind(kind)
+    report = ImportReport()
+    batch: List[Tuple[int, dict]] = []
+    now = datetime.utcnow()
+    async for number, line in iter_lines(request.stream()):
+        if not line.strip():
+            continue
+        try:
+            item = schema.model_validate_json(line)
+        except ValidationError as e:
+            report.error(number, "; ".join(
+                f"{'.'.join(str(p) for p in err['loc']) or 'ligne'}: {err['msg']}" for err in e.errors()
+            ))
+            continue
+        batch.append((number, to_row(item, now)))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await insert_batch(db, model, batch, report)
+            batch = []
+    if batch:
+        await insert_batch(db, model, batch, report)
+    if model is models.Challenge and report.inserted:
+        # Les compteurs de progression sont recalculés une fois pour tout l'import
+        await recompute(db)
+        await db.commit()
+    logger.info("Import %s: %d ligne(s) insérée(s), %d erreur(s)", kind, report.inserted, report.error_count)
+    return report.as_dict()
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Type non sérialisable: {type(value).__name__}")
+
+async def export_rows(model) -> AsyncIterator[bytes]:
+    # Session propre au flux : elle vit jusqu'à la fin de la réponse
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(
+            select(*model.__table__.columns).order_by(model.id)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        async for rows in result.mappings().partitions():
+            yield "".join(
+                json.dumps(dict(row), default=json_default, ensure_ascii=False) + "\n" for row in rows
+            ).encode()
+
+@router.get("/{kind}/export")
+async def export_ndjson(kind: str):
+    """Exporte toutes les lignes en NDJSON, lues par lots via un curseur côté serveur."""
+    model, _, _ = get_kind(kind)
+    return StreamingResponse(
+        export_rows(model),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{kind}.ndjson"'}
+    )
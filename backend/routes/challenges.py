@@ -1,78 +1,143 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request, Query, Header
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.exc import StaleDataError
+from typing import List, Optional
 import re
-from .. import models, schemas
+from .. import models, schemas, stats
 from ..database import get_db
+from ..storage import (
+    blob_store, resumable_uploads, get_challenge_dir, blob_relpath, resolve_file_path, content_id
+)
+from ..uploads import MultipartFileStream, save_stream
+from ..analysis import analysis_queue
+from ..archive_index import SEPARATOR, find_member, get_index, iter_member
+from ..pagination import keyset_page
+from ..projection import parse_projection, projected_response
+from ..conditional import strong_etag, http_date, is_not_modified
+from ..patching import apply_json_patch, check_version, conflict, version_etag
+import asyncio
 import os
+import json
 import shutil
 from datetime import datetime
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 import mimetypes
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/challenges",
     tags=["challenges"]
 )
 
-# Configuration pour les fichiers
-UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads")
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_STREAM_FILE_SIZE = 4 * 1024 * 1024 * 1024  # 4GB pour les uploads en streaming
 ALLOWED_EXTENSIONS = {'.txt', '.pdf', '.zip', '.tar', '.gz', '.rar', '.7z', '.py', '.sh', '.exe', '.bin'}
+# Conflits de version (PATCH, PUT, résolution)
+VERSION_CONFLICT = "Conflit : le challenge a été modifié depuis la version {expected} (version actuelle : {current})"
+STALE_CONFLICT = "Conflit : le challenge a été modifié pendant la mise à jour"
+
+def clean_resources(resources) -> dict:
+    """Retourne les ressources sans la liste des fichiers, stockée dans la table files."""
+    resources = dict(resources or {})
+    resources.pop('files', None)
+    return resources
+
+async def get_challenge_file(db: AsyncSession, challenge_id: int, filename: str):
+    """Recherche un fichier de challenge par son nom (index challenge_id, filename)."""
+    return await db.scalar(select(models.File).where(
+        models.File.challenge_id == challenge_id,
+        models.File.filename == filename
+    ))
+
+async def get_challenge(db: AsyncSession, challenge_id: int, with_files: bool = False):
+    """Charge un challenge, avec ses fichiers si la réponse les expose."""
+    query = select(models.Challenge).where(models.Challenge.id == challenge_id)
+    if with_files:
+        query = query.options(selectinload(models.Challenge.files))
+    return await db.scalar(query)
+
+def validate_filename(filename: str):
+    """Vérifie que l'extension du fichier est autorisée."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    logger.debug("Extension du fichier: %s", ext)
 
-# Créer le dossier uploads s'il n'existe pas
-print(f"Création du dossier uploads à: {UPLOAD_DIR}")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+    if ext not in ALLOWED_EXTENSIONS:
+        logger.info("Extension non autorisée: %s", ext)
+        raise HTTPException(status_code=400, detail=f"Type de fichier non autorisé. Extensions autorisées: {', '.join(ALLOWED_EXTENSIONS)}")
 
-def get_challenge_dir(challenge_id: int) -> str:
-    """Retourne le chemin du dossier pour un challenge spécifique."""
-    return os.path.join(UPLOAD_DIR, f"challenge_{challenge_id}")
+def blob_filename(sha256: str, original_name: str) -> str:
+    """Nom unique d'un fichier dans un challenge, dérivé de son contenu."""
+    return f"{sha256[:12]}_{original_name}"
 
-def ensure_challenge_resources(challenge):
-    """S'assure que la structure des ressources est correcte."""
-    if not challenge.resources:
-        challenge.resources = {"files": [], "links": [], "commands": []}
-    if 'files' not in challenge.resources:
-        challenge.resources['files'] = []
-    return challenge.resources
+def guess_content_type(name: str) -> str:
+    """Devine le type MIME à partir du nom d'origine du fichier."""
+    content_type, _ = mimetypes.guess_type(name)
+    return content_type or 'application/octet-stream'
 
-def validate_file(file: UploadFile):
+async def release_file(db: AsyncSession, db_file: models.File):
+    """Libère le stockage d'un fichier de challenge.
+
+    Pour un blob, seule la référence est retirée : le contenu est récupéré
+    par le GC lorsqu'il n'est plus utilisé par aucun challenge.
+    """
+    if db_file.storage == 'blob':
+        await blob_store.decref(db, db_file.sha256)
+        return
+    file_path = resolve_file_path(db_file)
     try:
-        print(f"Validation du fichier: {file.filename}")
-        print(f"Type de contenu: {file.content_type}")
-        
-        # Vérifier la taille du fichier
-        file.file.seek(0, 2)  # Se positionner à la fin du fichier
-        size = file.file.tell()
-        file.file.seek(0)  # Revenir au début du fichier
-        
-        print(f"Taille du fichier: {size} bytes")
-        
-        if size > MAX_FILE_SIZE:
-            print(f"Fichier trop volumineux: {size} > {MAX_FILE_SIZE}")
-            raise HTTPException(status_code=400, detail="Le fichier est trop volumineux (max 10MB)")
-        
-        # Vérifier l'extension
-        ext = os.path.splitext(file.filename)[1].lower()
-        print(f"Extension du fichier: {ext}")
-        
-        if ext not in ALLOWED_EXTENSIONS:
-            print(f"Extension non autorisée: {ext}")
-            print(f"Extensions autorisées: {ALLOWED_EXTENSIONS}")
-            raise HTTPException(status_code=400, detail=f"Type de fichier non autorisé. Extensions autorisées: {', '.join(ALLOWED_EXTENSIONS)}")
-        
-        print("Validation du fichier réussie")
-    except HTTPException as e:
-        print(f"Erreur de validation: {str(e)}")
-        raise e
+        if os.path.exists(file_path):
+            await asyncio.to_thread(os.remove, file_path)
+        else:
+            logger.warning("Le fichier %s n'existe pas sur le disque", file_path)
     except Exception as e:
-        print(f"Erreur inattendue lors de la validation: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Erreur lors de la validation du fichier: {str(e)}")
+        logger.error("Erreur lors de la suppression du fichier %s: %s", file_path, e)
+        # On continue même si la suppression physique échoue
+
+async def attach_blob(db: AsyncSession, challenge_id: int, original_name: str, sha256: str, size: int,
+                detected_type: str = None, tmp_path: str = None) -> models.File:
+    """Attache un contenu du blob store au challenge.
+
+    Avec `tmp_path`, le fichier fraîchement uploadé est déplacé dans le store
+    (ou supprimé si le contenu y est déjà). Sans `tmp_path`, le blob doit
+    déjà exister.
+    """
+    filename = blob_filename(sha256, original_name)
+    existing_file = await get_challenge_file(db, challenge_id, filename)
+    
+    if existing_file:
+        # Même nom et même contenu : il n'y a rien de plus à stocker
+        logger.debug("Le fichier existe déjà pour ce challenge: %s", filename)
+        if tmp_path and os.path.exists(tmp_path):
+            await asyncio.to_thread(os.remove, tmp_path)
+        return existing_file
+    
+    if tmp_path:
+        await blob_store.store(db, tmp_path, sha256, size, detected_type)
+    elif not await blob_store.incref(db, sha256):
+        raise HTTPException(status_code=404, detail="Contenu inconnu, le fichier doit être uploadé")
+    
+    db_file = models.File(
+        challenge_id=challenge_id,
+        filename=filename,
+        name=original_name,
+        path=blob_relpath(sha256),
+        storage='blob',
+        file_type=detected_type,
+        content_type=guess_content_type(original_name),
+        size=size,
+        sha256=sha256
+    )
+    db.add(db_file)
+    return db_file
 
 @router.post("/", response_model=schemas.Challenge)
-def create_challenge(challenge: schemas.ChallengeCreate, db: Session = Depends(get_db)):
+async def create_challenge(challenge: schemas.ChallengeCreate, db: AsyncSession = Depends(get_db)):
     try:
-        print(f"Tentative de création d'un challenge avec les données: {challenge.dict()}")
+        logger.debug("Tentative de création d'un challenge: %s", challenge.title)
         
         if not challenge.title or not challenge.description or not challenge.category:
             raise HTTPException(
@@ -81,8 +146,8 @@ def create_challenge(challenge: schemas.ChallengeCreate, db: Session = Depends(g
             )
         
         # Initialiser les ressources avec une structure par défaut
+        # (les fichiers sont gérés par les routes /files)
         default_resources = {
-            "files": [],
             "links": [],
             "commands": []
         }
@@ -94,255 +159,410 @@ def create_challenge(challenge: schemas.ChallengeCreate, db: Session = Depends(g
         if 'resources' not in challenge_data:
             challenge_data['resources'] = default_resources
         else:
+            challenge_data['resources'] = clean_resources(challenge_data['resources'])
             # Fusionner les ressources existantes avec la structure par défaut
             for key in default_resources:
                 if key not in challenge_data['resources']:
                     challenge_data['resources'][key] = default_resources[key]
         
-        print(f"Données nettoyées pour la création: {challenge_data}")
+        db_challenge = models.Challenge(**challenge_data)
+        db.add(db_challenge)
+        await stats.track(db, None, stats.snapshot(db_challenge))
+        await db.commit()
         
-        # Créer le dossier pour les fichiers du challenge
-        challenge_id = None  # Pour stocker l'ID temporairement
-        try:
-            db_challenge = models.Challenge(**challenge_data)
-            db.add(db_challenge)
-            db.commit()
-            db.refresh(db_challenge)
-            challenge_id = db_challenge.id
-            
-            # Créer le dossier pour les fichiers
-            challenge_dir = get_challenge_dir(challenge_id)
-            os.makedirs(challenge_dir, exist_ok=True)
-            print(f"Dossier créé pour le challenge {challenge_id}: {challenge_dir}")
-            
-            print(f"Challenge sauvegardé en base de données avec l'ID: {db_challenge.id}")
-            print(f"Ressources du challenge: {db_challenge.resources}")
-            return db_challenge
-        except Exception as e:
-            print(f"Erreur lors de la création du challenge: {str(e)}")
-            db.rollback()
-            # Nettoyer le dossier si la création échoue
-            if challenge_id:
-                challenge_dir = get_challenge_dir(challenge_id)
-                if os.path.exists(challenge_dir):
-                    shutil.rmtree(challenge_dir)
-            raise HTTPException(
-                status_code=500,
-                detail=f"Une erreur est survenue lors de la création du challenge: {str(e)}"
-            )
+        logger.info("Challenge %d créé", db_challenge.id)
+        return await get_challenge(db, db_challenge.id, with_files=True)
     except Exception as e:
-        print(f"Erreur lors de la création du challenge: {str(e)}")
-        db.rollback()
+        logger.exception("Erreur lors de la création du challenge")
+        await db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Une erreur est survenue lors de la création du challenge: {str(e)}"
         )
 
 @router.get("/", response_model=List[schemas.Challenge])
-def read_challenges(
+async def read_challenges(
+    response: Response,
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=1000),
     category: str = None,
     status: str = None,
     difficulty: str = None,
-    db: Session = Depends(get_db)
+    solved: Optional[bool] = None,
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    fields: Optional[str] = None,
+    view: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(models.Challenge)
+    """Liste des challenges.
+    
+    `view=summary` ne renvoie que les champs des cartes, `fields=` une liste
+    de champs au choix : les colonnes non demandées ne sont pas lues. Les
+    fichiers ne sont chargés que s'ils sont demandés (`fields=files`), et
+    `resources` est alors renvoyé tel qu'il est stocké, sans la liste des fichiers.
+    """
+    projection = parse_projection(
+        models.Challenge, schemas.Challenge, schemas.ChallengeSummary, fields, view,
+        relations=("files",)
+    )
+    filters = []
     if category:
-        query = query.filter(models.Challenge.category == category)
+        filters.append(models.Challenge.category == category)
     if status:
-        query = query.filter(models.Challenge.status == status)
+        # Le statut correspond à la colonne solved
+        if status not in ("solved", "unsolved"):
+            raise HTTPException(status_code=400, detail="Statut invalide (solved ou unsolved)")
+        solved = status == "solved"
+    if solved is not None:
+        filters.append(models.Challenge.solved == solved)
     if difficulty:
-        query = query.filter(models.Challenge.difficulty == difficulty)
-    return query.offset(skip).limit(limit).all()
+        filters.append(models.Challenge.difficulty == difficulty)
+    # Les fichiers de toute la page sont chargés en une seule requête
+    options = (selectinload(models.Challenge.files),)
+    if projection:
+        options = (projection.columns(models.Challenge, "created_at"),)
+        if "files" in projection.fields:
+            options += (selectinload(models.Challenge.files),)
+    challenges = await keyset_page(
+        db, models.Challenge, filters, response, limit,
+        cursor=cursor, skip=skip, with_total=with_total,
+        count_key=(category, solved, difficulty),
+        options=options
+    )
+    if projection:
+        return projected_response(challenges, projection, response)
+    return challenges
 
 @router.get("/{challenge_id}", response_model=schemas.Challenge)
-def read_challenge(challenge_id: int, db: Session = Depends(get_db)):
-    db_challenge = db.query(models.Challenge).filter(models.Challenge.id == challenge_id).first()
+async def read_challenge(challenge_id: int, db: AsyncSession = Depends(get_db)):
+    db_challenge = await get_challenge(db, challenge_id, with_files=True)
     if db_challenge is None:
         raise HTTPException(status_code=404, detail="Challenge non trouvé")
     return db_challenge
 
-@router.post("/{challenge_id}/files", response_model=dict)
+# Le corps est lu par MultipartFileStream : schéma déclaré à la main pour la documentation
+UPLOAD_REQUEST_BODY = {
+    "required": True,
+    "content": {"multipart/form-data": {"schema": {
+        "type": "object",
+        "properties": {"file": {"type": "string", "format": "binary"}},
+        "required": ["file"],
+    }}},
+}
+# Marge pour les délimiteurs et en-têtes multipart dans le contrôle de Content-Length
+MULTIPART_OVERHEAD = 64 * 1024
+
+@router.post("/{challenge_id}/files", response_model=dict, openapi_extra={"requestBody": UPLOAD_REQUEST_BODY})
 async def upload_file(
     challenge_id: int,
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(get_db)
 ):
+    """Upload multipart (champ `file`), lu et haché au fil de la requête.
+
+    Un fichier de plus de MAX_FILE_SIZE est refusé (413) d'après Content-Length
+    s'il est annoncé, sinon dès que la limite est dépassée pendant la lecture.
+    Pour les gros fichiers ou les connexions instables : /uploads (reprenable).
+    """
     try:
-        print(f"Tentative d'upload d'un fichier pour le challenge {challenge_id}")
-        print(f"Nom du fichier: {file.filename}")
-        print(f"Type de contenu: {file.content_type}")
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_FILE_SIZE + MULTIPART_OVERHEAD:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Le fichier est trop volumineux (max {MAX_FILE_SIZE} octets)"
+            )
         
-        challenge = db.query(models.Challenge).filter(models.Challenge.id == challenge_id).first()
+        challenge = await db.get(models.Challenge, challenge_id)
         if not challenge:
-            print(f"Challenge {challenge_id} non trouvé")
             raise HTTPException(status_code=404, detail="Challenge non trouvé")
         
-        print(f"Ressources actuelles du challenge: {challenge.resources}")
-        
-        # S'assurer que la structure des ressources est correcte
-        resources = ensure_challenge_resources(challenge)
+        # Valider le nom avant de lire le contenu
+        upload = MultipartFileStream(request)
+        filename = await upload.open()
+        logger.debug("Upload du fichier %s pour le challenge %d", filename, challenge_id)
+        validate_filename(filename)
         
-        # Valider le fichier
-        validate_file(file)
-        
-        # Créer le dossier du challenge
-        challenge_dir = get_challenge_dir(challenge_id)
-        print(f"Création du dossier du challenge: {challenge_dir}")
+        # Sauvegarder le fichier par morceaux, sans bloquer la boucle d'événements
+        tmp_path = blob_store.temp_path()
         try:
-            os.makedirs(challenge_dir, exist_ok=True)
+            result = await save_stream(upload.chunks(), tmp_path, MAX_FILE_SIZE)
+            logger.debug("Fichier reçu: %d octets, sha256 %s", result.size, result.sha256)
+        except HTTPException:
+            raise
         except Exception as e:
-            print(f"Erreur lors de la création du dossier: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Erreur lors de la création du dossier: {str(e)}")
-        
-        # Générer un nom de fichier unique
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{timestamp}_{file.filename}"
-        file_path = os.path.join(challenge_dir, filename)
-        print(f"Chemin du fichier: {file_path}")
-        
-        # Sauvegarder le fichier
-        try:
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            print(f"Fichier sauvegardé avec succès à {file_path}")
-        except Exception as e:
-            print(f"Erreur lors de la sauvegarde du fichier: {str(e)}")
+            logger.exception("Erreur lors de la sauvegarde du fichier")
             raise HTTPException(status_code=500, detail=f"Erreur lors de la sauvegarde du fichier: {str(e)}")
         
-        file_info = {
-            'filename': filename,
-            'original_name': file.filename,
-            'uploaded_at': timestamp
-        }
-        
-        # Vérifier si le fichier existe déjà
-        existing_file = next(
-            (f for f in resources['files'] if f['filename'] == filename),
-            None
+        db_file = await attach_blob(
+            db, challenge_id, filename, result.sha256, result.size,
+            result.detected_type, tmp_path=tmp_path
         )
         
-        if existing_file:
-            print(f"Le fichier existe déjà dans les ressources: {existing_file}")
-            # Supprimer l'ancien fichier physique
-            old_file_path = os.path.join(challenge_dir, existing_file['filename'])
-            if os.path.exists(old_file_path):
-                os.remove(old_file_path)
-            # Mettre à jour les informations du fichier
-            existing_file.update(file_info)
-        else:
-            resources['files'].append(file_info)
-        
-        print(f"Ressources avant commit: {resources}")
         try:
-            db.commit()
-            db.refresh(challenge)
+            await db.commit()
         except Exception as e:
-            # Nettoyer le fichier en cas d'erreur de la base de données
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            # Le blob éventuellement orphelin sera récupéré par le GC
+            await db.rollback()
             raise HTTPException(status_code=500, detail=f"Erreur lors de la mise à jour de la base de données: {str(e)}")
         
-        print(f"Fichier uploadé avec succès: {file_info}")
+        # L'analyse tourne en arrière-plan, jamais dans la requête
+        await analysis_queue.enqueue(db_file.id, db_file.sha256, blob_store.path(db_file.sha256))
+        
+        file_info = schemas.File.model_validate(db_file).as_resource()
+        logger.info("Fichier %s ajouté au challenge %d", db_file.filename, challenge_id)
         return file_info
         
-    except HTTPException as e:
-        print(f"Erreur HTTP lors de l'upload du fichier: {str(e)}")
-        raise e
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Erreur inattendue lors de l'upload du fichier: {str(e)}")
+        logger.exception("Erreur inattendue lors de l'upload du fichier")
         raise HTTPException(status_code=500, detail=f"Une erreur inattendue est survenue: {str(e)}")
 
-@router.get("/{challenge_id}/files/{filename}")
-async def download_file(challenge_id: int, filename: str, db: Session = Depends(get_db)):
+@router.post("/{challenge_id}/uploads", response_model=schemas.UploadSession)
+async def create_upload(challenge_id: int, upload: schemas.UploadSessionCreate, db: AsyncSession = Depends(get_db)):
+    """Ouvre une session d'upload en streaming, reprenable par offset."""
+    challenge = await db.get(models.Challenge, challenge_id)
+    if not challenge:
+        raise HTTPException(status_code=404, detail="Challenge non trouvé")
+    
+    validate_filename(upload.filename)
+    if upload.size is not None and upload.size > MAX_STREAM_FILE_SIZE:
+        raise HTTPException(status_code=413, detail="Le fichier est trop volumineux")
+    
+    return resumable_uploads.create(challenge_id, upload.filename, upload.size)
+
+@router.get("/{challenge_id}/uploads/{upload_id}", response_model=schemas.UploadSession)
+def get_upload(challenge_id: int, upload_id: str):
+    """Retourne l'état d'une session d'upload, notamment l'offset à reprendre."""
+    meta = resumable_uploads.get(challenge_id, upload_id)
+    return resumable_uploads.status(upload_id, meta)
+
+@router.put("/{challenge_id}/uploads/{upload_id}", response_model=schemas.UploadSession)
+async def append_upload(challenge_id: int, upload_id: str, request: Request, offset: int = 0):
+    """Ajoute le corps de la requête au fichier partiel, à partir de `offset`."""
+    return await resumable_uploads.append(
+        challenge_id, upload_id, offset, request.stream(), MAX_STREAM_FILE_SIZE
+    )
+
+@router.post("/{challenge_id}/uploads/{upload_id}/complete", response_model=dict)
+async def complete_upload(challenge_id: int, upload_id: str, db: AsyncSession = Depends(get_db)):
+    """Finalise une session d'upload et attache le fichier au challenge."""
+    challenge = await db.get(models.Challenge, challenge_id)
+    if not challenge:
+        raise HTTPException(status_code=404, detail="Challenge non trouvé")
+    
+    meta = resumable_uploads.get(challenge_id, upload_id)
+    tmp_path = blob_store.temp_path()
+    result = await resumable_uploads.finish(challenge_id, upload_id, tmp_path)
+    
+    db_file = await attach_blob(
+        db, challenge_id, meta['filename'], result.sha256, result.size,
+        result.detected_type, tmp_path=tmp_path
+    )
     try:
-        print(f"Tentative de téléchargement du fichier {filename} pour le challenge {challenge_id}")
-        challenge = db.query(models.Challenge).filter(models.Challenge.id == challenge_id).first()
-        if not challenge:
-            print(f"Challenge {challenge_id} non trouvé")
-            raise HTTPException(status_code=404, detail="Challenge non trouvé")
-        
-        print(f"Ressources du challenge: {challenge.resources}")
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la mise à jour de la base de données: {str(e)}")
+    await analysis_queue.enqueue(db_file.id, db_file.sha256, blob_store.path(db_file.sha256))
+    return schemas.File.model_validate(db_file).as_resource()
+
+@router.post("/{challenge_id}/files/by-hash", response_model=dict)
+async def attach_file_by_hash(challenge_id: int, attach: schemas.BlobAttach, db: AsyncSession = Depends(get_db)):
+    """Attache un contenu déjà présent dans le blob store, sans le ré-uploader."""
+    challenge = await db.get(models.Challenge, challenge_id)
+    if not challenge:
+        raise HTTPException(status_code=404, detail="Challenge non trouvé")
+    
+    validate_filename(attach.filename)
+    blob = await blob_store.get(db, attach.sha256.lower())
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Contenu inconnu, le fichier doit être uploadé")
+    
+    db_file = await attach_blob(db, challenge_id, attach.filename, blob.sha256, blob.size, blob.detected_type)
+    await db.commit()
+    # Le contenu est connu : l'analyse vient en général du cache
+    await analysis_queue.enqueue(db_file.id, db_file.sha256, blob_store.path(db_file.sha256))
+    return schemas.File.model_validate(db_file).as_resource()
+
+@router.post("/blobs/gc", response_model=dict)
+async def collect_blobs(db: AsyncSession = Depends(get_db)):
+    """Supprime les contenus qui ne sont plus référencés par aucun challenge."""
+    return await blob_store.gc(db)
+
+@router.delete("/{challenge_id}/uploads/{upload_id}")
+async def abort_upload(challenge_id: int, upload_id: str):
+    """Abandonne une session d'upload et supprime le fichier partiel."""
+    resumable_uploads.get(challenge_id, upload_id)
+    await asyncio.to_thread(resumable_uploads.discard, upload_id)
+    return {"message": "Upload annulé"}
+
+@router.api_route("/{challenge_id}/files/{filename}", methods=["GET", "HEAD"])
+async def download_file(challenge_id: int, filename: str, request: Request, db: AsyncSession = Depends(get_db)):
+    try:
+        logger.debug("Téléchargement du fichier %s du challenge %d", filename, challenge_id)
+        db_file = await get_challenge_file(db, challenge_id, filename)
         
-        resources = ensure_challenge_resources(challenge)
+        if not db_file:
+            challenge = await db.get(models.Challenge, challenge_id)
+            if not challenge:
+                raise HTTPException(status_code=404, detail="Challenge non trouvé")
+            raise HTTPException(status_code=404, detail="Fichier non trouvé")
         
-        file_info = next(
-            (f for f in resources['files'] if f['filename'] == filename),
-            None
-        )
+        # Le contenu d'un blob est immuable : son hash sert d'ETag fort
+        etag = strong_etag(db_file.sha256) if db_file.sha256 else None
+        headers = {
+            'Content-Disposition': f'attachment; filename="{db_file.name}"',
+            'Last-Modified': http_date(db_file.created_at)
+        }
+        if etag:
+            headers['ETag'] = etag
+            headers['Cache-Control'] = 'private, max-age=31536000, immutable'
         
-        if not file_info:
-            print(f"Fichier {filename} non trouvé dans les ressources du challenge {challenge_id}")
-            print(f"Liste des fichiers disponibles: {[f['filename'] for f in resources['files']]}")
-            raise HTTPException(status_code=404, detail="Fichier non trouvé")
+        if is_not_modified(request.headers, etag, db_file.created_at):
+            return Response(status_code=304, headers={k: v for k, v in headers.items() if k != 'Content-Disposition'})
         
         # Construire le chemin du fichier
-        challenge_dir = get_challenge_dir(challenge_id)
-        file_path = os.path.join(challenge_dir, filename)
-        print(f"Chemin du fichier: {file_path}")
+        file_path = resolve_file_path(db_file)
         
         if not os.path.exists(file_path):
-            print(f"Le fichier n'existe pas à l'emplacement: {file_path}")
+            logger.warning("Le fichier n'existe pas à l'emplacement: %s", file_path)
             raise HTTPException(status_code=404, detail="Le fichier n'existe pas sur le serveur")
         
-        # Vérifier le type MIME du fichier
-        content_type, _ = mimetypes.guess_type(file_path)
+        # Type MIME calculé une seule fois puis conservé avec le fichier
+        content_type = db_file.content_type
         if not content_type:
-            content_type = 'application/octet-stream'
-        
-        print(f"Type MIME du fichier: {content_type}")
+            content_type = guess_content_type(db_file.name)
+            db_file.content_type = content_type
+            await db.commit()
         
+        # FileResponse gère Range (y compris multi-range) et If-Range
         return FileResponse(
             file_path,
-            filename=file_info['original_name'],
+            filename=db_file.name,
             media_type=content_type,
-            headers={
-                'Content-Disposition': f'attachment; filename="{file_info["original_name"]}"'
-            }
+            headers=headers
         )
         
-    except HTTPException as e:
-        print(f"Erreur HTTP lors du téléchargement du fichier: {str(e)}")
-        raise e
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Erreur inattendue lors du téléchargement du fichier: {str(e)}")
+        logger.exception("Erreur inattendue lors du téléchargement du fichier")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/{challenge_id}/files/{filename}/analysis", response_model=schemas.FileAnalysis)
+async def get_file_analysis(challenge_id: int, filename: str, db: AsyncSession = Depends(get_db)):
+    """Retourne l'état et les résultats (éventuellement partiels) de l'analyse."""
+    db_file = await get_challenge_file(db, challenge_id, filename)
+    if not db_file:
+        raise HTTPException(status_code=404, detail="Fichier non trouvé")
+    
+    # Analyse en cours : avancement lu sur le job, la base n'est écrite qu'à la fin
+    job = analysis_queue.running(analysis_key(db_file))
+    if job is not None:
+        results = job.snapshot()
+    elif not db_file.analysis_results:
+        return {"filename": filename, "status": "not_started"}
+    else:
+        results = json.loads(db_file.analysis_results)
+    return {
+        "filename": filename,
+        "status": results.get("status", "done"),
+        "job_id": results.get("job_id"),
+        "results": results
+    }
+
+@router.post("/{challenge_id}/files/{filename}/analysis", response_model=schemas.AnalysisJob)
+async def start_file_analysis(challenge_id: int, filename: str, force: bool = False, db: AsyncSession = Depends(get_db)):
+    """(Re)lance l'analyse d'un fichier ; `force` ignore le cache par contenu."""
+    db_file = await get_challenge_file(db, challenge_id, filename)
+    if not db_file:
+        raise HTTPException(status_code=404, detail="Fichier non trouvé")
+    
+    if db_file.storage == 'blob':
+        job = await analysis_queue.enqueue(db_file.id, db_file.sha256, blob_store.path(db_file.sha256), force=force)
+    else:
+        # Ancien stockage : pas de hash, donc pas de cache
+        job = await analysis_queue.enqueue(db_file.id, analysis_key(db_file), resolve_file_path(db_file), force=True)
+    return job.as_dict()
+
+def analysis_key(db_file: models.File) -> str:
+    """Clé de l'analyse d'un fichier : son contenu, ou son id pour l'ancien stockage."""
+    return db_file.sha256 if db_file.storage == 'blob' else f"legacy:{db_file.id}"
+
+async def get_archive_file(db: AsyncSession, challenge_id: int, filename: str):
+    """Fichier de challenge et son chemin sur disque, pour la lecture de son contenu."""
+    db_file = await get_challenge_file(db, challenge_id, filename)
+    if not db_file:
+        raise HTTPException(status_code=404, detail="Fichier non trouvé")
+    file_path = resolve_file_path(db_file)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="Le fichier n'existe pas sur le serveur")
+    return db_file, file_path
+
+@router.get("/{challenge_id}/files/{filename}/members", response_model=schemas.ArchiveListing)
+async def list_archive_members(
+    challenge_id: int,
+    filename: str,
+    archive: str = Query("", description="Archive imbriquée, par exemple `interne.zip` ou `a.zip!/b.tar`"),
+    prefix: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=10000),
+    db: AsyncSession = Depends(get_db)
+):
+    """Liste les membres d'une archive sans l'extraire ; l'index est mis en cache par contenu."""
+    db_file, file_path = await get_archive_file(db, challenge_id, filename)
+    key = await asyncio.to_thread(content_id, db_file, file_path)
+    index = await asyncio.to_thread(get_index, file_path, db_file.name, key, archive)
+    
+    members = index["members"].values()
+    if prefix:
+        members = [member for member in members if member["name"].startswith(prefix)]
+    members = list(members)
+    return {
+        "format": index["format"],
+        "archive": archive,
+        "count": len(members),
+        "truncated": index["truncated"],
+        "members": members[offset:offset + limit]
+    }
+
+@router.get("/{challenge_id}/files/{filename}/members/content")
+async def download_archive_member(
+    challenge_id: int,
+    filename: str,
+    path: str = Query(..., description=f"Membre à lire, par exemple `dossier/flag.txt` ou `interne.zip{SEPARATOR}flag.txt`"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Lit un seul membre d'une archive, en flux, sans extraire le reste."""
+    db_file, file_path = await get_archive_file(db, challenge_id, filename)
+    key = await asyncio.to_thread(content_id, db_file, file_path)
+    archive_format, member = await asyncio.to_thread(find_member, file_path, db_file.name, key, path)
+    
+    name = os.path.basename(member["name"])
+    headers = {'Content-Disposition': f'attachment; filename="{name}"'}
+    # La taille d'un .gz n'est connue que modulo 2^32 : pas de Content-Length
+    if member["size"] is not None and archive_format != "gzip":
+        headers['Content-Length'] = str(member["size"])
+    # Générateur synchrone : Starlette le parcourt dans un thread
+    return StreamingResponse(
+        iter_member(file_path, db_file.name, path),
+        media_type=guess_content_type(name),
+        headers=headers
+    )
+
 @router.delete("/{challenge_id}/files/{filename}")
-async def delete_file(challenge_id: int, filename: str, db: Session = Depends(get_db)):
+async def delete_file(challenge_id: int, filename: str, db: AsyncSession = Depends(get_db)):
     try:
-        challenge = db.query(models.Challenge).filter(models.Challenge.id == challenge_id).first()
-        if not challenge:
-            raise HTTPException(status_code=404, detail="Challenge non trouvé")
-        
-        if not challenge.resources or 'files' not in challenge.resources:
-            raise HTTPException(status_code=404, detail="Aucun fichier trouvé")
-        
-        file_info = next(
-            (f for f in challenge.resources['files'] if f['filename'] == filename),
-            None
-        )
+        db_file = await get_challenge_file(db, challenge_id, filename)
         
-        if not file_info:
+        if not db_file:
             raise HTTPException(status_code=404, detail="Fichier non trouvé")
         
-        # Supprimer le fichier physique
-        file_path = os.path.join(get_challenge_dir(challenge_id), filename)
-        try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            else:
-                print(f"Avertissement: Le fichier {file_path} n'existe pas sur le disque")
-        except Exception as e:
-            print(f"Erreur lors de la suppression du fichier {file_path}: {str(e)}")
-            # On continue même si la suppression physique échoue
-        
-        # Mettre à jour les ressources
-        challenge.resources['files'] = [
-            f for f in challenge.resources['files'] 
-            if f['filename'] != filename
-        ]
+        # Libérer le stockage du fichier
+        await release_file(db, db_file)
+        await db.delete(db_file)
         
         # Si le dossier du challenge est vide, le supprimer
         challenge_dir = get_challenge_dir(challenge_id)
@@ -350,19 +570,19 @@ async def delete_file(challenge_id: int, filename: str, db: Session = Depends(ge
             if os.path.exists(challenge_dir) and not os.listdir(challenge_dir):
                 os.rmdir(challenge_dir)
         except Exception as e:
-            print(f"Erreur lors de la suppression du dossier vide {challenge_dir}: {str(e)}")
+            logger.warning("Erreur lors de la suppression du dossier vide %s: %s", challenge_dir, e)
         
-        db.commit()
+        await db.commit()
         return {"message": "Fichier supprimé avec succès"}
         
     except Exception as e:
-        print(f"Erreur lors de la suppression du fichier: {str(e)}")
+        logger.exception("Erreur lors de la suppression du fichier")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/{challenge_id}/check-flag", response_model=dict)
-def check_flag(challenge_id: int, flag_check: schemas.FlagCheck, db: Session = Depends(get_db)):
+async def check_flag(challenge_id: int, flag_check: schemas.FlagCheck, db: AsyncSession = Depends(get_db)):
     try:
-        challenge = db.query(models.Challenge).filter(models.Challenge.id == challenge_id).first()
+        challenge = await db.get(models.Challenge, challenge_id)
         if not challenge:
             raise HTTPException(status_code=404, detail="Challenge non trouvé")
         
@@ -372,60 +592,72 @@ def check_flag(challenge_id: int, flag_check: schemas.FlagCheck, db: Session = D
         
         return {"status": "error", "message": "Flag incorrect"}
     except Exception as e:
-        print(f"Erreur lors de la vérification du flag: {str(e)}")
+        logger.exception("Erreur lors de la vérification du flag")
         raise HTTPException(
             status_code=500,
             detail=f"Une erreur est survenue lors de la vérification du flag: {str(e)}"
         )
 
 @router.delete("/{challenge_id}")
-async def delete_challenge(challenge_id: int, db: Session = Depends(get_db)):
+async def delete_challenge(challenge_id: int, db: AsyncSession = Depends(get_db)):
     try:
-        challenge = db.query(models.Challenge).filter(models.Challenge.id == challenge_id).first()
+        challenge = await db.get(models.Challenge, challenge_id)
         if not challenge:
             raise HTTPException(status_code=404, detail="Challenge non trouvé")
         
-        # Supprimer le dossier des fichiers du challenge
+        # Retirer les références aux blobs du challenge
+        blob_refs = (await db.execute(
+            select(models.File.sha256, func.count(models.File.id)).where(
+                models.File.challenge_id == challenge_id,
+                models.File.storage == 'blob'
+            ).group_by(models.File.sha256)
+        )).all()
+        for sha256, count in blob_refs:
+            await blob_store.decref(db, sha256, count)
+        await db.execute(
+            delete(models.File).where(models.File.challenge_id == challenge_id)
+            .execution_options(synchronize_session=False)
+        )
+        
+        # Supprimer le dossier des anciens fichiers du challenge
         challenge_dir = get_challenge_dir(challenge_id)
         if os.path.exists(challenge_dir):
             try:
-                shutil.rmtree(challenge_dir)
+                await asyncio.to_thread(shutil.rmtree, challenge_dir)
             except Exception as e:
-                print(f"Erreur lors de la suppression du dossier {challenge_dir}: {str(e)}")
+                logger.warning("Erreur lors de la suppression du dossier %s: %s", challenge_dir, e)
         
-        db.delete(challenge)
-        db.commit()
+        await stats.track(db, stats.snapshot(challenge), None)
+        await db.delete(challenge)
+        await db.commit()
         return {"message": "Challenge supprimé avec succès"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/{challenge_id}", response_model=schemas.Challenge)
-def update_challenge(challenge_id: int, challenge: schemas.ChallengeCreate, db: Session = Depends(get_db)):
+async def update_challenge(challenge_id: int, challenge: schemas.ChallengeCreate, db: AsyncSession = Depends(get_db)):
     try:
-        print(f"Tentative de mise à jour du challenge {challenge_id}")
-        db_challenge = db.query(models.Challenge).filter(models.Challenge.id == challenge_id).first()
+        logger.debug("Mise à jour du challenge %d", challenge_id)
+        db_challenge = await get_challenge(db, challenge_id, with_files=True)
         if db_challenge is None:
             raise HTTPException(status_code=404, detail="Challenge non trouvé")
         
         # Sauvegarder les ressources existantes
         existing_resources = db_challenge.resources or {}
-        print(f"Ressources existantes: {existing_resources}")
         
         # Mettre à jour les champs
         challenge_data = challenge.dict(exclude_unset=True)
-        print(f"Données de mise à jour: {challenge_data}")
         
         # Préserver les ressources existantes si elles ne sont pas dans les données de mise à jour
         if 'resources' not in challenge_data:
             challenge_data['resources'] = existing_resources
         else:
             # Fusionner les ressources existantes avec les nouvelles
+            # (les fichiers sont gérés par les routes /files et ignorés ici)
+            challenge_data['resources'] = clean_resources(challenge_data['resources'])
             if not challenge_data['resources']:
                 challenge_data['resources'] = existing_resources
             else:
-                # Préserver les fichiers existants
-                if 'files' in existing_resources and 'files' not in challenge_data['resources']:
-                    challenge_data['resources']['files'] = existing_resources['files']
                 # Préserver les liens existants
                 if 'links' in existing_resources and 'links' not in challenge_data['resources']:
                     challenge_data['resources']['links'] = existing_resources['links']
@@ -433,36 +665,100 @@ def update_challenge(challenge_id: int, challenge: schemas.ChallengeCreate, db:
                 if 'commands' in existing_resources and 'commands' not in challenge_data['resources']:
                     challenge_data['resources']['commands'] = existing_resources['commands']
         
-        print(f"Données finales pour la mise à jour: {challenge_data}")
-        
+        before = stats.snapshot(db_challenge)
         for key, value in challenge_data.items():
             setattr(db_challenge, key, value)
+        await stats.track(db, before, stats.snapshot(db_challenge))
         
-        db.commit()
-        db.refresh(db_challenge)
-        print(f"Challenge mis à jour avec succès. Nouvelles ressources: {db_challenge.resources}")
+        await db.commit()
+        await db.refresh(db_challenge, ["updated_at"])
+        logger.info("Challenge %d mis à jour", challenge_id)
         return db_challenge
+    except HTTPException:
+        raise
+    except StaleDataError:
+        await db.rollback()
+        raise conflict(STALE_CONFLICT)
     except Exception as e:
-        print(f"Erreur lors de la mise à jour du challenge: {str(e)}")
-        db.rollback()
+        logger.exception("Erreur lors de la mise à jour du challenge")
+        await db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Une erreur est survenue lors de la mise à jour du challenge: {str(e)}"
         )
 
+@router.patch("/{challenge_id}", response_model=schemas.Challenge)
+async def patch_challenge(
+    challenge_id: int,
+    patch: schemas.ChallengePatch,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Mise à jour partielle d'un challenge.
+
+    `resources_patch` applique des opérations JSON Patch (RFC 6902) aux
+    ressources actuelles, au lieu de renvoyer et fusionner tout le document.
+    Avec `If-Match` (ou `version`), la mise à jour est refusée (409) si le
+    challenge a changé depuis cette version.
+    """
+    db_challenge = await get_challenge(db, challenge_id, with_files=True)
+    if db_challenge is None:
+        raise HTTPException(status_code=404, detail="Challenge non trouvé")
+    check_version(
+        db_challenge.version, if_match, patch.version, VERSION_CONFLICT, resource=f"challenge-{challenge_id}"
+    )
+    
+    changes = patch.dict(exclude_unset=True, exclude={"version", "resources_patch"})
+    for field in ("title", "description", "category", "solved"):
+        if field in changes and changes[field] is None:
+            raise HTTPException(status_code=400, detail=f"Le champ {field} ne peut pas être nul")
+    if "resources" in changes:
+        if patch.resources_patch is not None:
+            raise HTTPException(status_code=400, detail="Envoyez resources ou resources_patch, pas les deux")
+        changes["resources"] = clean_resources(changes["resources"])
+    elif patch.resources_patch is not None:
+        # Les fichiers se gèrent via /challenges/{id}/files
+        if any(op.path == "/files" or op.path.startswith("/files/") for op in patch.resources_patch):
+            raise HTTPException(status_code=400, detail="Les fichiers ne se modifient pas par resources_patch")
+        changes["resources"] = apply_json_patch(clean_resources(db_challenge.resources), patch.resources_patch)
+    if "solved" in changes and changes["solved"] != db_challenge.solved:
+        changes["solved_at"] = datetime.utcnow() if changes["solved"] else None
+    
+    before = stats.snapshot(db_challenge)
+    for key, value in changes.items():
+        setattr(db_challenge, key, value)
+    await stats.track(db, before, stats.snapshot(db_challenge))
+    try:
+        await db.commit()
+    except StaleDataError:
+        await db.rollback()
+        raise conflict(STALE_CONFLICT)
+    await db.refresh(db_challenge, ["updated_at"])
+    response.headers["ETag"] = version_etag(f"challenge-{challenge_id}", db_challenge.version)
+    return db_challenge
+
 @router.patch("/{challenge_id}/toggle-solved", response_model=schemas.Challenge)
-def toggle_challenge_solved(challenge_id: int, db: Session = Depends(get_db)):
+async def toggle_challenge_solved(challenge_id: int, db: AsyncSession = Depends(get_db)):
     try:
-        db_challenge = db.query(models.Challenge).filter(models.Challenge.id == challenge_id).first()
+        db_challenge = await get_challenge(db, challenge_id, with_files=True)
         if db_challenge is None:
             raise HTTPException(status_code=404, detail="Challenge non trouvé")
         
+        before = stats.snapshot(db_challenge)
         db_challenge.solved = not db_challenge.solved
-        db.commit()
-        db.refresh(db_challenge)
+        db_challenge.solved_at = datetime.utcnow() if db_challenge.solved else None
+        await stats.track(db, before, stats.snapshot(db_challenge))
+        await db.commit()
+        await db.refresh(db_challenge, ["updated_at"])
         return db_challenge
+    except HTTPException:
+        raise
+    except StaleDataError:
+        await db.rollback()
+        raise conflict(STALE_CONFLICT)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Une erreur est survenue lors de la mise à jour du statut du challenge: {str(e)}"
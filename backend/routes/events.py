@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from .. import schemas
+from ..events import PUBLISHED_TABLES, event_bus, stream_events
+
+router = APIRouter(
+    prefix="/events",
+    tags=["events"]
+)
+
+def parse_tables(tables: Optional[str]) -> Optional[set]:
+    if not tables:
+        return None
+    selected = {table.strip() for table in tables.split(",") if table.strip()}
+    unknown = selected - set(PUBLISHED_TABLES)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Table(s) inconnue(s): {', '.join(sorted(unknown))} (disponibles: {', '.join(PUBLISHED_TABLES)})"
+        )
+    return selected
+
+@router.get("/")
+async def stream_changes(
+    since: Optional[int] = Query(None, description="Dernière version reçue ; par défaut, seulement les nouveaux changements"),
+    tables: Optional[str] = Query(None, description="Tables à suivre, séparées par des virgules"),
+    last_event_id: Optional[str] = Header(None)
+):
+    """Flux Server-Sent Events des changements (table, id, op, version).
+
+    Événements : `ready` à la connexion, `change` pour chaque ligne modifiée
+    (id nul pour une modification en masse) et `reset` lorsque des changements
+    ont été perdus : le client recharge alors ses listes. À la reconnexion,
+    EventSource renvoie `Last-Event-ID` et reprend là où il s'était arrêté.
+    """
+    selected = parse_tables(tables)
+    if since is None and last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    return StreamingResponse(
+        stream_events(since, selected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/changes", response_model=schemas.ChangeFeed)
+async def list_changes(since: int, tables: Optional[str] = None):
+    """Changements postérieurs à `since`, pour les clients qui ne gardent pas de connexion ouverte."""
+    selected = parse_tables(tables)
+    complete, events = event_bus.since(since)
+    if not complete:
+        return {"version": event_bus.version, "reset": True, "events": []}
+    return {
+        "version": events[-1]["version"] if events else since,
+        "reset": False,
+        "events": [event for event in events if selected is None or event["table"] in selected]
+    }
@@ -1,71 +1,343 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from .. import models, schemas
-from ..database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import case, delete, exists, func, insert, literal, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from collections import defaultdict
+from datetime import datetime
+from typing import List, Optional
+from .. import models, revisions, schemas
+from ..database import get_db, serialize
+from ..projection import parse_projection, projected_response
 
 router = APIRouter(
     prefix="/folders",
     tags=["folders"]
 )
 
+# Garde-fou contre les cycles éventuels dans parent_id
+MAX_TREE_DEPTH = 64
+
+def folder_subtree_cte(root_id: Optional[int], depth: int):
+    """CTE récursive des dossiers sous `root_id` (ou sous la racine), avec leur profondeur."""
+    if root_id is None:
+        base = select(models.Folder.id, literal(0).label("depth")).where(models.Folder.parent_id.is_(None))
+    else:
+        base = select(models.Folder.id, literal(0).label("depth")).where(models.Folder.id == root_id)
+    tree = base.cte("folder_tree", recursive=True)
+    return tree.union_all(
+        select(models.Folder.id, (tree.c.depth + 1).label("depth"))
+        .where(models.Folder.parent_id == tree.c.id, tree.c.depth < depth)
+    )
+
+def folder_subtree_ids(root_id: int):
+    """CTE récursive des identifiants du dossier `root_id` et de tous ses descendants.
+
+    UNION (et non UNION ALL) élimine les doublons : la récursion s'arrête
+    même si les données contiennent un cycle, sans limite de profondeur.
+    """
+    tree = select(models.Folder.id).where(models.Folder.id == root_id).cte("subtree", recursive=True)
+    return tree.union(select(models.Folder.id).where(models.Folder.parent_id == tree.c.id))
+
+async def build_folder_tree(db: AsyncSession, root_id: Optional[int], depth: int, titles_only: bool) -> List[dict]:
+    """Charge un sous-arbre de dossiers et ses notes en un nombre constant de requêtes."""
+    tree = folder_subtree_cte(root_id, depth)
+    folder_rows = (await db.execute(
+        select(
+            models.Folder.id, models.Folder.name, models.Folder.parent_id,
+            models.Folder.created_at, models.Folder.updated_at, tree.c.depth
+        ).join(tree, tree.c.id == models.Folder.id)
+    )).all()
+    
+    note_columns = [
+        models.Note.id, models.Note.title, models.Note.tags, models.Note.is_favorite,
+        models.Note.folder_id, models.Note.parent_id, models.Note.version,
+        models.Note.created_at, models.Note.updated_at
+    ]
+    if not titles_only:
+        note_columns.append(models.Note.content)
+    note_rows = (await db.execute(
+        select(*note_columns).where(models.Note.folder_id.in_(select(tree.c.id)))
+    )).mappings().all()
+    
+    folders = {}
+    for row in folder_rows:
+        if row.id in folders:
+            continue
+        folders[row.id] = {
+            "id": row.id,
+            "name": row.name,
+            "parent_id": row.parent_id,
+            "created_at": row.created_at,
+            "updated_at": row.updated_at,
+            "depth": row.depth,
+            "children": [],
+            "notes": [],
+            "has_children": False,
+        }
+    
+    # Dossiers au bord de la profondeur demandée : ont-ils des sous-dossiers ?
+    edge_ids = [f["id"] for f in folders.values() if f["depth"] == depth]
+    if edge_ids:
+        for parent_id in await db.scalars(
+            select(models.Folder.parent_id).where(models.Folder.parent_id.in_(edge_ids)).distinct()
+        ):
+            folders[parent_id]["has_children"] = True
+    
+    notes = {row["id"]: {**row, "children": []} for row in note_rows}
+    for note in notes.values():
+        parent = notes.get(note["parent_id"])
+        if parent is not None and parent["folder_id"] == note["folder_id"]:
+            parent["children"].append(note)
+        else:
+            folders[note["folder_id"]]["notes"].append(note)
+    
+    roots = []
+    for folder in folders.values():
+        parent = folders.get(folder["parent_id"])
+        if parent is not None and folder["depth"] > 0:
+            parent["children"].append(folder)
+            parent["has_children"] = True
+        else:
+            roots.append(folder)
+    return roots
+
+async def load_folders_with_contents(db: AsyncSession) -> List[models.Folder]:
+    """Tous les dossiers, avec sous-dossiers, notes et sous-notes déjà chargés.
+
+    Deux requêtes au total : les collections sont remplies en mémoire, si bien
+    que la sérialisation ne déclenche aucun chargement paresseux par dossier.
+    """
+    folders = (await db.scalars(select(models.Folder))).all()
+    notes = (await db.scalars(select(models.Note))).all()
+    
+    subfolders = defaultdict(list)
+    for folder in folders:
+        subfolders[folder.parent_id].append(folder)
+    folder_notes = defaultdict(list)
+    subnotes = defaultdict(list)
+    for note in notes:
+        folder_notes[note.folder_id].append(note)
+        subnotes[note.parent_id].append(note)
+    
+    for folder in folders:
+        set_committed_value(folder, "children", subfolders[folder.id])
+        set_committed_value(folder, "notes", folder_notes[folder.id])
+    for note in notes:
+        set_committed_value(note, "children", subnotes[note.id])
+    return folders
+
 @router.post("/", response_model=schemas.Folder)
-def create_folder(folder: schemas.FolderCreate, db: Session = Depends(get_db)):
+async def create_folder(folder: schemas.FolderCreate, db: AsyncSession = Depends(get_db)):
     db_folder = models.Folder(**folder.dict())
     db.add(db_folder)
-    db.commit()
-    db.refresh(db_folder)
-    return db_folder
+    await db.commit()
+    await db.refresh(db_folder)
+    return await serialize(db, schemas.Folder, db_folder)
 
 @router.get("/", response_model=List[schemas.Folder])
-def get_folders(db: Session = Depends(get_db)):
-    return db.query(models.Folder).all()
+async def get_folders(
+    fields: Optional[str] = None,
+    view: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Tous les dossiers avec leurs sous-dossiers et leurs notes.
+
+    `view=summary` ou `fields=` renvoient une liste plate des seules colonnes
+    demandées, sans charger les sous-dossiers ni les notes.
+    """
+    projection = parse_projection(models.Folder, schemas.Folder, schemas.FolderSummary, fields, view)
+    if projection:
+        folders = await db.scalars(
+            select(models.Folder).options(projection.columns(models.Folder)).order_by(models.Folder.id)
+        )
+        return projected_response(folders.all(), projection)
+    folders = await load_folders_with_contents(db)
+    return await serialize(db, schemas.Folder, folders)
+
+@router.get("/tree", response_model=List[schemas.FolderTreeNode])
+async def get_folder_tree(
+    root_id: Optional[int] = None,
+    depth: int = Query(MAX_TREE_DEPTH, ge=0, le=MAX_TREE_DEPTH),
+    titles_only: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """Arborescence des dossiers et de leurs notes, matérialisée en mémoire.
+
+    `depth` limite le nombre de niveaux sous la racine ; `titles_only`
+    n'inclut pas le contenu des notes.
+    """
+    if root_id is not None:
+        if await db.get(models.Folder, root_id) is None:
+            raise HTTPException(status_code=404, detail="Folder not found")
+    return await build_folder_tree(db, root_id, depth, titles_only)
 
 @router.get("/{folder_id}", response_model=schemas.Folder)
-def get_folder(folder_id: int, db: Session = Depends(get_db)):
-    folder = db.query(models.Folder).filter(models.Folder.id == folder_id).first()
+async def get_folder(folder_id: int, db: AsyncSession = Depends(get_db)):
+    folder = await db.get(models.Folder, folder_id)
     if folder is None:
         raise HTTPException(status_code=404, detail="Folder not found")
-    return folder
+    return await serialize(db, schemas.Folder, folder)
 
 @router.put("/{folder_id}", response_model=schemas.Folder)
-def update_folder(folder_id: int, folder: schemas.FolderCreate, db: Session = Depends(get_db)):
-    db_folder = db.query(models.Folder).filter(models.Folder.id == folder_id).first()
+async def update_folder(folder_id: int, folder: schemas.FolderCreate, db: AsyncSession = Depends(get_db)):
+    db_folder = await db.get(models.Folder, folder_id)
     if db_folder is None:
         raise HTTPException(status_code=404, detail="Folder not found")
     
+    # Même contrôle que le déplacement : un dossier ne peut pas passer sous un de ses descendants
+    if folder.parent_id and folder.parent_id != db_folder.parent_id:
+        await check_target_folder(
+            db, folder_id, folder.parent_id,
+            "Cannot move a folder into itself or one of its subfolders"
+        )
+    
     for key, value in folder.dict().items():
         setattr(db_folder, key, value)
     
-    db.commit()
-    db.refresh(db_folder)
-    return db_folder
+    await db.commit()
+    await db.refresh(db_folder)
+    return await serialize(db, schemas.Folder, db_folder)
 
 @router.delete("/{folder_id}")
-def delete_folder(folder_id: int, db: Session = Depends(get_db)):
-    db_folder = db.query(models.Folder).filter(models.Folder.id == folder_id).first()
+async def delete_folder(folder_id: int, db: AsyncSession = Depends(get_db)):
+    db_folder = await db.get(models.Folder, folder_id)
     if db_folder is None:
         raise HTTPException(status_code=404, detail="Folder not found")
     
-    # Supprimer toutes les notes du dossier
-    db.query(models.Note).filter(models.Note.folder_id == folder_id).delete()
+    # Tout le sous-arbre est supprimé en quatre requêtes, dans une seule transaction
+    folder_ids = select(folder_subtree_ids(folder_id).c.id)
+    note_ids = select(models.Note.id).where(models.Note.folder_id.in_(folder_ids))
     
-    # Supprimer le dossier
-    db.delete(db_folder)
-    db.commit()
-    return {"message": "Folder deleted successfully"}
+    # Les sous-notes rangées hors du sous-arbre deviennent des notes racines
+    await db.execute(
+        update(models.Note)
+        .where(
+            models.Note.parent_id.in_(note_ids),
+            or_(models.Note.folder_id.is_(None), models.Note.folder_id.not_in(folder_ids))
+        )
+        .values(parent_id=None, version=models.Note.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(revisions.delete_for_notes(note_ids))
+    await db.execute(
+        delete(models.Note).where(models.Note.folder_id.in_(folder_ids))
+        .execution_options(synchronize_session=False)
+    )
+    notes = await changed_rows(db)
+    await db.execute(
+        delete(models.Folder).where(models.Folder.id.in_(folder_ids))
+        .execution_options(synchronize_session=False)
+    )
+    folders = await changed_rows(db)
+    await db.commit()
+    return {"message": "Folder deleted successfully", "folders": folders, "notes": notes}
+
+async def changed_rows(db: AsyncSession) -> int:
+    # rowcount n'est pas renseigné par sqlite3 pour les requêtes qui commencent par WITH
+    return await db.scalar(select(func.changes()))
+
+async def check_target_folder(db: AsyncSession, folder_id: int, target_id: Optional[int], detail: str):
+    """Vérifie que `target_id` existe et n'est pas dans le sous-arbre de `folder_id` (une requête)."""
+    subtree = folder_subtree_ids(folder_id)
+    target = (await db.execute(
+        select(models.Folder.id, exists().where(subtree.c.id == target_id))
+        .where(models.Folder.id == target_id)
+    )).first()
+    if target is None:
+        raise HTTPException(status_code=404, detail="New parent folder not found")
+    if target[1]:
+        raise HTTPException(status_code=400, detail=detail)
 
 @router.put("/{folder_id}/move")
-def move_folder(folder_id: int, new_parent_id: int, db: Session = Depends(get_db)):
-    db_folder = db.query(models.Folder).filter(models.Folder.id == folder_id).first()
+async def move_folder(folder_id: int, new_parent_id: Optional[int] = None, db: AsyncSession = Depends(get_db)):
+    """Déplace un dossier ; sans `new_parent_id` (ou 0), il devient une racine."""
+    db_folder = await db.get(models.Folder, folder_id)
     if db_folder is None:
         raise HTTPException(status_code=404, detail="Folder not found")
     
     if new_parent_id:
-        new_parent = db.query(models.Folder).filter(models.Folder.id == new_parent_id).first()
-        if new_parent is None:
-            raise HTTPException(status_code=404, detail="New parent folder not found")
+        await check_target_folder(
+            db, folder_id, new_parent_id,
+            "Cannot move a folder into itself or one of its subfolders"
+        )
+    
+    db_folder.parent_id = new_parent_id or None
+    await db.commit()
+    return {"message": "Folder moved successfully"}
+
+@router.post("/{folder_id}/copy")
+async def copy_folder(folder_id: int, target_parent_id: Optional[int] = None, db: AsyncSession = Depends(get_db)):
+    """Copie un dossier, ses sous-dossiers et leurs notes sous `target_parent_id`.
+
+    Sans `target_parent_id`, la copie est créée à côté de l'original. Les
+    copies reçoivent des identifiants décalés d'un offset commun, qui place
+    le plus petit identifiant copié juste après le plus grand existant ; les
+    liens parent/enfant sont recopiés en une requête INSERT ... SELECT par
+    table, et les identifiants ne croissent que du nombre de lignes copiées.
+    Si une copie concurrente a pris ces identifiants entre la lecture des
+    offsets et l'insertion, rien n'est écrit et la requête échoue en 409.
+    """
+    db_folder = await db.get(models.Folder, folder_id)
+    if db_folder is None:
+        raise HTTPException(status_code=404, detail="Folder not found")
+    
+    if target_parent_id:
+        await check_target_folder(
+            db, folder_id, target_parent_id,
+            "Cannot copy a folder into itself or one of its subfolders"
+        )
+    else:
+        target_parent_id = db_folder.parent_id
+    
+    Folder, Note = models.Folder, models.Note
+    subtree = folder_subtree_ids(folder_id)
+    folder_ids = select(subtree.c.id)
+    folder_offset = (
+        await db.scalar(select(func.max(Folder.id)))
+        - await db.scalar(select(func.min(subtree.c.id))) + 1
+    )
+    note_offset = await db.scalar(
+        select(func.coalesce(func.max(Note.id), 0) + 1
+               - func.coalesce(select(func.min(Note.id)).where(Note.folder_id.in_(folder_ids)).scalar_subquery(), 0))
+    )
+    now = datetime.utcnow()
+    root_name = db_folder.name
+    if target_parent_id == db_folder.parent_id:
+        root_name = f"{db_folder.name} (copy)"
     
-    db_folder.parent_id = new_parent_id
-    db.commit()
-    return {"message": "Folder moved successfully"} 
\ No newline at end of file
+    try:
+        await db.execute(insert(Folder).from_select(
+            ["id", "name", "parent_id", "created_at", "updated_at"],
+            select(
+                Folder.id + folder_offset,
+                case((Folder.id == folder_id, root_name), else_=Folder.name),
+                case((Folder.id == folder_id, target_parent_id), else_=Folder.parent_id + folder_offset),
+                literal(now), literal(now)
+            ).where(Folder.id.in_(folder_ids))
+        ))
+        folders = await changed_rows(db)
+        
+        # Une sous-note garde son parent s'il est copié lui aussi, sinon elle devient racine
+        note_ids = select(Note.id).where(Note.folder_id.in_(folder_ids))
+        await db.execute(insert(Note).from_select(
+            ["id", "title", "content", "tags", "is_favorite", "folder_id", "parent_id", "created_at", "updated_at"],
+            select(
+                Note.id + note_offset, Note.title, Note.content, Note.tags, Note.is_favorite,
+                Note.folder_id + folder_offset,
+                case((Note.parent_id.in_(note_ids), Note.parent_id + note_offset), else_=None),
+                literal(now), literal(now)
+            ).where(Note.folder_id.in_(folder_ids))
+        ))
+        notes = await changed_rows(db)
+        await db.commit()
+    except IntegrityError:
+        # Identifiants pris par une écriture concurrente : la copie peut être relancée
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Folder copy conflicted with a concurrent write, please retry")
+    return {
+        "message": "Folder copied successfully",
+        "id": folder_id + folder_offset,
+        "folders": folders,
+        "notes": notes
+    } 
\ No newline at end of file
@@ -1,52 +1,318 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from .. import models, schemas
-from ..database import get_db
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
+from sqlalchemy.orm.exc import StaleDataError
+from typing import List, Optional
+from .. import models, revisions, schemas
+from ..database import get_db, serialize
+from ..patching import check_version, conflict, version_etag
+from ..projection import Projection, parse_projection, projected_response
 
 router = APIRouter(
     prefix="/notes",
     tags=["notes"]
 )
 
+# Garde-fou contre les cycles éventuels dans parent_id
+MAX_NOTE_DEPTH = 64
+# Nombre d'identifiants par clause IN
+BATCH_SIZE = 500
+VERSION_CONFLICT = "Conflict: the note was modified since version {expected} (current version: {current})"
+STALE_CONFLICT = "Conflict: the note was modified during the update"
+INVALID_IF_MATCH = "Invalid If-Match: expected a version"
+
+def apply_text_edits(text: str, edits: List[schemas.TextEdit]) -> str:
+    """Applique des remplacements [start, end) -> text, dans l'ordre, chacun sur le résultat du précédent."""
+    for edit in edits:
+        end = edit.start if edit.end is None else edit.end
+        if not 0 <= edit.start <= end <= len(text):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Edit outside the text: [{edit.start}, {end}) for a length of {len(text)}"
+            )
+        text = text[:edit.start] + edit.text + text[end:]
+    return text
+
+def note_node(note: models.Note, include_content: bool, projection: Optional[Projection] = None) -> dict:
+    if projection:
+        node = {name: getattr(note, name) for name in projection.fields}
+        node["children"] = []
+        node["has_children"] = False
+        return node
+    return {
+        "id": note.id,
+        "title": note.title,
+        "content": note.content if include_content else None,
+        "tags": note.tags,
+        "is_favorite": note.is_favorite,
+        "folder_id": note.folder_id,
+        "parent_id": note.parent_id,
+        "version": note.version,
+        "created_at": note.created_at,
+        "updated_at": note.updated_at,
+        "children": [],
+        "has_children": False,
+    }
+
+async def load_note_levels(
+    db: AsyncSession,
+    roots: List[models.Note],
+    depth: int,
+    include_content: bool,
+    projection: Optional[Projection] = None
+) -> List[dict]:
+    """Charge les descendants niveau par niveau : une requête par niveau, pas par note.
+
+    Le contenu n'est chargé que si `include_content` est vrai ; avec une
+    projection, seules ses colonnes sont lues et exposées.
+    """
+    nodes = {note.id: note_node(note, include_content, projection) for note in roots}
+    level = list(nodes)
+    for _ in range(depth):
+        if not level:
+            break
+        next_level = []
+        for start in range(0, len(level), BATCH_SIZE):
+            query = select(models.Note).where(
+                models.Note.parent_id.in_(level[start:start + BATCH_SIZE])
+            ).order_by(models.Note.id)
+            if projection:
+                query = query.options(projection.columns(models.Note, "parent_id"))
+            elif not include_content:
+                query = query.options(defer(models.Note.content))
+            for child in await db.scalars(query):
+                if child.id in nodes:
+                    continue
+                node = note_node(child, include_content, projection)
+                nodes[child.id] = node
+                parent = nodes[child.parent_id]
+                parent["children"].append(node)
+                parent["has_children"] = True
+                next_level.append(child.id)
+        level = next_level
+    
+    # Notes au bord de la profondeur demandée : ont-elles des enfants ?
+    for start in range(0, len(level), BATCH_SIZE):
+        for parent_id in await db.scalars(
+            select(models.Note.parent_id).where(
+                models.Note.parent_id.in_(level[start:start + BATCH_SIZE])
+            ).distinct()
+        ):
+            nodes[parent_id]["has_children"] = True
+    return [nodes[note.id] for note in roots]
+
 @router.post("/", response_model=schemas.Note)
-def create_note(note: schemas.NoteCreate, db: Session = Depends(get_db)):
+async def create_note(note: schemas.NoteCreate, db: AsyncSession = Depends(get_db)):
     db_note = models.Note(**note.dict())
     db.add(db_note)
-    db.commit()
-    db.refresh(db_note)
-    return db_note
+    await db.flush()
+    await revisions.record(db, db_note)
+    await db.commit()
+    await db.refresh(db_note)
+    return await serialize(db, schemas.Note, db_note)
+
+@router.get("/", response_model=List[schemas.NoteTreeNode])
+async def get_notes(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    depth: int = Query(MAX_NOTE_DEPTH, ge=0, le=MAX_NOTE_DEPTH),
+    include_content: bool = True,
+    fields: Optional[str] = None,
+    view: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Notes racines paginées, avec leurs descendants jusqu'à `depth` niveaux.
 
-@router.get("/", response_model=List[schemas.Note])
-def get_notes(db: Session = Depends(get_db)):
-    return db.query(models.Note).filter(models.Note.parent_id.is_(None)).all()
+    `view=summary` ou `fields=` restreignent les champs de chaque note
+    (`children` et `has_children` sont toujours présents).
+    """
+    projection = parse_projection(models.Note, schemas.Note, schemas.NoteSummary, fields, view)
+    query = select(models.Note).where(models.Note.parent_id.is_(None)).order_by(models.Note.id)
+    if projection:
+        query = query.options(projection.columns(models.Note))
+    elif not include_content:
+        query = query.options(defer(models.Note.content))
+    roots = (await db.scalars(query.offset(skip).limit(limit))).all()
+    nodes = await load_note_levels(db, roots, depth, include_content, projection)
+    if projection:
+        return projected_response(nodes, projection, validate=False)
+    return nodes
+
+@router.get("/{note_id}/subtree", response_model=schemas.NoteTreeNode)
+async def get_note_subtree(
+    note_id: int,
+    depth: int = Query(1, ge=0, le=MAX_NOTE_DEPTH),
+    include_content: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """Charge une branche à la demande, à partir de la note `note_id`."""
+    query = select(models.Note).where(models.Note.id == note_id)
+    if not include_content:
+        query = query.options(defer(models.Note.content))
+    note = await db.scalar(query)
+    if note is None:
+        raise HTTPException(status_code=404, detail="Note not found")
+    return (await load_note_levels(db, [note], depth, include_content))[0]
 
 @router.get("/{note_id}", response_model=schemas.Note)
-def get_note(note_id: int, db: Session = Depends(get_db)):
-    note = db.query(models.Note).filter(models.Note.id == note_id).first()
+async def get_note(note_id: int, db: AsyncSession = Depends(get_db)):
+    note = await db.get(models.Note, note_id)
     if note is None:
         raise HTTPException(status_code=404, detail="Note not found")
-    return note
+    return await serialize(db, schemas.Note, note)
 
 @router.put("/{note_id}", response_model=schemas.Note)
-def update_note(note_id: int, note: schemas.NoteCreate, db: Session = Depends(get_db)):
-    db_note = db.query(models.Note).filter(models.Note.id == note_id).first()
+async def update_note(note_id: int, note: schemas.NoteCreate, db: AsyncSession = Depends(get_db)):
+    db_note = await db.get(models.Note, note_id)
     if db_note is None:
         raise HTTPException(status_code=404, detail="Note not found")
+    previous = revisions.snapshot(db_note)
     
     for key, value in note.dict().items():
         setattr(db_note, key, value)
+    try:
+        await revisions.record(db, db_note, previous)
+        await db.commit()
+    except StaleDataError:
+        await db.rollback()
+        raise conflict(STALE_CONFLICT)
+    await db.refresh(db_note)
+    return await serialize(db, schemas.Note, db_note)
+
+@router.patch("/{note_id}", response_model=schemas.Note)
+async def patch_note(
+    note_id: int,
+    patch: schemas.NotePatch,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Mise à jour partielle : seuls les champs envoyés sont modifiés.
+
+    `content_edits` modifie le contenu par plages, sans renvoyer la note
+    entière. Avec `If-Match` (ou `version`), la mise à jour est refusée (409)
+    si la note a changé depuis cette version.
+    """
+    db_note = await db.get(models.Note, note_id)
+    if db_note is None:
+        raise HTTPException(status_code=404, detail="Note not found")
+    check_version(db_note.version, if_match, patch.version, VERSION_CONFLICT, INVALID_IF_MATCH, f"note-{note_id}")
+    previous = revisions.snapshot(db_note)
+    
+    changes = patch.dict(exclude_unset=True, exclude={"version", "content_edits"})
+    if patch.content_edits is not None:
+        if "content" in changes:
+            raise HTTPException(status_code=400, detail="Send either content or content_edits, not both")
+        changes["content"] = apply_text_edits(db_note.content, patch.content_edits)
+    for field in ("title", "content"):
+        if field in changes and changes[field] is None:
+            raise HTTPException(status_code=400, detail=f"{field} cannot be null")
     
-    db.commit()
-    db.refresh(db_note)
-    return db_note
+    for key, value in changes.items():
+        setattr(db_note, key, value)
+    try:
+        await revisions.record(db, db_note, previous)
+        await db.commit()
+    except StaleDataError:
+        await db.rollback()
+        raise conflict(STALE_CONFLICT)
+    await db.refresh(db_note)
+    response.headers["ETag"] = version_etag(f"note-{note_id}", db_note.version)
+    return await serialize(db, schemas.Note, db_note)
 
 @router.delete("/{note_id}")
-def delete_note(note_id: int, db: Session = Depends(get_db)):
-    db_note = db.query(models.Note).filter(models.Note.id == note_id).first()
+async def delete_note(note_id: int, db: AsyncSession = Depends(get_db)):
+    db_note = await db.get(models.Note, note_id)
     if db_note is None:
         raise HTTPException(status_code=404, detail="Note not found")
     
-    db.delete(db_note)
-    db.commit()
-    return {"message": "Note deleted successfully"} 
\ No newline at end of file
+    await db.execute(revisions.delete_for_notes([note_id]))
+    await db.delete(db_note)
+    await db.commit()
+    return {"message": "Note deleted successfully"}
+
+@router.post("/revisions/compact", response_model=schemas.RevisionCompaction)
+async def compact_all_revisions(db: AsyncSession = Depends(get_db)):
+    """Applique la politique de conservation de l'historique à toutes les notes."""
+    result = await revisions.compact_all(db)
+    await db.commit()
+    return result
+
+@router.get("/{note_id}/revisions", response_model=List[schemas.NoteRevision])
+async def list_note_revisions(
+    note_id: int,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db)
+):
+    """Révisions de la note, de la plus récente à la plus ancienne (sans contenu)."""
+    if await db.get(models.Note, note_id) is None:
+        raise HTTPException(status_code=404, detail="Note not found")
+    revision = models.NoteRevision
+    rows = await db.execute(
+        select(revision.version, revision.title, revision.chain, revision.size,
+               func.length(revision.data).label("stored_size"), revision.created_at)
+        .where(revision.note_id == note_id)
+        .order_by(revision.version.desc()).offset(skip).limit(limit)
+    )
+    return [
+        {
+            "version": row.version,
+            "title": row.title,
+            "kind": "snapshot" if row.chain == 0 else "delta",
+            "size": row.size,
+            "stored_size": row.stored_size,
+            "created_at": row.created_at,
+        }
+        for row in rows
+    ]
+
+@router.get("/{note_id}/revisions/{version}", response_model=schemas.NoteRevisionContent)
+async def get_note_revision(note_id: int, version: int, db: AsyncSession = Depends(get_db)):
+    """Contenu de la note à une version donnée (la dernière révision qui ne la dépasse pas)."""
+    row, content = await revisions.reconstruct(db, note_id, version)
+    return {
+        "note_id": note_id,
+        "version": row.version,
+        "title": row.title,
+        "content": content,
+        "created_at": row.created_at,
+    }
+
+@router.post("/{note_id}/revisions/{version}/restore", response_model=schemas.Note)
+async def restore_note_revision(
+    note_id: int,
+    version: int,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Rétablit le titre et le contenu d'une révision ; l'opération crée une nouvelle révision."""
+    db_note = await db.get(models.Note, note_id)
+    if db_note is None:
+        raise HTTPException(status_code=404, detail="Note not found")
+    check_version(db_note.version, if_match, None, VERSION_CONFLICT, INVALID_IF_MATCH, f"note-{note_id}")
+    previous = revisions.snapshot(db_note)
+    row, content = await revisions.reconstruct(db, note_id, version)
+    
+    db_note.title = row.title
+    db_note.content = content
+    try:
+        await revisions.record(db, db_note, previous)
+        await db.commit()
+    except StaleDataError:
+        await db.rollback()
+        raise conflict(STALE_CONFLICT)
+    await db.refresh(db_note)
+    response.headers["ETag"] = version_etag(f"note-{note_id}", db_note.version)
+    return await serialize(db, schemas.Note, db_note)
+
+@router.post("/{note_id}/revisions/compact", response_model=schemas.RevisionCompaction)
+async def compact_note_revisions(note_id: int, db: AsyncSession = Depends(get_db)):
+    """Applique tout de suite la politique de conservation à l'historique de la note."""
+    if await db.get(models.Note, note_id) is None:
+        raise HTTPException(status_code=404, detail="Note not found")
+    removed = await revisions.prune(db, note_id)
+    await db.commit()
+    return {"notes": 1, "removed": removed} 
\ No newline at end of file
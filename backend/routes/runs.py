@@ -0,0 +1,76 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+import asyncio
+from .. import models, schemas
+from ..database import get_db
+from ..runner import tool_runner, read_log, stream_events
+
+router = APIRouter(
+    prefix="/runs",
+    tags=["runs"]
+)
+
+def get_job(job_id: str):
+    job = tool_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Exécution non trouvée")
+    return job
+
+@router.post("/", response_model=List[schemas.RunJob])
+async def create_runs(run: schemas.RunCreate, db: AsyncSession = Depends(get_db)):
+    """Lance la commande d'un outil sur des fichiers de challenge (un job par fichier)."""
+    tool = await db.get(models.Tool, run.tool_id)
+    if tool is None:
+        raise HTTPException(status_code=404, detail="Outil non trouvé")
+    if not (tool.command or "").strip():
+        raise HTTPException(status_code=400, detail="L'outil n'a pas de commande")
+
+    query = select(models.File)
+    if run.file_ids:
+        query = query.where(models.File.id.in_(run.file_ids))
+    elif run.challenge_id is not None:
+        query = query.where(models.File.challenge_id == run.challenge_id)
+    else:
+        raise HTTPException(status_code=400, detail="Indiquez file_ids ou challenge_id")
+    if run.challenge_id is not None:
+        query = query.where(models.File.challenge_id == run.challenge_id)
+    files = (await db.execute(query.order_by(models.File.id))).scalars().all()
+
+    missing = set(run.file_ids) - {db_file.id for db_file in files}
+    if missing or not files:
+        raise HTTPException(status_code=404, detail="Fichier(s) non trouvé(s)")
+
+    jobs = []
+    for db_file in files:
+        job = await tool_runner.submit(tool.id, tool.command, db_file, run.args, run.force)
+        jobs.append(job.as_dict())
+    return jobs
+
+@router.get("/{job_id}", response_model=schemas.RunJob)
+def get_run(job_id: str):
+    return get_job(job_id).as_dict()
+
+@router.get("/{job_id}/log", response_class=PlainTextResponse)
+async def get_run_log(job_id: str):
+    """Sortie enregistrée jusqu'ici (stdout et stderr dans l'ordre d'arrivée)."""
+    job = get_job(job_id)
+    return await asyncio.to_thread(read_log, job)
+
+@router.get("/{job_id}/stream")
+async def stream_run(job_id: str):
+    """Sortie du job en Server-Sent Events, depuis le début puis en direct."""
+    job = get_job(job_id)
+    return StreamingResponse(
+        stream_events(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.delete("/{job_id}", response_model=schemas.RunJob)
+async def cancel_run(job_id: str):
+    job = get_job(job_id)
+    await tool_runner.cancel(job)
+    return job.as_dict()
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+from .. import schemas
+from ..database import get_db
+from ..search import INDEXES, search
+
+router = APIRouter(
+    prefix="/search",
+    tags=["search"]
+)
+
+@router.get("/", response_model=List[schemas.SearchResult])
+async def search_all(
+    q: str = Query(..., min_length=1),
+    types: str = "notes,challenges,tools",
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    selected = [t.strip() for t in types.split(",") if t.strip()]
+    unknown = [t for t in selected if t not in INDEXES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Types inconnus: {', '.join(unknown)}")
+    return await search(db, q, selected, limit)
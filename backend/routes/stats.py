@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+from .. import schemas
+from ..database import get_db
+from ..stats import get_stats, get_timeline, recompute
+
+router = APIRouter(
+    prefix="/stats",
+    tags=["stats"]
+)
+
+@router.get("/", response_model=schemas.Stats)
+async def read_stats(db: AsyncSession = Depends(get_db)):
+    """Progression par catégorie et par difficulté, lue dans les compteurs."""
+    return await get_stats(db)
+
+@router.get("/timeline", response_model=List[schemas.TimelinePoint])
+async def read_timeline(days: int = Query(30, ge=1, le=3650), db: AsyncSession = Depends(get_db)):
+    """Nombre de challenges résolus par jour."""
+    return await get_timeline(db, days)
+
+@router.post("/recompute", response_model=schemas.Stats)
+async def recompute_stats(db: AsyncSession = Depends(get_db)):
+    """Recalcule les compteurs depuis la table challenges (réparation)."""
+    await recompute(db)
+    await db.commit()
+    return await get_stats(db)
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from .. import models, schemas
 from ..database import get_db
+from ..pagination import keyset_page
+from ..projection import parse_projection, projected_response
 
 router = APIRouter(
     prefix="/tools",
@@ -10,46 +12,65 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=schemas.Tool)
-def create_tool(tool: schemas.ToolCreate, db: Session = Depends(get_db)):
+async def create_tool(tool: schemas.ToolCreate, db: AsyncSession = Depends(get_db)):
     db_tool = models.Tool(**tool.dict())
     db.add(db_tool)
-    db.commit()
-    db.refresh(db_tool)
+    await db.commit()
+    await db.refresh(db_tool)
     return db_tool
 
 @router.get("/", response_model=List[schemas.Tool])
-def read_tools(skip: int = 0, limit: int = 100, category: str = None, db: Session = Depends(get_db)):
-    query = db.query(models.Tool)
+async def read_tools(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    category: str = None,
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    fields: Optional[str] = None,
+    view: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Liste des outils ; `view=summary` ou `fields=name,category` allègent la réponse."""
+    projection = parse_projection(models.Tool, schemas.Tool, schemas.ToolSummary, fields, view)
+    filters = []
     if category:
-        query = query.filter(models.Tool.category == category)
-    return query.offset(skip).limit(limit).all()
+        filters.append(models.Tool.category == category)
+    tools = await keyset_page(
+        db, models.Tool, filters, response, limit,
+        cursor=cursor, skip=skip, with_total=with_total, count_key=(category,),
+        options=(projection.columns(models.Tool, "created_at"),) if projection else ()
+    )
+    if projection:
+        return projected_response(tools, projection, response)
+    return tools
 
 @router.get("/{tool_id}", response_model=schemas.Tool)
-def read_tool(tool_id: int, db: Session = Depends(get_db)):
-    db_tool = db.query(models.Tool).filter(models.Tool.id == tool_id).first()
+async def read_tool(tool_id: int, db: AsyncSession = Depends(get_db)):
+    db_tool = await db.get(models.Tool, tool_id)
     if db_tool is None:
         raise HTTPException(status_code=404, detail="Outil non trouvé")
     return db_tool
 
 @router.put("/{tool_id}", response_model=schemas.Tool)
-def update_tool(tool_id: int, tool: schemas.ToolCreate, db: Session = Depends(get_db)):
-    db_tool = db.query(models.Tool).filter(models.Tool.id == tool_id).first()
+async def update_tool(tool_id: int, tool: schemas.ToolCreate, db: AsyncSession = Depends(get_db)):
+    db_tool = await db.get(models.Tool, tool_id)
     if db_tool is None:
         raise HTTPException(status_code=404, detail="Outil non trouvé")
     
     for key, value in tool.dict().items():
         setattr(db_tool, key, value)
     
-    db.commit()
-    db.refresh(db_tool)
+    await db.commit()
+    await db.refresh(db_tool)
     return db_tool
 
 @router.delete("/{tool_id}")
-def delete_tool(tool_id: int, db: Session = Depends(get_db)):
-    db_tool = db.query(models.Tool).filter(models.Tool.id == tool_id).first()
+async def delete_tool(tool_id: int, db: AsyncSession = Depends(get_db)):
+    db_tool = await db.get(models.Tool, tool_id)
     if db_tool is None:
         raise HTTPException(status_code=404, detail="Outil non trouvé")
     
-    db.delete(db_tool)
-    db.commit()
-    return {"message": "Outil supprimé avec succès"} 
\ No newline at end of file
+    await db.delete(db_tool)
+    await db.commit()
+    return {"message": "Outil supprimé avec succès"}
@@ -0,0 +1,440 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import shlex
+import shutil
+import signal
+import sys
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from .storage import UPLOAD_DIR, content_id, resolve_file_path
+
+try:
+    import resource
+except ImportError:  # Windows : pas de limites de ressources
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+RUNNER_WORKERS = int(os.getenv("PWNBOX_RUNNER_WORKERS", str(os.cpu_count() or 2)))
+RUN_TIMEOUT = int(os.getenv("PWNBOX_RUNNER_TIMEOUT", "60"))  # secondes
+MEMORY_LIMIT_MB = int(os.getenv("PWNBOX_RUNNER_MEMORY_MB", "2048"))  # 0 : pas de limite
+# Exécutables autorisés (premier mot de la commande, comparé tel quel), séparés par des virgules ; vide : tous
+ALLOWED_EXECUTABLES = {name.strip() for name in os.getenv("PWNBOX_RUNNER_ALLOWED", "").split(",") if name.strip()}
+# auto : bubblewrap s'il est installé ; bwrap : obligatoire ; none : jamais
+SANDBOX = os.getenv("PWNBOX_RUNNER_SANDBOX", "auto")
+MAX_LOG_SIZE = 16 * 1024 * 1024
+MAX_WRITTEN_FILE_SIZE = 256 * 1024 * 1024  # Fichiers créés par l'outil dans son dossier de travail
+MAX_OPEN_FILES = 256
+READ_SIZE = 64 * 1024
+KEEPALIVE_INTERVAL = 15
+MAX_TRACKED_JOBS = 1000
+
+RUN_DIR = os.path.join(UPLOAD_DIR, ".runs")
+FINISHED = ("done", "failed", "timeout", "cancelled")
+SAFE_NAME = re.compile(r"[^A-Za-z0-9._-]")
+# Dossiers système visibles (en lecture seule) dans le bac à sable bubblewrap
+SANDBOX_READONLY_DIRS = ("/usr", "/bin", "/sbin", "/lib", "/lib32", "/lib64", "/etc", "/opt")
+
+# Applique les limites de ressources puis remplace le processus par la commande.
+# Remplace preexec_fn, qui n'est pas sûr dans un serveur qui a des threads.
+LIMITS_LAUNCHER = (
+    "import json, os, resource, sys\n"
+    "for name, value in json.loads(sys.argv[1]):\n"
+    "    try:\n"
+    "        resource.setrlimit(getattr(resource, name), (value, value))\n"
+    "    except (ValueError, OSError):\n"
+    "        pass\n"
+    "os.execvp(sys.argv[2], sys.argv[2:])\n"
+)
+
+
+def build_command(template: str, file_path: str, args: List[str]) -> List[str]:
+    """Construit la ligne de commande d'un outil, sans passer par un shell.
+
+    `{file}` est remplacé par le chemin du fichier et `{args}` par les
+    arguments supplémentaires. Sans `{args}`, les arguments suivent la
+    commande de l'outil (`python3 tool.py` les transmet ainsi au script, pas
+    à l'interpréteur) ; sans `{file}`, le fichier est ajouté en dernier.
+    """
+    try:
+        tokens = shlex.split(template)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Commande de l'outil invalide: {e}")
+    if not tokens:
+        raise HTTPException(status_code=400, detail="L'outil n'a pas de commande")
+    if any("\0" in arg for arg in args):
+        raise HTTPException(status_code=400, detail="Argument invalide")
+
+    command = []
+    for token in tokens:
+        if token == "{args}":
+            command.extend(args)
+        else:
+            command.append(token.replace("{file}", file_path))
+    if "{args}" not in tokens:
+        command.extend(args)
+    if not any("{file}" in token for token in tokens):
+        command.append(file_path)
+    return command
+
+
+def cache_key(template: str, content_id: str, args: List[str]) -> str:
+    return hashlib.sha256(json.dumps([template, content_id, args]).encode()).hexdigest()
+
+
+
+def check_allowed(command: List[str]):
+    if ALLOWED_EXECUTABLES and command[0] not in ALLOWED_EXECUTABLES:
+        raise HTTPException(status_code=403, detail=f"Exécutable non autorisé : {command[0]}")
+
+
+def sandbox_prefix(workdir: str, mode: str = SANDBOX) -> List[str]:
+    """Préfixe bubblewrap : système en lecture seule, seul le dossier de travail
+    est visible et modifiable, ni réseau ni autres processus."""
+    if mode == "none":
+        return []
+    bwrap = shutil.which("bwrap")
+    if bwrap is None:
+        if mode == "bwrap":
+            raise RuntimeError("bubblewrap (bwrap) est requis par PWNBOX_RUNNER_SANDBOX mais n'est pas installé")
+        return []
+    prefix = [bwrap, "--unshare-all", "--die-with-parent", "--new-session",
+              "--proc", "/proc", "--dev", "/dev", "--tmpfs", "/tmp"]
+    for path in SANDBOX_READONLY_DIRS:
+        prefix += ["--ro-bind-try", path, path]
+    return prefix + ["--bind", workdir, workdir, "--chdir", workdir]
+
+
+def limits_prefix() -> List[str]:
+    if resource is None:
+        return []
+    limits = [
+        ("RLIMIT_CPU", RUN_TIMEOUT + 1),
+        ("RLIMIT_FSIZE", MAX_WRITTEN_FILE_SIZE),
+        ("RLIMIT_NOFILE", MAX_OPEN_FILES),
+        ("RLIMIT_CORE", 0),
+    ]
+    if MEMORY_LIMIT_MB:
+        limits.append(("RLIMIT_AS", MEMORY_LIMIT_MB * 1024 * 1024))
+    return [sys.executable, "-c", LIMITS_LAUNCHER, json.dumps(limits)]
+
+
+def find_executable(name: str, workdir: str, path: str) -> Optional[str]:
+    if os.sep in name:
+        candidate = os.path.join(workdir, name)
+        return candidate if os.path.isfile(candidate) and os.access(candidate, os.X_OK) else None
+    return shutil.which(name, path=path)
+
+
+class RunJob:
+    def __init__(self, tool_id: int, file_id: int, sha256: Optional[str], key: str,
+                 command: List[str], file_path: str, display_name: str):
+        self.id = uuid.uuid4().hex
+        self.tool_id = tool_id
+        self.file_id = file_id
+        self.sha256 = sha256
+        self.key = key
+        self.command = command
+        self.file_path = file_path
+        self.display_name = display_name
+        self.status = "queued"
+        self.exit_code: Optional[int] = None
+        self.error: Optional[str] = None
+        self.cached = False
+        self.truncated = False
+        self.log_size = 0
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.duration: Optional[float] = None
+        self.log_path = os.path.join(RUN_DIR, key[:2], f"{key}.log")
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def meta_path(self) -> str:
+        return self.log_path[:-len(".log")] + ".json"
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def notify(self):
+        """Réveille les clients qui suivent la sortie du job."""
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_changed(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def result(self) -> dict:
+        return {
+            "status": self.status,
+            "exit_code": self.exit_code,
+            "error": self.error,
+            "truncated": self.truncated,
+            "duration": self.duration,
+        }
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "tool_id": self.tool_id,
+            "file_id": self.file_id,
+            "sha256": self.sha256,
+            "command": self.command,
+            "cached": self.cached,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            **self.result(),
+        }
+
+
+class ToolRunner:
+    """Exécute les commandes des outils sur les fichiers des challenges.
+
+    Chaque commande tourne dans un sous-processus avec un dossier de travail
+    temporaire, un environnement minimal, des limites de ressources et un
+    délai maximal, au plus RUNNER_WORKERS à la fois. Ce n'est un bac à sable
+    (système de fichiers en lecture seule, sans réseau) que si bubblewrap est
+    installé ; sinon l'outil a les droits du serveur, et PWNBOX_RUNNER_ALLOWED
+    restreint les exécutables. La sortie est enregistrée sur disque au
+    fil de l'eau (NDJSON) et sert de cache : un même outil sur un même
+    contenu avec les mêmes arguments n'est exécuté qu'une fois.
+    """
+
+    def __init__(self, workers: int = RUNNER_WORKERS):
+        self.workers = workers
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._jobs: "OrderedDict[str, RunJob]" = OrderedDict()
+        self._running: Dict[str, RunJob] = {}  # clé de cache -> job en cours
+        self._tasks = set()
+
+    def get(self, job_id: str) -> Optional[RunJob]:
+        return self._jobs.get(job_id)
+
+    def _track(self, job: RunJob):
+        self._jobs[job.id] = job
+        while len(self._jobs) > MAX_TRACKED_JOBS:
+            self._jobs.popitem(last=False)
+
+    async def submit(self, tool_id: int, template: str, db_file, args: List[str], force: bool = False) -> RunJob:
+        """Planifie l'exécution d'un outil sur un fichier ; retourne aussitôt le job."""
+        file_path = resolve_file_path(db_file)
+        if not os.path.exists(file_path):
+            raise HTTPException(status_code=404, detail=f"Fichier {db_file.name} absent du disque")
+        display_name = SAFE_NAME.sub("_", os.path.basename(db_file.name or "")).lstrip(".") or "fichier"
+        # "./" évite qu'un nom commençant par "-" soit lu comme une option
+        command = build_command(template, f"./{display_name}", args)
+        check_allowed(command)
+        key = cache_key(template, await asyncio.to_thread(content_id, db_file, file_path), args)
+        running = self._running.get(key)
+        if running is not None:
+            return running
+
+        job = RunJob(tool_id, db_file.id, db_file.sha256, key, command, file_path, display_name)
+        self._track(job)
+        if not force:
+            meta = await asyncio.to_thread(self._read_meta, job)
+            if meta is not None:
+                job.cached = True
+                job.status = meta["status"]
+                job.exit_code = meta.get("exit_code")
+                job.error = meta.get("error")
+                job.truncated = meta.get("truncated", False)
+                job.duration = meta.get("duration")
+                job.finished_at = datetime.utcnow()
+                return job
+
+        await asyncio.to_thread(self._prepare_log, job)
+        self._running[key] = job
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: RunJob):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        workdir = None
+        log = None
+        try:
+            async with self._semaphore:
+                if job.status == "cancelled":
+                    return
+                job.status = "running"
+                job.started_at = datetime.utcnow()
+                job.notify()
+                workdir = await asyncio.to_thread(tempfile.mkdtemp, prefix="run-", dir=RUN_DIR)
+                # L'outil travaille sur une copie portant le nom d'origine : le blob,
+                # partagé entre challenges, ne peut pas être modifié
+                await asyncio.to_thread(shutil.copyfile, job.file_path, os.path.join(workdir, job.display_name))
+                env = {"PATH": os.environ.get("PATH", ""), "HOME": workdir, "LANG": "C.UTF-8"}
+                if find_executable(job.command[0], workdir, env["PATH"]) is None:
+                    job.status = "failed"
+                    job.error = f"Commande introuvable : {job.command[0]}"
+                    return
+                argv = limits_prefix() + sandbox_prefix(workdir) + job.command
+                log = open(job.log_path, "ab")
+                start = time.monotonic()
+                try:
+                    job.process = await asyncio.create_subprocess_exec(
+                        *argv,
+                        cwd=workdir,
+                        env=env,
+                        stdin=asyncio.subprocess.DEVNULL,
+                        stdout=asyncio.subprocess.PIPE,
+                        stderr=asyncio.subprocess.PIPE,
+                        start_new_session=True,
+                    )
+                except OSError as e:
+                    job.status = "failed"
+                    job.error = f"Impossible de lancer la commande: {e}"
+                    return
+
+                completed = asyncio.gather(
+                    self._pump(job, job.process.stdout, "stdout", log),
+                    self._pump(job, job.process.stderr, "stderr", log),
+                    job.process.wait(),
+                )
+                try:
+                    await asyncio.wait_for(asyncio.shield(completed), RUN_TIMEOUT)
+                    if job.status != "cancelled":
+                        job.status = "done"
+                except asyncio.TimeoutError:
+                    self._kill(job)
+                    job.status = "timeout"
+                    job.error = f"Délai dépassé ({RUN_TIMEOUT}s)"
+                    await completed
+                job.exit_code = job.process.returncode
+                job.duration = round(time.monotonic() - start, 3)
+        except asyncio.CancelledError:
+            if job.process is not None:
+                self._kill(job)
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            logger.exception("Erreur lors de l'exécution du job %s", job.id)
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            if log is not None:
+                log.close()
+            if job.status == "running":
+                job.status = "failed"
+            job.finished_at = datetime.utcnow()
+            self._running.pop(job.key, None)
+            if workdir is not None:
+                await asyncio.to_thread(shutil.rmtree, workdir, True)
+            # Seules les exécutions arrivées à leur terme sont réutilisées
+            if job.status == "done":
+                await asyncio.to_thread(self._write_meta, job)
+            job.notify()
+
+    async def _pump(self, job: RunJob, stream: asyncio.StreamReader, name: str, log):
+        while True:
+            chunk = await stream.read(READ_SIZE)
+            if not chunk:
+                return
+            if job.truncated:
+                continue  # on continue de vider le tube pour ne pas bloquer l'outil
+            record = (json.dumps({"stream": name, "data": chunk.decode("utf-8", "replace")}) + "\n").encode()
+            if job.log_size + len(record) > MAX_LOG_SIZE:
+                job.truncated = True
+                record = (json.dumps({"stream": "system", "data": "[sortie tronquée]\n"}) + "\n").encode()
+            job.log_size += len(record)
+            log.write(record)
+            log.flush()
+            job.notify()
+
+    def _kill(self, job: RunJob):
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(job.process.pid, signal.SIGKILL)
+            else:
+                job.process.kill()
+        except ProcessLookupError:
+            pass
+
+    async def cancel(self, job: RunJob):
+        if job.finished:
+            return
+        job.status = "cancelled"
+        if job.process is not None and job.process.returncode is None:
+            self._kill(job)
+        job.notify()
+
+    # Accès disque, exécutés dans un thread
+
+    def _prepare_log(self, job: RunJob):
+        os.makedirs(os.path.dirname(job.log_path), exist_ok=True)
+        for path in (job.meta_path, job.log_path):
+            if os.path.exists(path):
+                os.remove(path)
+        open(job.log_path, "wb").close()
+
+    def _read_meta(self, job: RunJob) -> Optional[dict]:
+        if not os.path.exists(job.log_path):
+            return None
+        try:
+            with open(job.meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, job: RunJob):
+        with open(job.meta_path, "w") as f:
+            json.dump({**job.result(), "command": job.command, "created_at": job.created_at.isoformat()}, f)
+
+    def shutdown(self):
+        for job in list(self._running.values()):
+            if job.process is not None and job.process.returncode is None:
+                self._kill(job)
+        for task in list(self._tasks):
+            task.cancel()
+
+
+async def stream_events(job: RunJob) -> AsyncIterator[bytes]:
+    """Flux SSE de la sortie d'un job : tout le journal, puis la suite en direct.
+
+    Événements `output` (un enregistrement {"stream", "data"} par message)
+    puis `end` avec le statut final.
+    """
+    with open(job.log_path, "rb") as log:
+        pending = b""
+        while True:
+            # Le statut est lu avant le journal : un job terminé a tout écrit
+            finished = job.finished
+            *lines, pending = (pending + log.read()).split(b"\n")
+            for line in lines:
+                yield b"event: output\ndata: " + line + b"\n\n"
+            if finished:
+                yield b"event: end\ndata: " + json.dumps(job.result()).encode() + b"\n\n"
+                return
+            if not await job.wait_changed(KEEPALIVE_INTERVAL):
+                yield b": keepalive\n\n"
+
+
+def read_log(job: RunJob) -> str:
+    """Sortie complète d'un job, stdout et stderr mélangés dans l'ordre d'arrivée."""
+    with open(job.log_path, "rb") as log:
+        return "".join(json.loads(line)["data"] for line in log if line.strip())
+
+
+tool_runner = ToolRunner()
@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional, List, Dict, Any
-from datetime import datetime
+from datetime import date, datetime
 
 class ToolBase(BaseModel):
     name: str
@@ -19,6 +19,17 @@ class Tool(ToolBase):
     class Config:
         from_attributes = True
 
+class ToolSummary(BaseModel):
+    # Vue `summary` des listes : sans les colonnes texte volumineuses
+    id: int
+    name: str
+    category: str
+    url: Optional[str] = None
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
 class FileBase(BaseModel):
     name: str
     path: str
@@ -30,10 +41,24 @@ class FileCreate(FileBase):
 class File(FileBase):
     id: int
     challenge_id: int
+    filename: Optional[str] = None
+    size: Optional[int] = None
+    sha256: Optional[str] = None
     created_at: datetime
     
     class Config:
         from_attributes = True
+    
+    def as_resource(self) -> dict:
+        """Représentation historique d'un fichier dans resources['files']."""
+        return {
+            'filename': self.filename,
+            'original_name': self.name,
+            'uploaded_at': self.created_at.strftime("%Y%m%d_%H%M%S"),
+            'size': self.size,
+            'sha256': self.sha256,
+            'detected_type': self.file_type
+        }
 
 class ChallengeBase(BaseModel):
     title: str
@@ -49,12 +74,168 @@ class ChallengeCreate(ChallengeBase):
 class Challenge(ChallengeBase):
     id: int
     solved: bool = False
+    solved_at: Optional[datetime] = None
+    version: int = 1
     created_at: datetime
     updated_at: datetime
     files: List[File] = []
     
     class Config:
         from_attributes = True
+    
+    @model_validator(mode="after")
+    def expose_files_in_resources(self):
+        # Compatibilité : le frontend lit encore la liste des fichiers dans resources
+        resources = dict(self.resources or {})
+        resources['files'] = [f.as_resource() for f in self.files]
+        self.resources = resources
+        return self
+
+class JsonPatchOperation(BaseModel):
+    op: str  # add, remove, replace, move, copy ou test
+    path: str  # JSON Pointer, par exemple /links/0 ou /commands/-
+    value: Any = None
+    from_: Optional[str] = Field(None, alias="from")
+    
+    class Config:
+        populate_by_name = True
+
+class ChallengePatch(BaseModel):
+    title: Optional[str] = None
+    description: Optional[str] = None
+    category: Optional[str] = None
+    difficulty: Optional[str] = None
+    correct_flag: Optional[str] = None
+    solved: Optional[bool] = None
+    resources: Optional[Dict[str, Any]] = None  # Remplace les ressources
+    resources_patch: Optional[List[JsonPatchOperation]] = None  # Ou les modifie (RFC 6902)
+    version: Optional[int] = None  # Version modifiée, si If-Match n'est pas envoyé
+
+class ChallengeSummary(BaseModel):
+    id: int
+    title: str
+    category: str
+    difficulty: Optional[str] = None
+    solved: bool = False
+    solved_at: Optional[datetime] = None
+    created_at: datetime
+    updated_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: Optional[int] = None
+
+class UploadSession(BaseModel):
+    upload_id: str
+    challenge_id: int
+    filename: str
+    size: Optional[int] = None
+    offset: int
+    detected_type: Optional[str] = None
+    created_at: datetime
+
+class BlobAttach(BaseModel):
+    sha256: str
+    filename: str
+
+class AnalysisJob(BaseModel):
+    id: str
+    sha256: str
+    file_ids: List[int]
+    status: str
+    stages: Dict[str, str]
+    errors: Dict[str, str] = {}
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+class RunCreate(BaseModel):
+    tool_id: int
+    challenge_id: Optional[int] = None  # Sans file_ids : tous les fichiers du challenge
+    file_ids: List[int] = []
+    args: List[str] = []
+    force: bool = False  # Ignore la sortie en cache
+
+class RunJob(BaseModel):
+    id: str
+    tool_id: int
+    file_id: int
+    sha256: Optional[str] = None
+    command: List[str]
+    status: str
+    exit_code: Optional[int] = None
+    error: Optional[str] = None
+    cached: bool
+    truncated: bool
+    duration: Optional[float] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class FileAnalysis(BaseModel):
+    filename: str
+    status: str
+    job_id: Optional[str] = None
+    results: Optional[Dict[str, Any]] = None
+
+class ArchiveMember(BaseModel):
+    name: str
+    size: Optional[int] = None
+    compressed_size: Optional[int] = None
+    is_dir: bool
+    is_archive: bool  # D'après l'extension : candidat pour `archive=...!/nom`
+    modified: Optional[datetime] = None
+
+class ArchiveListing(BaseModel):
+    format: str
+    archive: str  # Chemin de l'archive imbriquée, vide pour le fichier lui-même
+    count: int
+    truncated: bool
+    members: List[ArchiveMember]
+
+class ChangeEvent(BaseModel):
+    version: int
+    table: str
+    id: Optional[int] = None  # Nul pour une modification en masse
+    op: str  # insert, update ou delete
+
+class ChangeFeed(BaseModel):
+    version: int  # À renvoyer dans `since` à la prochaine requête
+    reset: bool  # Changements perdus : recharger les listes
+    events: List[ChangeEvent]
+
+class SearchResult(BaseModel):
+    type: str
+    id: int
+    title: str
+    snippet: Optional[str] = None
+    rank: float
+
+class CategoryStats(BaseModel):
+    category: str
+    total: int
+    solved: int
+
+class DifficultyStats(BaseModel):
+    difficulty: Optional[str] = None
+    total: int
+    solved: int
+
+class BreakdownStats(CategoryStats):
+    difficulty: Optional[str] = None
+
+class Stats(BaseModel):
+    total: int
+    solved: int
+    categories: List[CategoryStats]
+    difficulties: List[DifficultyStats]
+    breakdown: List[BreakdownStats]
+
+class TimelinePoint(BaseModel):
+    date: date
+    solved: int
 
 class FlagCheck(BaseModel):
     flag: str
@@ -72,6 +253,7 @@ class NoteCreate(NoteBase):
 
 class Note(NoteBase):
     id: int
+    version: int = 1
     created_at: datetime
     updated_at: datetime
     children: List['Note'] = []
@@ -79,6 +261,79 @@ class Note(NoteBase):
     class Config:
         from_attributes = True
 
+class TextEdit(BaseModel):
+    start: int = Field(ge=0)
+    end: Optional[int] = None  # Par défaut start : insertion pure
+    text: str = ""
+
+class NotePatch(BaseModel):
+    title: Optional[str] = None
+    content: Optional[str] = None  # Remplace le contenu
+    content_edits: Optional[List[TextEdit]] = None  # Ou le modifie par morceaux
+    tags: Optional[List[str]] = None
+    is_favorite: Optional[bool] = None
+    folder_id: Optional[int] = None
+    parent_id: Optional[int] = None
+    version: Optional[int] = None  # Version modifiée, si If-Match n'est pas envoyé
+
+class NoteSummary(BaseModel):
+    id: int
+    title: str
+    tags: Optional[List[str]] = []
+    is_favorite: Optional[bool] = False
+    folder_id: Optional[int] = None
+    parent_id: Optional[int] = None
+    created_at: datetime
+    updated_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class NoteRevision(BaseModel):
+    version: int
+    title: str
+    kind: str  # snapshot ou delta
+    size: int  # Longueur du contenu
+    stored_size: int  # Octets stockés pour cette révision
+    created_at: datetime
+
+class NoteRevisionContent(BaseModel):
+    note_id: int
+    version: int
+    title: str
+    content: str
+    created_at: datetime
+
+class RevisionCompaction(BaseModel):
+    notes: int
+    removed: int
+
+class ToolImport(ToolCreate):
+    # Champs optionnels d'un export : conservent les identifiants et les dates
+    id: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+class ChallengeImport(ChallengeCreate):
+    id: Optional[int] = None
+    solved: Optional[bool] = None
+    solved_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class NoteImport(NoteCreate):
+    id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class BulkLineError(BaseModel):
+    line: int
+    error: str
+
+class BulkImportResult(BaseModel):
+    inserted: int
+    error_count: int
+    errors: List[BulkLineError] = []
+
 class FolderBase(BaseModel):
     name: str
     parent_id: Optional[int] = None
@@ -96,5 +351,39 @@ class Folder(FolderBase):
     class Config:
         from_attributes = True
 
+class FolderSummary(FolderBase):
+    # Liste plate : l'arborescence se reconstruit avec parent_id
+    id: int
+    created_at: datetime
+    updated_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class NoteTreeNode(BaseModel):
+    id: int
+    title: str
+    content: Optional[str] = None
+    tags: Optional[List[str]] = []
+    is_favorite: Optional[bool] = False
+    folder_id: Optional[int] = None
+    parent_id: Optional[int] = None
+    version: int = 1
+    created_at: datetime
+    updated_at: datetime
+    has_children: bool = False
+    children: List['NoteTreeNode'] = []
+
+class FolderTreeNode(FolderBase):
+    id: int
+    created_at: datetime
+    updated_at: datetime
+    depth: int
+    has_children: bool = False
+    children: List['FolderTreeNode'] = []
+    notes: List[NoteTreeNode] = []
+
 Note.model_rebuild()
-Folder.model_rebuild() 
\ No newline at end of file
+Folder.model_rebuild()
+NoteTreeNode.model_rebuild()
+FolderTreeNode.model_rebuild() 
\ No newline at end of file
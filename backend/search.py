@@ -0,0 +1,115 @@
+import logging
+import re
+from typing import Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Tables indexées : table source -> (table FTS, colonnes, colonne de titre, poids bm25)
+INDEXES = {
+    "notes": ("notes_fts", ["title", "content"], "title", [10.0, 1.0]),
+    "challenges": ("challenges_fts", ["title", "description"], "title", [10.0, 1.0]),
+    "tools": ("tools_fts", ["name", "description", "command"], "name", [10.0, 1.0, 2.0]),
+}
+
+# Colonnes stockées sous une autre forme que le texte indexé (notes compressées) :
+# l'index lit alors une vue qui applique ces expressions
+COLUMN_EXPRESSIONS = {
+    "notes": {"content": "inflate({row}.content)"},
+}
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def _source(table: str) -> str:
+    return f"{table}_fts_source" if table in COLUMN_EXPRESSIONS else table
+
+
+def _values(table: str, columns: List[str], row: str) -> List[str]:
+    expressions = COLUMN_EXPRESSIONS.get(table, {})
+    return [expressions.get(c, "{row}.%s" % c).format(row=row) for c in columns]
+
+
+def _ddl(table: str, fts: str, columns: List[str]) -> List[str]:
+    cols = ", ".join(columns)
+    new_cols = ", ".join(_values(table, columns, "new"))
+    old_cols = ", ".join(_values(table, columns, "old"))
+    source = _source(table)
+    statements = []
+    if source != table:
+        aliased = ", ".join(f"{value} AS {column}" for value, column in zip(_values(table, columns, table), columns))
+        statements.append(f"CREATE VIEW IF NOT EXISTS {source} AS SELECT id, {aliased} FROM {table}")
+    return statements + [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{cols}, content='{source}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        # Les triggers maintiennent l'index à chaque écriture, y compris les insertions en masse
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END",
+    ]
+
+
+def setup_search(engine: Engine):
+    """Crée les index FTS5 et leurs triggers ; indexe le contenu existant à la création."""
+    with engine.begin() as conn:
+        existing = dict(conn.execute(text("SELECT name, sql FROM sqlite_master WHERE type = 'table'")).all())
+        for table, (fts, columns, _, _) in INDEXES.items():
+            if fts in existing and f"content='{_source(table)}'" not in existing[fts]:
+                # Index créé sur une autre source (avant la compression des notes) : on le refait
+                logger.info("Migration: reconstruction de l'index %s", fts)
+                for trigger in ("ai", "ad", "au"):
+                    conn.execute(text(f"DROP TRIGGER IF EXISTS {fts}_{trigger}"))
+                conn.execute(text(f"DROP TABLE {fts}"))
+                del existing[fts]
+            for statement in _ddl(table, fts, columns):
+                conn.execute(text(statement))
+            if fts not in existing:
+                logger.info("Indexation de la table %s pour la recherche", table)
+                conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def build_match_query(query: str) -> str:
+    """Transforme une saisie utilisateur en requête FTS5 sûre.
+
+    Chaque mot est cité (les opérateurs FTS5 sont neutralisés) et recherché
+    par préfixe ; tous les mots doivent être présents.
+    """
+    tokens = TOKEN_PATTERN.findall(query)
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+async def search(db, query: str, types: List[str], limit: int) -> List[Dict]:
+    match = build_match_query(query)
+    if not match:
+        return []
+    results = []
+    for table in types:
+        fts, columns, title, weights = INDEXES[table]
+        rows = await db.execute(
+            text(
+                f"SELECT src.id, src.{title}, "
+                f"snippet({fts}, -1, '<mark>', '</mark>', '…', 12), "
+                f"bm25({fts}, {', '.join(str(w) for w in weights)}) AS rank "
+                f"FROM {fts} JOIN {table} AS src ON src.id = {fts}.rowid "
+                f"WHERE {fts} MATCH :match ORDER BY rank LIMIT :limit"
+            ),
+            {"match": match, "limit": limit},
+        )
+        for id_, title_value, snippet, rank in rows:
+            results.append({
+                "type": table,
+                "id": id_,
+                "title": title_value,
+                "snippet": snippet,
+                "rank": rank,
+            })
+    # bm25 : plus le score est bas, plus le résultat est pertinent
+    results.sort(key=lambda r: r["rank"])
+    return results[:limit]
@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models
+
+# (catégorie, difficulté, résolu) : ce qui compte pour les statistiques d'un challenge
+Snapshot = Tuple[str, str, bool]
+
+
+def snapshot(challenge: models.Challenge) -> Snapshot:
+    return challenge.category, challenge.difficulty or "", bool(challenge.solved)
+
+
+async def track(db: AsyncSession, before: Optional[Snapshot], after: Optional[Snapshot]):
+    """Reporte sur les compteurs le passage d'un challenge de `before` à `after`.
+
+    None signifie que le challenge n'existe pas (création ou suppression).
+    Les compteurs sont modifiés dans la transaction en cours : ils restent
+    cohérents avec la table challenges, commit ou rollback compris.
+    """
+    deltas: Dict[Tuple[str, str], List[int]] = {}
+    if before is not None:
+        bucket = deltas.setdefault(before[:2], [0, 0])
+        bucket[0] -= 1
+        bucket[1] -= before[2]
+    if after is not None:
+        bucket = deltas.setdefault(after[:2], [0, 0])
+        bucket[0] += 1
+        bucket[1] += after[2]
+
+    for (category, difficulty), (total, solved) in deltas.items():
+        if not total and not solved:
+            continue
+        statement = sqlite_insert(models.ChallengeStat).values(
+            category=category, difficulty=difficulty, total=total, solved=solved
+        )
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=["category", "difficulty"],
+            set_={
+                "total": models.ChallengeStat.total + statement.excluded.total,
+                "solved": models.ChallengeStat.solved + statement.excluded.solved,
+            }
+        ))
+        if total < 0:
+            # Une catégorie vidée disparaît des statistiques
+            await db.execute(delete(models.ChallengeStat).where(
+                models.ChallengeStat.category == category,
+                models.ChallengeStat.difficulty == difficulty,
+                models.ChallengeStat.total <= 0
+            ))
+
+
+def rebuild(db: Session):
+    """Recalcule tous les compteurs à partir de la table challenges (réparation)."""
+    difficulty = func.coalesce(models.Challenge.difficulty, "")
+    db.execute(delete(models.ChallengeStat))
+    db.execute(insert(models.ChallengeStat).from_select(
+        ["category", "difficulty", "total", "solved"],
+        select(
+            models.Challenge.category,
+            difficulty,
+            func.count(),
+            func.sum(case((models.Challenge.solved, 1), else_=0)),
+        ).group_by(models.Challenge.category, difficulty)
+    ))
+
+
+async def recompute(db: AsyncSession):
+    await db.run_sync(rebuild)
+
+
+async def get_stats(db: AsyncSession) -> dict:
+    """Totaux par catégorie et par difficulté, lus dans les compteurs (O(catégories))."""
+    stat = models.ChallengeStat
+    rows = (await db.execute(
+        select(stat.category, stat.difficulty, stat.total, stat.solved).order_by(stat.category, stat.difficulty)
+    )).all()
+
+    categories: Dict[str, dict] = {}
+    difficulties: Dict[str, dict] = {}
+    breakdown = []
+    for row in rows:
+        difficulty = row.difficulty or None
+        breakdown.append({"category": row.category, "difficulty": difficulty,
+                          "total": row.total, "solved": row.solved})
+        for key, buckets, field in ((row.category, categories, "category"),
+                                    (difficulty, difficulties, "difficulty")):
+            bucket = buckets.setdefault(key, {field: key, "total": 0, "solved": 0})
+            bucket["total"] += row.total
+            bucket["solved"] += row.solved
+    return {
+        "total": sum(row.total for row in rows),
+        "solved": sum(row.solved for row in rows),
+        "categories": list(categories.values()),
+        "difficulties": list(difficulties.values()),
+        "breakdown": breakdown,
+    }
+
+
+async def get_timeline(db: AsyncSession, days: int) -> List[dict]:
+    """Challenges résolus par jour sur les `days` derniers jours (index sur solved_at)."""
+    since = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days - 1)
+    day = func.date(models.Challenge.solved_at)
+    rows = await db.execute(
+        select(day, func.count()).where(models.Challenge.solved_at >= since)
+        .group_by(day).order_by(day)
+    )
+    return [{"date": date, "solved": count} for date, count in rows]
@@ -0,0 +1,44 @@
+import logging
+import os
+
+from .blobstore import BlobStore
+from .uploads import ResumableUploads
+
+logger = logging.getLogger(__name__)
+
+# Configuration pour les fichiers
+UPLOAD_DIR = os.path.abspath(os.getenv(
+    "PWNBOX_UPLOAD_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
+))
+
+# Créer le dossier uploads s'il n'existe pas
+logger.debug("Création du dossier uploads à: %s", UPLOAD_DIR)
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+resumable_uploads = ResumableUploads(os.path.join(UPLOAD_DIR, ".partial"))
+blob_store = BlobStore(os.path.join(UPLOAD_DIR, "blobs"))
+
+
+def get_challenge_dir(challenge_id: int) -> str:
+    """Retourne le chemin du dossier pour un challenge spécifique (ancien stockage)."""
+    return os.path.join(UPLOAD_DIR, f"challenge_{challenge_id}")
+
+
+def blob_relpath(sha256: str) -> str:
+    """Chemin d'un blob relatif à UPLOAD_DIR, tel que stocké dans `files.path`."""
+    return os.path.relpath(blob_store.path(sha256), UPLOAD_DIR)
+
+
+def resolve_file_path(db_file) -> str:
+    """Retourne le chemin sur disque d'un fichier de challenge."""
+    if db_file.storage == "blob":
+        return blob_store.path(db_file.sha256)
+    return os.path.join(UPLOAD_DIR, db_file.path)
+
+
+def content_id(db_file, path: str) -> str:
+    """Identifie le contenu d'un fichier pour les caches : le sha256, ou le chemin et la date pour l'ancien stockage."""
+    if db_file.sha256:
+        return db_file.sha256
+    stat = os.stat(path)
+    return f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
@@ -0,0 +1,336 @@
+import hashlib
+import json
+import os
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import aiofiles
+from fastapi import HTTPException, Request
+
+try:
+    from python_multipart.exceptions import FormParserError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.exceptions import FormParserError
+    from multipart.multipart import MultipartParser, parse_options_header
+
+try:
+    import magic
+except ImportError:  # libmagic absent : on se rabat sur les signatures connues
+    magic = None
+
+CHUNK_SIZE = 1024 * 1024  # 1MB
+MAGIC_HEAD_SIZE = 2048
+
+# Signatures utilisées quand python-magic n'est pas disponible
+MAGIC_SIGNATURES = [
+    (b"\x7fELF", "application/x-executable"),
+    (b"MZ", "application/x-dosexec"),
+    (b"PK\x03\x04", "application/zip"),
+    (b"\x1f\x8b", "application/gzip"),
+    (b"7z\xbc\xaf\x27\x1c", "application/x-7z-compressed"),
+    (b"Rar!\x1a\x07", "application/x-rar"),
+    (b"%PDF", "application/pdf"),
+    (b"\xd4\xc3\xb2\xa1", "application/vnd.tcpdump.pcap"),
+    (b"\xa1\xb2\xc3\xd4", "application/vnd.tcpdump.pcap"),
+    (b"\x0a\x0d\x0d\x0a", "application/x-pcapng"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"#!", "text/x-shellscript"),
+]
+
+
+def detect_type(head: bytes) -> str:
+    """Détermine le type MIME à partir des premiers octets du fichier."""
+    if magic is not None:
+        try:
+            return magic.from_buffer(head, mime=True)
+        except Exception:
+            pass
+    for signature, mime in MAGIC_SIGNATURES:
+        if head.startswith(signature):
+            return mime
+    # ustar se trouve à l'offset 257 dans l'en-tête tar
+    if head[257:262] == b"ustar":
+        return "application/x-tar"
+    return "application/octet-stream"
+
+
+class StreamResult:
+    """Résultat d'une écriture en streaming : taille, SHA-256 et type détecté."""
+
+    def __init__(self, size: int, sha256: str, detected_type: Optional[str]):
+        self.size = size
+        self.sha256 = sha256
+        self.detected_type = detected_type
+
+
+async def write_stream(
+    chunks: AsyncIterator[bytes],
+    path: str,
+    max_size: int,
+    offset: int = 0,
+    hasher=None,
+) -> Tuple[int, "hashlib._Hash", Optional[bytes]]:
+    """Écrit un flux de morceaux dans `path` à partir de `offset`.
+
+    La taille et le hash sont calculés dans la même passe que l'écriture.
+    Le transfert est interrompu dès que `max_size` est dépassé.
+    Retourne (taille totale, hasher, premiers octets si offset == 0).
+    """
+    hasher = hasher or hashlib.sha256()
+    size = offset
+    head = bytearray() if offset == 0 else None
+    mode = "r+b" if offset else "wb"
+    async with aiofiles.open(path, mode) as out:
+        if offset:
+            await out.seek(offset)
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            size += len(chunk)
+            if size > max_size:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Le fichier est trop volumineux (max {max_size} octets)"
+                )
+            hasher.update(chunk)
+            if head is not None and len(head) < MAGIC_HEAD_SIZE:
+                head.extend(chunk[:MAGIC_HEAD_SIZE - len(head)])
+            await out.write(chunk)
+        await out.truncate(size)
+    return size, hasher, bytes(head) if head is not None else None
+
+
+class MultipartFileStream:
+    """Champ fichier d'un corps multipart/form-data, lu au fil de la requête.
+
+    Contrairement à UploadFile, que Starlette reçoit en entier avant d'appeler
+    la route, chaque morceau est transmis dès sa réception : un fichier trop
+    gros est refusé (413) sans lire le reste du corps. Seul le premier champ
+    `field` qui porte un nom de fichier est lu ; les autres champs sont ignorés.
+    """
+
+    def __init__(self, request: Request, field: str = "file"):
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise HTTPException(status_code=400, detail="Corps multipart/form-data attendu")
+        self.field = field.encode()
+        self.filename: Optional[str] = None
+        self._body = request.stream().__aiter__()
+        self._pending: "deque[bytes]" = deque()
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._in_file = False
+        self._complete = False
+        self._parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    # Rappels du parseur, appelés pendant write()
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if self.filename is None and options.get(b"name") == self.field and b"filename" in options:
+            self.filename = os.path.basename(options[b"filename"].decode("utf-8", "replace"))
+            self._in_file = True
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self._pending.append(bytes(data[start:end]))
+
+    def _on_part_end(self):
+        if self._in_file:
+            self._in_file = False
+            self._complete = True
+
+    async def _feed(self) -> bool:
+        try:
+            chunk = await self._body.__anext__()
+        except StopAsyncIteration:
+            return False
+        try:
+            self._parser.write(chunk)
+        except FormParserError:
+            raise HTTPException(status_code=400, detail="Corps multipart invalide")
+        return True
+
+    async def open(self) -> str:
+        """Lit la requête jusqu'aux en-têtes du fichier et retourne son nom."""
+        while self.filename is None:
+            if not await self._feed():
+                raise HTTPException(status_code=400, detail=f"Champ fichier '{self.field.decode()}' manquant")
+        return self.filename
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """Contenu du fichier, morceau par morceau ; open() doit avoir été appelé."""
+        while True:
+            while self._pending:
+                yield self._pending.popleft()
+            if self._complete:
+                return
+            if not await self._feed():
+                raise HTTPException(status_code=400, detail="Corps multipart incomplet")
+
+
+async def save_stream(chunks: AsyncIterator[bytes], path: str, max_size: int) -> StreamResult:
+    """Sauvegarde un flux par morceaux et calcule taille, hash et type."""
+    try:
+        size, hasher, head = await write_stream(chunks, path, max_size)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return StreamResult(size, hasher.hexdigest(), detect_type(head))
+
+
+class ResumableUploads:
+    """Gestion des uploads reprenables par offset.
+
+    Chaque session est un fichier `.part` accompagné d'un fichier `.json`
+    de métadonnées. La taille du `.part` sur disque fait foi pour l'offset
+    courant. L'état du hash est conservé en mémoire et reconstruit depuis
+    le disque si nécessaire (redémarrage du serveur par exemple).
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._hashers: Dict[str, Tuple[int, "hashlib._Hash"]] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _part_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f"{upload_id}.part")
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f"{upload_id}.json")
+
+    def _write_meta(self, upload_id: str, meta: dict):
+        with open(self._meta_path(upload_id), "w") as f:
+            json.dump(meta, f)
+
+    def create(self, challenge_id: int, filename: str, size: Optional[int]) -> dict:
+        upload_id = uuid.uuid4().hex
+        meta = {
+            "upload_id": upload_id,
+            "challenge_id": challenge_id,
+            "filename": filename,
+            "size": size,
+            "detected_type": None,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        open(self._part_path(upload_id), "wb").close()
+        self._write_meta(upload_id, meta)
+        self._hashers[upload_id] = (0, hashlib.sha256())
+        return self.status(upload_id, meta)
+
+    def get(self, challenge_id: int, upload_id: str) -> dict:
+        # upload_id vient de l'URL : on refuse tout ce qui n'est pas un uuid hex
+        if not upload_id.isalnum():
+            raise HTTPException(status_code=404, detail="Upload non trouvé")
+        try:
+            with open(self._meta_path(upload_id)) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Upload non trouvé")
+        if meta["challenge_id"] != challenge_id:
+            raise HTTPException(status_code=404, detail="Upload non trouvé")
+        return meta
+
+    def offset(self, upload_id: str) -> int:
+        return os.path.getsize(self._part_path(upload_id))
+
+    def status(self, upload_id: str, meta: dict) -> dict:
+        return {**meta, "offset": self.offset(upload_id)}
+
+    async def _hasher_at(self, upload_id: str, offset: int):
+        cached = self._hashers.get(upload_id)
+        if cached and cached[0] == offset:
+            return cached[1]
+        # Reconstruire l'état du hash à partir des octets déjà reçus
+        hasher = hashlib.sha256()
+        async with aiofiles.open(self._part_path(upload_id), "rb") as f:
+            remaining = offset
+            while remaining:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                remaining -= len(chunk)
+        return hasher
+
+    async def append(
+        self,
+        challenge_id: int,
+        upload_id: str,
+        offset: int,
+        chunks: AsyncIterator[bytes],
+        max_size: int,
+    ) -> dict:
+        meta = self.get(challenge_id, upload_id)
+        current = self.offset(upload_id)
+        if offset != current:
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Offset invalide", "offset": current}
+            )
+        limit = min(meta["size"], max_size) if meta["size"] is not None else max_size
+        hasher = await self._hasher_at(upload_id, offset)
+        try:
+            size, hasher, head = await write_stream(
+                chunks, self._part_path(upload_id), limit, offset=offset, hasher=hasher
+            )
+        except BaseException:
+            # L'état du hash ne correspond plus au fichier partiel
+            self._hashers.pop(upload_id, None)
+            raise
+        self._hashers[upload_id] = (size, hasher)
+        if head:
+            meta["detected_type"] = detect_type(head)
+            self._write_meta(upload_id, meta)
+        return self.status(upload_id, meta)
+
+    async def finish(self, challenge_id: int, upload_id: str, destination: str) -> StreamResult:
+        """Déplace le fichier complet vers `destination` et clôt la session."""
+        meta = self.get(challenge_id, upload_id)
+        size = self.offset(upload_id)
+        if meta["size"] is not None and size != meta["size"]:
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Upload incomplet", "offset": size, "size": meta["size"]}
+            )
+        hasher = await self._hasher_at(upload_id, size)
+        detected_type = meta["detected_type"]
+        if detected_type is None:
+            async with aiofiles.open(self._part_path(upload_id), "rb") as f:
+                detected_type = detect_type(await f.read(MAGIC_HEAD_SIZE))
+        os.replace(self._part_path(upload_id), destination)
+        self.discard(upload_id)
+        return StreamResult(size, hasher.hexdigest(), detected_type)
+
+    def discard(self, upload_id: str):
+        self._hashers.pop(upload_id, None)
+        for path in (self._part_path(upload_id), self._meta_path(upload_id)):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,331 @@
+"""Benchmark de charge de l'API PwnBox.
+
+Génère (une seule fois) un jeu de données à l'échelle demandée, puis envoie
+des requêtes concurrentes à chaque endpoint et mesure latences (p50, p95,
+p99), débit et nombre de requêtes SQL. Les résultats sont écrits en JSON
+pour comparer deux versions.
+
+    python -m benchmarks.run                                 # application en processus (ASGI)
+    python -m benchmarks.run --notes 100000 --files 10 --file-size 200000000
+    python -m benchmarks.run --url http://localhost:8000     # serveur lancé à part
+    python -m benchmarks.run --compare benchmarks/results/avant.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger("benchmarks")
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(BENCH_DIR, "data")
+DEFAULT_RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+DEFAULT_SCALE = {
+    "folders": 2000,
+    "folder_depth": 12,
+    "notes": 100000,
+    "note_size": 2000,
+    "challenges": 10000,
+    "description_size": 1000,
+    "files": 20,
+    "file_size": 1024 * 1024,
+}
+UPLOAD_SIZE = 64 * 1024
+# Nombre maximal de cibles (challenges, fichiers) découvertes avant la mesure
+MAX_TARGETS = 1000
+
+
+class Endpoint(NamedTuple):
+    name: str
+    # (générateur aléatoire, cibles) -> (méthode, chemin, arguments httpx)
+    build: Callable[[random.Random, dict], Tuple[str, str, dict]]
+    requires: str = ""
+
+
+def _challenge(rng: random.Random, targets: dict) -> int:
+    return rng.choice(targets["challenges"])
+
+
+def _file(rng: random.Random, targets: dict) -> Tuple[int, str]:
+    return rng.choice(targets["files"])
+
+
+def _check_flag(rng: random.Random, targets: dict):
+    challenge_id = _challenge(rng, targets)
+    flag = f"flag{{bench_{challenge_id}}}" if rng.random() < 0.5 else "flag{faux}"
+    return "POST", f"/challenges/{challenge_id}/check-flag", {"json": {"flag": flag}}
+
+
+def _upload(rng: random.Random, targets: dict):
+    content = rng.randbytes(UPLOAD_SIZE)
+    return "POST", f"/challenges/{_challenge(rng, targets)}/files", {
+        "files": {"file": ("bench_upload.bin", content, "application/octet-stream")}
+    }
+
+
+def _download(rng: random.Random, targets: dict):
+    challenge_id, filename = _file(rng, targets)
+    return "GET", f"/challenges/{challenge_id}/files/{filename}", {}
+
+
+ENDPOINTS = [
+    Endpoint("folders", lambda rng, t: ("GET", "/folders/", {})),
+    Endpoint("folders_summary", lambda rng, t: ("GET", "/folders/?view=summary", {})),
+    Endpoint("folder_tree", lambda rng, t: ("GET", "/folders/tree?depth=2&titles_only=true", {})),
+    Endpoint("notes", lambda rng, t: ("GET", "/notes/?limit=100&depth=2", {})),
+    Endpoint("notes_summary", lambda rng, t: ("GET", "/notes/?limit=100&depth=2&view=summary", {})),
+    Endpoint("challenges", lambda rng, t: ("GET", "/challenges/?limit=100", {})),
+    Endpoint("challenges_summary", lambda rng, t: ("GET", "/challenges/?limit=100&view=summary", {})),
+    Endpoint("challenge", lambda rng, t: ("GET", f"/challenges/{_challenge(rng, t)}", {}), "challenges"),
+    Endpoint("check_flag", _check_flag, "challenges"),
+    Endpoint("file_download", _download, "files"),
+    Endpoint("file_upload", _upload, "challenges"),
+    Endpoint("search", lambda rng, t: ("GET", f"/search/?q={rng.choice(('heap', 'rsa', 'xss'))}", {})),
+]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Percentile au rang le plus proche sur des valeurs triées."""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+async def discover_targets(client: httpx.AsyncClient) -> dict:
+    """Identifiants de challenges et fichiers existants, lus via l'API."""
+    response = await client.get(f"/challenges/?fields=files&limit={MAX_TARGETS}")
+    response.raise_for_status()
+    challenges = response.json()
+    return {
+        "challenges": [c["id"] for c in challenges],
+        "files": [(c["id"], f["filename"]) for c in challenges for f in c["files"]][:MAX_TARGETS],
+    }
+
+
+async def measure(client: httpx.AsyncClient, endpoint: Endpoint, targets: dict, requests: int,
+                  concurrency: int, headers: dict, seed: int) -> dict:
+    rng = random.Random(seed)
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    sizes = 0
+    pending = iter(range(requests))
+
+    async def worker():
+        nonlocal sizes
+        for _ in pending:
+            method, path, kwargs = endpoint.build(rng, targets)
+            start = time.perf_counter()
+            response = await client.request(method, path, headers=headers, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+            sizes += len(response.content)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": sum(count for status, count in statuses.items() if int(status) >= 400),
+        "statuses": statuses,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+            "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        "mean_response_bytes": sizes // len(latencies) if latencies else 0,
+    }
+
+
+class QueryCounter:
+    """Compte les requêtes SQL exécutées par le moteur des routes (mode en processus)."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+async def run_endpoints(client: httpx.AsyncClient, endpoints: List[Endpoint], args,
+                        counter: Optional[QueryCounter]) -> dict:
+    targets = await discover_targets(client)
+    # Par défaut le cache de réponses est contourné : on mesure le chemin base de données
+    headers = {} if args.cached else {"Cache-Control": "no-cache"}
+    results = {}
+    for number, endpoint in enumerate(endpoints):
+        if endpoint.requires and not targets[endpoint.requires]:
+            logger.warning("%s ignoré : aucune cible (%s)", endpoint.name, endpoint.requires)
+            continue
+        # Requête d'échauffement, qui sert aussi à compter les requêtes SQL
+        method, path, kwargs = endpoint.build(random.Random(args.seed), targets)
+        before = counter.count if counter else 0
+        await client.request(method, path, headers=headers, **kwargs)
+        queries = counter.count - before if counter else None
+
+        logger.info("%s : %d requêtes, concurrence %d", endpoint.name, args.requests, args.concurrency)
+        result = await measure(client, endpoint, targets, args.requests, args.concurrency,
+                               headers, args.seed + number)
+        result["queries_per_request"] = queries
+        results[endpoint.name] = result
+    return results
+
+
+def prepare_environment(args):
+    """Configure la base et le dossier d'uploads avant l'import du backend."""
+    if args.reset and os.path.isdir(args.data_dir):
+        shutil.rmtree(args.data_dir)
+    os.makedirs(args.data_dir, exist_ok=True)
+    os.environ.setdefault("PWNBOX_DATABASE_URL", f"sqlite:///{os.path.join(args.data_dir, 'pwnbox-bench.db')}")
+    os.environ.setdefault("PWNBOX_UPLOAD_DIR", os.path.join(args.data_dir, "uploads"))
+    os.environ.setdefault("PWNBOX_LOG_LEVEL", "WARNING")
+
+
+async def run(args) -> dict:
+    endpoints = [e for e in ENDPOINTS if not args.endpoints or e.name in args.endpoints]
+    scale = {name: getattr(args, name) for name in DEFAULT_SCALE}
+
+    if not args.url or not args.no_seed:
+        prepare_environment(args)
+        from backend.database import engine
+        from backend.main import app
+        from benchmarks.seed import seed
+        if not args.no_seed:
+            start = time.perf_counter()
+            await asyncio.to_thread(seed, engine, scale, args.seed)
+            logger.info("Données prêtes en %.1fs", time.perf_counter() - start)
+
+    timeout = httpx.Timeout(args.timeout)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=timeout) as client:
+            results = await run_endpoints(client, endpoints, args, None)
+    else:
+        from backend.database import async_engine
+        counter = QueryCounter(async_engine.sync_engine)
+        transport = httpx.ASGITransport(app=app)
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=timeout) as client:
+                results = await run_endpoints(client, endpoints, args, counter)
+
+    return {
+        "created_at": datetime.utcnow().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "mode": "http" if args.url else "asgi",
+        "url": args.url,
+        "scale": scale,
+        "concurrency": args.concurrency,
+        "requests_per_endpoint": args.requests,
+        "cached": args.cached,
+        "endpoints": results,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report: dict):
+    print(f"{'endpoint':<20} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'SQL':>5} {'octets':>10} {'err':>5}")
+    for name, result in report["endpoints"].items():
+        latency = result["latency_ms"]
+        queries = result["queries_per_request"]
+        print(f"{name:<20} {result['throughput_rps']:>9} {latency['p50']:>9} {latency['p95']:>9} "
+              f"{latency['p99']:>9} {'-' if queries is None else queries:>5} "
+              f"{result['mean_response_bytes']:>10} {result['errors']:>5}")
+
+
+def compare(report: dict, baseline_path: str, threshold: float) -> bool:
+    """Compare à un rapport précédent ; retourne True si une régression dépasse le seuil."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nComparaison avec {baseline_path} ({baseline.get('commit')}) :")
+    regressed = False
+    for name, result in report["endpoints"].items():
+        before = baseline["endpoints"].get(name)
+        if before is None:
+            continue
+        changes = []
+        for metric in ("p50", "p95", "p99"):
+            old, new = before["latency_ms"][metric], result["latency_ms"][metric]
+            delta = (new - old) / old * 100 if old else 0.0
+            changes.append(f"{metric} {old:.1f} -> {new:.1f} ms ({delta:+.0f}%)")
+            if delta > threshold:
+                regressed = True
+        print(f"  {name:<20} " + ", ".join(changes))
+    if regressed:
+        print(f"Régression de latence supérieure à {threshold:.0f}%")
+    return regressed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de charge de l'API PwnBox")
+    parser.add_argument("--url", help="URL d'un serveur déjà lancé (sinon application en processus)")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR,
+                        help="Base et uploads générés (réutilisés d'une exécution à l'autre)")
+    parser.add_argument("--reset", action="store_true", help="Supprime les données générées avant de commencer")
+    parser.add_argument("--no-seed", action="store_true", help="Ne génère pas de données")
+    parser.add_argument("--seed", type=int, default=0, help="Graine du générateur")
+    for name, default in DEFAULT_SCALE.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=default)
+    parser.add_argument("--endpoints", nargs="*", choices=[e.name for e in ENDPOINTS],
+                        help="Endpoints mesurés (tous par défaut)")
+    parser.add_argument("--requests", type=int, default=100, help="Requêtes par endpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="Clients simultanés")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Délai maximal d'une requête (s)")
+    parser.add_argument("--cached", action="store_true", help="Autorise le cache de réponses des listes")
+    parser.add_argument("--output", help="Fichier JSON des résultats (défaut benchmarks/results/<date>.json)")
+    parser.add_argument("--compare", help="Rapport JSON de référence")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Régression tolérée en %% (avec --compare)")
+    args = parser.parse_args(argv)
+    if args.file_size < 1:
+        parser.error("--file-size doit être positif")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    output = args.output or os.path.join(
+        DEFAULT_RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{report['commit'] or 'local'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nRésultats écrits dans {output}")
+
+    if args.compare and compare(report, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""Génération d'un jeu de données volumineux pour les benchmarks.
+
+Les lignes sont insérées par lots directement dans les tables (sans passer
+par l'API) ; les fichiers sont écrits dans le blob store configuré par
+PWNBOX_UPLOAD_DIR. Le générateur est déterministe pour une graine donnée.
+"""
+import hashlib
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import Engine, func, insert, select
+
+from backend import models
+from backend.storage import blob_relpath, blob_store
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+# Bloc aléatoire répété pour écrire de gros fichiers sans générer des Go d'aléa
+BLOCK_SIZE = 1024 * 1024
+WORDS = ("buffer", "overflow", "heap", "format", "string", "rop", "shellcode", "xss", "sqli",
+         "jwt", "padding", "oracle", "rsa", "aes", "pcap", "stego", "kernel", "race", "ssrf")
+CATEGORIES = ("web", "pwn", "crypto", "forensic", "reverse", "misc")
+DIFFICULTIES = ("easy", "medium", "hard", "insane")
+
+
+def _text(rng: random.Random, size: int) -> str:
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+
+def _insert(engine: Engine, table, rows: List[dict]):
+    with engine.begin() as conn:
+        for start in range(0, len(rows), BATCH_SIZE):
+            conn.execute(insert(table), rows[start:start + BATCH_SIZE])
+
+
+def seed_folders(engine: Engine, rng: random.Random, count: int, depth: int, now: datetime) -> Dict[int, int]:
+    """Crée des arborescences de dossiers ; retourne la profondeur de chaque dossier."""
+    depths: Dict[int, int] = {}
+    rows = []
+    for folder_id in range(1, count + 1):
+        # Un dossier sur dix est une racine ; les autres s'accrochent à un dossier
+        # récent, ce qui produit des branches profondes
+        parent_id = None
+        if folder_id > 1 and rng.random() > 0.1:
+            candidate = rng.randint(max(1, folder_id - 10), folder_id - 1)
+            if depths[candidate] < depth:
+                parent_id = candidate
+        depths[folder_id] = depths[parent_id] + 1 if parent_id else 0
+        rows.append({
+            "id": folder_id, "name": f"dossier {folder_id}", "parent_id": parent_id,
+            "created_at": now, "updated_at": now,
+        })
+    _insert(engine, models.Folder.__table__, rows)
+    return depths
+
+
+def seed_notes(engine: Engine, rng: random.Random, count: int, folders: int, note_size: int, now: datetime):
+    rows = []
+    note_folders: Dict[int, int] = {}
+    for note_id in range(1, count + 1):
+        folder_id = rng.randint(1, folders) if folders and rng.random() > 0.05 else None
+        parent_id = None
+        # Une note sur cinq est une sous-note d'une note précédente du même dossier
+        if note_id > 1 and rng.random() < 0.2:
+            parent_id = rng.randint(max(1, note_id - 1000), note_id - 1)
+            folder_id = note_folders[parent_id]
+        note_folders[note_id] = folder_id
+        created_at = now - timedelta(seconds=count - note_id)
+        rows.append({
+            "id": note_id, "title": f"note {note_id} {rng.choice(WORDS)}",
+            "content": _text(rng, note_size), "tags": rng.sample(WORDS, 2),
+            "is_favorite": rng.random() < 0.05, "folder_id": folder_id, "parent_id": parent_id,
+            "created_at": created_at, "updated_at": created_at,
+        })
+        if len(rows) >= BATCH_SIZE:
+            _insert(engine, models.Note.__table__, rows)
+            rows = []
+    _insert(engine, models.Note.__table__, rows)
+
+
+def seed_challenges(engine: Engine, rng: random.Random, count: int, description_size: int, now: datetime):
+    rows = []
+    for challenge_id in range(1, count + 1):
+        created_at = now - timedelta(seconds=count - challenge_id)
+        rows.append({
+            "id": challenge_id, "title": f"challenge {challenge_id}",
+            "description": _text(rng, description_size),
+            "category": rng.choice(CATEGORIES), "difficulty": rng.choice(DIFFICULTIES),
+            "correct_flag": f"flag{{bench_{challenge_id}}}",
+            "resources": {"links": [f"https://example.com/{challenge_id}"], "commands": []},
+            "solved": rng.random() < 0.3, "created_at": created_at, "updated_at": created_at,
+        })
+        if len(rows) >= BATCH_SIZE:
+            _insert(engine, models.Challenge.__table__, rows)
+            rows = []
+    _insert(engine, models.Challenge.__table__, rows)
+
+
+def _write_blob(rng: random.Random, size: int) -> str:
+    """Écrit un fichier de `size` octets dans le blob store et retourne son sha256."""
+    block = rng.randbytes(min(size, BLOCK_SIZE))
+    tmp_path = blob_store.temp_path()
+    hasher = hashlib.sha256()
+    with open(tmp_path, "wb") as out:
+        remaining = size
+        while remaining > 0:
+            chunk = block[:remaining]
+            hasher.update(chunk)
+            out.write(chunk)
+            remaining -= len(chunk)
+    sha256 = hasher.hexdigest()
+    blob_store.place(tmp_path, sha256)
+    return sha256
+
+
+def seed_files(engine: Engine, rng: random.Random, count: int, size: int, challenges: int, now: datetime):
+    """Crée `count` fichiers de `size` octets, chacun attaché à un challenge."""
+    blobs, files = [], []
+    for number in range(1, count + 1):
+        sha256 = _write_blob(rng, size)
+        blobs.append({"sha256": sha256, "size": size, "detected_type": "application/octet-stream",
+                      "refcount": 1, "created_at": now})
+        files.append({
+            "challenge_id": rng.randint(1, challenges), "filename": f"{sha256[:12]}_bench_{number}.bin",
+            "name": f"bench_{number}.bin", "path": blob_relpath(sha256), "storage": "blob",
+            "file_type": "application/octet-stream", "content_type": "application/octet-stream",
+            "size": size, "sha256": sha256, "created_at": now,
+        })
+    _insert(engine, models.Blob.__table__, blobs)
+    _insert(engine, models.File.__table__, files)
+
+
+def seed(engine: Engine, scale: dict, seed: int = 0):
+    """Remplit une base vide selon `scale` (voir DEFAULT_SCALE dans run.py)."""
+    with engine.connect() as conn:
+        if conn.scalar(select(func.count()).select_from(models.Note.__table__)) or \
+                conn.scalar(select(func.count()).select_from(models.Challenge.__table__)):
+            logger.info("Base déjà remplie, génération ignorée")
+            return
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    logger.info("Génération: %s", scale)
+    seed_folders(engine, rng, scale["folders"], scale["folder_depth"], now)
+    seed_notes(engine, rng, scale["notes"], scale["folders"], scale["note_size"], now)
+    seed_challenges(engine, rng, scale["challenges"], scale["description_size"], now)
+    if scale["files"] and scale["challenges"]:
+        seed_files(engine, rng, scale["files"], scale["file_size"], scale["challenges"], now)
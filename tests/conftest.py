@@ -0,0 +1,44 @@
+"""Configuration commune des tests : base SQLite et dossier d'uploads temporaires.
+
+La configuration est lue à l'import de `backend` : les variables
+d'environnement doivent être définies avant le premier import de l'application.
+"""
+import os
+import shutil
+import tempfile
+
+import pytest
+
+TEST_DIR = tempfile.mkdtemp(prefix="pwnbox-tests-")
+os.environ["PWNBOX_DATABASE_URL"] = "sqlite:///" + os.path.join(TEST_DIR, "pwnbox.db")
+os.environ["PWNBOX_UPLOAD_DIR"] = os.path.join(TEST_DIR, "uploads")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from backend.main import app  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def make_challenge(client):
+    def make(title: str = "challenge", **fields) -> dict:
+        payload = {"title": title, "description": "description", "category": "web", **fields}
+        response = client.post("/challenges/", json=payload)
+        assert response.status_code == 200, response.text
+        return response.json()
+    return make
+
+
+@pytest.fixture
+def make_note(client):
+    def make(title: str = "note", content: str = "", **fields) -> dict:
+        response = client.post("/notes/", json={"title": title, "content": content, **fields})
+        assert response.status_code == 200, response.text
+        return response.json()
+    return make
@@ -0,0 +1,34 @@
+"""Cache des réponses de liste : réutilisation et invalidation après écriture."""
+
+
+def test_list_cache_is_invalidated_by_writes(client, make_note):
+    note = make_note("cache")
+    first = client.get("/notes/")
+    assert first.headers["X-Cache"] == "MISS"
+    cached = client.get("/notes/")
+    assert cached.headers["X-Cache"] == "HIT"
+    assert cached.json() == first.json()
+
+    # Réponse identique : 304 sur If-None-Match
+    response = client.get("/notes/", headers={"If-None-Match": cached.headers["ETag"]})
+    assert response.status_code == 304
+
+    client.patch(f"/notes/{note['id']}", json={"title": "cache modifié"})
+    response = client.get("/notes/")
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.headers["ETag"] != cached.headers["ETag"]
+    titles = {item["id"]: item["title"] for item in response.json()}
+    assert titles[note["id"]] == "cache modifié"
+
+
+def test_list_cache_is_invalidated_by_related_tables(client, make_note):
+    folder_id = client.post("/folders/", json={"name": "cache"}).json()["id"]
+    client.get("/folders/")
+    assert client.get("/folders/").headers["X-Cache"] == "HIT"
+
+    # /folders/ inclut les notes : une note créée invalide aussi cette liste
+    make_note("dans le dossier", folder_id=folder_id)
+    response = client.get("/folders/")
+    assert response.headers["X-Cache"] == "MISS"
+    folder = next(item for item in response.json() if item["id"] == folder_id)
+    assert "dans le dossier" in [note["title"] for note in folder["notes"]]
@@ -0,0 +1,98 @@
+"""Upload des fichiers de challenges, références des blobs et GC."""
+import hashlib
+import os
+
+from backend import blobstore
+from backend.routes.challenges import MAX_FILE_SIZE
+from backend.storage import blob_store
+
+
+def upload(client, challenge_id: int, name: str, content: bytes):
+    return client.post(f"/challenges/{challenge_id}/files", files={"file": (name, content)})
+
+
+def test_upload_streams_file_into_blob_store(client, make_challenge):
+    challenge = make_challenge()
+    content = b"streamed\n" * 5000
+    response = upload(client, challenge["id"], "data.txt", content)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    sha256 = hashlib.sha256(content).hexdigest()
+    assert body["sha256"] == sha256
+    assert body["size"] == len(content)
+    assert body["filename"] == f"{sha256[:12]}_data.txt"
+    with open(blob_store.path(sha256), "rb") as stored:
+        assert stored.read() == content
+
+
+def test_upload_rejects_missing_field_and_oversized_body(client, make_challenge):
+    challenge = make_challenge()
+    response = client.post(f"/challenges/{challenge['id']}/files", files={"other": ("a.txt", b"a")})
+    assert response.status_code == 400
+
+    # Content-Length annoncé : refus avant la lecture du corps
+    response = upload(client, challenge["id"], "big.bin", b"0" * (MAX_FILE_SIZE + 1024 * 1024))
+    assert response.status_code == 413
+
+    # Corps sans Content-Length : refus dès que la limite est dépassée
+    def chunked():
+        yield b'--B\r\nContent-Disposition: form-data; name="file"; filename="big.bin"\r\n\r\n'
+        for _ in range(MAX_FILE_SIZE // (1024 * 1024) + 1):
+            yield b"0" * (1024 * 1024)
+        yield b"\r\n--B--\r\n"
+    response = client.post(
+        f"/challenges/{challenge['id']}/files", content=chunked(),
+        headers={"Content-Type": "multipart/form-data; boundary=B"}
+    )
+    assert response.status_code == 413
+    assert client.get(f"/challenges/{challenge['id']}").json()["files"] == []
+
+
+def test_blob_is_shared_and_collected_after_last_reference(client, make_challenge, monkeypatch):
+    monkeypatch.setattr(blobstore, "ORPHAN_GRACE_SECONDS", 0)
+    first, second = make_challenge("first"), make_challenge("second")
+    content = os.urandom(4096)
+    sha256 = hashlib.sha256(content).hexdigest()
+    filename = upload(client, first["id"], "shared.bin", content).json()["filename"]
+    assert upload(client, second["id"], "shared.bin", content).json()["filename"] == filename
+
+    # Une référence restante : le contenu survit au GC
+    assert client.delete(f"/challenges/{first['id']}/files/{filename}").status_code == 200
+    client.post("/challenges/blobs/gc")
+    assert os.path.exists(blob_store.path(sha256))
+    response = client.post(
+        f"/challenges/{first['id']}/files/by-hash", json={"sha256": sha256, "filename": "again.bin"}
+    )
+    assert response.status_code == 200, response.text
+
+    # Plus aucune référence : le GC supprime le contenu et son entrée
+    assert client.delete(f"/challenges/{first['id']}/files/{response.json()['filename']}").status_code == 200
+    assert client.delete(f"/challenges/{second['id']}/files/{filename}").status_code == 200
+    result = client.post("/challenges/blobs/gc").json()
+    assert result["removed"] >= 1
+    assert not os.path.exists(blob_store.path(sha256))
+    response = client.post(
+        f"/challenges/{first['id']}/files/by-hash", json={"sha256": sha256, "filename": "gone.bin"}
+    )
+    assert response.status_code == 404
+
+
+def test_cursor_pagination_walks_every_challenge_once(client, make_challenge):
+    created = {make_challenge(f"page {i}")["id"] for i in range(7)}
+    expected = [c["id"] for c in client.get("/challenges/", params={"limit": 1000}).json()]
+
+    seen = []
+    params = {"limit": 3, "with_total": "true"}
+    while True:
+        response = client.get("/challenges/", params=params)
+        assert response.status_code == 200
+        assert int(response.headers["X-Total-Count"]) == len(expected)
+        seen.extend(c["id"] for c in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+        params["cursor"] = cursor
+    assert seen == expected
+    assert created <= set(seen)
+
+    assert client.get("/challenges/", params={"cursor": "invalide"}).status_code == 400
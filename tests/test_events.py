@@ -0,0 +1,40 @@
+"""Flux de changements : reprise avec `since` et `reset` quand le tampon a débordé."""
+from backend.events import EventBus, event_bus
+
+
+def test_since_returns_missed_events_or_reset():
+    bus = EventBus(size=3)
+    start = bus.version
+    bus.publish([("notes", 1, "insert"), ("blobs", 1, "insert"), ("notes", 2, "insert")])
+
+    complete, events = bus.since(start)
+    assert complete
+    # Les tables non publiées sont ignorées, les versions restent contiguës
+    assert [(e["table"], e["id"]) for e in events] == [("notes", 1), ("notes", 2)]
+    assert [e["version"] for e in events] == [start + 1, start + 2]
+    assert bus.since(bus.version) == (True, [])
+
+    bus.publish([("folders", 3, "update"), ("tools", 4, "delete")])
+    # start + 1 est sorti du tampon : le client doit tout recharger
+    assert bus.since(start) == (False, [])
+    complete, events = bus.since(start + 1)
+    assert complete
+    assert [e["version"] for e in events] == [start + 2, start + 3, start + 4]
+    # Version inconnue (postérieure, ou d'un processus redémarré)
+    assert bus.since(bus.version + 1) == (False, [])
+
+
+def test_changes_endpoint_reports_committed_writes(client, make_note):
+    version = event_bus.version
+    note = make_note("événement")
+    feed = client.get("/events/changes", params={"since": version}).json()
+    assert not feed["reset"]
+    assert ("notes", note["id"], "insert") in [(e["table"], e["id"], e["op"]) for e in feed["events"]]
+
+    feed = client.get("/events/changes", params={"since": feed["version"], "tables": "notes"}).json()
+    assert not feed["reset"]
+    assert feed["events"] == []
+
+    feed = client.get("/events/changes", params={"since": 0}).json()
+    assert feed["reset"]
+    assert feed["version"] == event_bus.version
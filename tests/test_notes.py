@@ -0,0 +1,67 @@
+"""Écritures conditionnelles, historique et compression des notes."""
+from backend import revisions
+
+
+def test_patch_with_if_match_rejects_stale_and_foreign_versions(client, make_note):
+    note, other = make_note("a"), make_note("b")
+    etag = f'"note-{note["id"]}-v{note["version"]}"'
+
+    response = client.patch(f"/notes/{note['id']}", json={"content": "v2"}, headers={"If-Match": etag})
+    assert response.status_code == 200, response.text
+    assert response.headers["ETag"].endswith(f'"note-{note["id"]}-v2"')
+
+    # La même version attendue est périmée après l'écriture
+    response = client.patch(f"/notes/{note['id']}", json={"content": "v3"}, headers={"If-Match": etag})
+    assert response.status_code == 409
+    assert client.get(f"/notes/{note['id']}").json()["content"] == "v2"
+
+    # Un ETag d'une autre note n'est pas une version de celle-ci
+    foreign = f'"note-{other["id"]}-v2"'
+    response = client.patch(f"/notes/{note['id']}", json={"content": "v3"}, headers={"If-Match": foreign})
+    assert response.status_code == 400
+
+    response = client.patch(f"/notes/{note['id']}", json={"content": "v3", "version": 2})
+    assert response.status_code == 200
+    assert response.json()["version"] == 3
+
+
+def test_revisions_are_rebuilt_after_compaction(client, make_note, monkeypatch):
+    monkeypatch.setattr(revisions, "SNAPSHOT_INTERVAL", 3)
+    monkeypatch.setattr(revisions, "MAX_REVISIONS", 4)
+    lines = [f"ligne {i}\n" for i in range(50)]
+    note = make_note("historique", "".join(lines))
+    contents = {1: note["content"]}
+    for version in range(2, 11):
+        lines[version] = f"modifiée en v{version}\n"
+        response = client.put(f"/notes/{note['id']}", json={"title": "historique", "content": "".join(lines)})
+        assert response.json()["version"] == version
+        contents[version] = "".join(lines)
+
+    response = client.post(f"/notes/{note['id']}/revisions/compact")
+    assert response.status_code == 200
+    history = client.get(f"/notes/{note['id']}/revisions").json()
+    kept = [row["version"] for row in history]
+    assert kept == [10, 9, 8, 7]
+    # La plus ancienne révision gardée ne dépend plus de révisions supprimées
+    assert history[-1]["kind"] == "snapshot"
+    assert any(row["kind"] == "delta" for row in history)
+
+    for version in kept:
+        response = client.get(f"/notes/{note['id']}/revisions/{version}")
+        assert response.json()["content"] == contents[version]
+    assert client.get(f"/notes/{note['id']}/revisions/3").status_code == 404
+
+
+def test_compressed_responses_of_two_notes_stay_distinct(client, make_note):
+    # Même version, même taille : seul le contenu distingue les deux réponses
+    first = make_note("first", "a" * 4000)
+    second = make_note("second", "b" * 4000)
+    bodies = {}
+    for note, content in ((first, "c" * 4000), (second, "d" * 4000)):
+        response = client.patch(
+            f"/notes/{note['id']}", json={"content": content}, headers={"Accept-Encoding": "gzip"}
+        )
+        assert response.headers.get("Content-Encoding") == "gzip"
+        bodies[note["id"]] = response.json()
+    assert bodies[first["id"]]["content"] == "c" * 4000
+    assert bodies[second["id"]]["content"] == "d" * 4000